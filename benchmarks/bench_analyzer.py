@@ -0,0 +1,112 @@
+"""
+静的解析 (analyzer.analyze) のベンチマーク
+
+合成したルールセットで analyze の時間を計測し、JSON で出力します。
+- from:    各ルールが From ヘッダーに互いに異なる 4 つのアドレスを持つ (重なりなし)
+- overlap: アドレス・ドメイン・件名の単語が混ざり、一部のキーが他のキーの部分文字列になる
+
+    python benchmarks/bench_analyzer.py [--rules 20000] [--conditions 4] [--limit 1.0]
+
+--limit を指定すると、いずれかのセットが limit 秒を超えた場合に終了コード 1 で終了します。
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import besieve
+from besieve import analyzer
+
+DOMAINS = ['example.com', 'example.co.jp', 'mail.example.net', 'lists.example.org']
+SUBJECT_WORDS = ['invoice', 'meeting', 'report', 'notice', 'order', '請求書', '会議', '見積']
+
+def _cond(header, value, flags=('I',)):
+    return {'header': header, 'value': value, 'flags': list(flags)}
+
+def make_from_rules(count, conditions):
+    # 重なりのないアドレスのキー
+    return [{'folder': f'INBOX.F{i % 300}', 'actions': [],
+             'conditions': [_cond('From', f'user{i}-{j}@{DOMAINS[j % len(DOMAINS)]}') for j in range(conditions)]}
+            for i in range(count)]
+
+def make_overlap_rules(count, conditions, seed=0):
+    # アドレス、ドメイン (アドレスの部分文字列)、件名の単語が混ざったキー
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        conds = []
+        for j in range(conditions):
+            r = rng.random()
+            domain = DOMAINS[rng.randrange(len(DOMAINS))]
+            if r < 0.5:
+                conds.append(_cond('From', f'user{rng.randrange(count)}@{domain}'))
+            elif r < 0.6:
+                conds.append(_cond('From', f'@{domain}'))
+            elif r < 0.9:
+                word = SUBJECT_WORDS[rng.randrange(len(SUBJECT_WORDS))]
+                conds.append(_cond('Subject', f'{word} {rng.randrange(count)}'))
+            else:
+                conds.append(_cond('Subject', f'[list{rng.randrange(100)}]', ('I', 'T')))
+        rules.append({'folder': f'INBOX.F{i % 300}', 'actions': [], 'conditions': conds})
+    return rules
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the static rule analyzer.')
+    parser.add_argument('--rules', type=int, default=20000, help='Number of rules')
+    parser.add_argument('--conditions', type=int, default=4, help='Conditions per rule')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='Report the best of N runs')
+    parser.add_argument('--limit', type=float, help='Fail if a rule set takes longer than this (seconds)')
+    parser.add_argument('--output', help='Write JSON to this file instead of stdout')
+    args = parser.parse_args()
+
+    sets = {
+        'from': make_from_rules(args.rules, args.conditions),
+        'overlap': make_overlap_rules(args.rules, args.conditions, args.seed),
+    }
+    results = {}
+    for name, rules in sets.items():
+        seconds = measure(lambda: analyzer.analyze(rules), args.repeat)
+        results[name] = {
+            'seconds': round(seconds, 6),
+            'rules_per_sec': round(len(rules) / seconds, 1) if seconds > 0 else None,
+            'findings': len(analyzer.analyze(rules)),
+        }
+
+    report = {
+        'besieve': besieve.__version__,
+        'python': platform.python_version(),
+        'params': {k: getattr(args, k) for k in ('rules', 'conditions', 'seed', 'repeat')},
+        'sets': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.limit is not None:
+        slow = [name for name, r in results.items() if r['seconds'] > args.limit]
+        for name in slow:
+            print(f"[REGRESSION] {name}: {results[name]['seconds']:.3f}s > {args.limit}s", file=sys.stderr)
+        if slow:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+フォルダー名デコードのマイクロベンチマーク
+
+50k ルールの IFilter.def を生成し、旧実装 (1 文字ずつ走査・キャッシュなし) と
+folder_codec (正規表現による一括デコード + LRU キャッシュ) で parse_becky_content の時間を比較します。
+
+    python benchmarks/bench_folder_codec.py [--rules 50000] [--folders 300]
+"""
+
+import argparse
+import base64
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import becky2sieve
+from besieve import folder_codec
+
+# --- 旧実装 (比較用) ---
+
+def legacy_modified_utf7_decode(s):
+    res = []
+    i = 0
+    while i < len(s):
+        if s[i] == '&':
+            i += 1
+            if i < len(s) and s[i] == '-':
+                res.append('&')
+                i += 1
+            else:
+                start = i
+                while i < len(s) and s[i] != '-':
+                    i += 1
+                b64 = s[start:i]
+                b64 = b64.replace(',', '/')
+                while len(b64) % 4 != 0:
+                    b64 += '='
+                try:
+                    res.append(base64.b64decode(b64, altchars=None).decode('utf-16-be'))
+                except Exception:
+                    res.append(f"&{b64}-")
+                if i < len(s) and s[i] == '-':
+                    i += 1
+        else:
+            res.append(s[i])
+            i += 1
+    return "".join(res)
+
+def legacy_decode_folder_path(raw_path):
+    raw_path = raw_path.replace('\\', '/')
+    filename = raw_path.split('/')[-1]
+    if '!Trash' in raw_path or '!Trash' in filename:
+        return "Trash"
+    if filename.endswith('.ini'):
+        filename = filename[:-4]
+    match = re.search(r'(?:#|^)(INBOX\[[0-9a-fA-F]+\])(?:\.(.*))?$', filename)
+    parts = []
+    if match:
+        parts.append("INBOX")
+        rest = match.group(2)
+        if rest:
+            parts.extend(rest.split('.'))
+    else:
+        parts = filename.split('.')
+    decoded_parts = []
+    for part in parts:
+        part = re.sub(r'\[[0-9a-fA-F]+\]$', '', part)
+        decoded = legacy_modified_utf7_decode(part)
+        if not decoded or decoded.startswith('#'):
+            continue
+        decoded_parts.append(decoded)
+    return ".".join(decoded_parts)
+
+# --- 入力生成 ---
+
+JA_WORDS = ['印刷', '請求書', 'メイズ', '営業部', '見積', '会議', '重要', '通知', '顧客', '保存']
+
+def make_ifilter(rules, folders):
+    names = []
+    for i in range(folders):
+        parts = [JA_WORDS[i % len(JA_WORDS)], f"{JA_WORDS[(i // len(JA_WORDS)) % len(JA_WORDS)]}{i}"]
+        encoded = '.'.join(f"{folder_codec.modified_utf7_encode(p)}[{i + j:x}]" for j, p in enumerate(parts))
+        names.append(f"45bee44e.mb\\#account#INBOX[1f].{encoded}.ini")
+    lines = ["Version=1", "AutoSorting=1", "OnlyRead=0", "OnlyOneFolder=1"]
+    for i in range(rules):
+        lines.append(':Begin ""')
+        lines.append(f"!M:{names[i % folders]}")
+        lines.append(f"@0:Subject:keyword{i}\tO\tI")
+        lines.append("$O:Sort=1")
+        lines.append(':End ""')
+    return "\n".join(lines)
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark folder name decoding.')
+    parser.add_argument('--rules', type=int, default=50000)
+    parser.add_argument('--folders', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    content = make_ifilter(args.rules, args.folders)
+    raw_paths = [line[3:] for line in content.splitlines() if line.startswith('!M:')]
+
+    current = becky2sieve.decode_folder_path
+
+    def cold_decode():
+        folder_codec.decode_folder_path.cache_clear()
+        for p in raw_paths:
+            folder_codec.decode_folder_path(p)
+
+    results = {}
+    results['decode legacy'] = best_of(args.repeat, lambda: [legacy_decode_folder_path(p) for p in raw_paths])
+    results['decode uncached'] = best_of(args.repeat, lambda: [folder_codec.decode_folder_path.__wrapped__(p) for p in raw_paths])
+    results['decode cached'] = best_of(args.repeat, cold_decode)
+
+    try:
+        becky2sieve.decode_folder_path = legacy_decode_folder_path
+        results['parse legacy'] = best_of(args.repeat, lambda: becky2sieve.parse_becky_content(content))
+    finally:
+        becky2sieve.decode_folder_path = current
+    results['parse codec'] = best_of(args.repeat, lambda: (folder_codec.decode_folder_path.cache_clear(),
+                                                           becky2sieve.parse_becky_content(content)))
+
+    print(f"{args.rules} rules, {args.folders} distinct folders (best of {args.repeat})")
+    for name, elapsed in results.items():
+        print(f"  {name:16s} {elapsed * 1000:9.1f} ms")
+    print(f"  decode speedup   {results['decode legacy'] / results['decode cached']:9.1f}x")
+    print(f"  parse speedup    {results['parse legacy'] / results['parse codec']:9.1f}x")
+
+if __name__ == '__main__':
+    main()
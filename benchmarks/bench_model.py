@@ -0,0 +1,102 @@
+"""
+ルール表現のメモリ比較
+
+parse_becky_content / parse_sieve_content が返すルールを、dict のまま持つ場合と
+model.Rule (compact=True) で持つ場合について、保持しているメモリ・パース中のピークメモリ・
+パースとラウンドトリップ検証の時間を比較し、JSON で出力します。
+
+    python benchmarks/bench_model.py [--rules 20000] [--conditions 4] [--output result.json]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import besieve
+from besieve import becky2sieve
+from besieve import sieve2becky
+from besieve import verify
+from bench_pipeline import make_folders, make_rules
+
+def measure_parse(parse):
+    # (保持しているバイト数, ピークのバイト数, 秒数, 結果)
+    gc.collect()
+    t = time.perf_counter()
+    parse()
+    seconds = time.perf_counter() - t
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = parse()
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return retained, peak, seconds, result
+
+def measure_time(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory use of dict rules and compact rules.')
+    parser.add_argument('--rules', type=int, default=20000, help='Number of rules')
+    parser.add_argument('--conditions', type=int, default=4, help='Conditions per rule')
+    parser.add_argument('--folders', type=int, default=300, help='Number of distinct folders')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write JSON to this file instead of stdout')
+    args = parser.parse_args()
+
+    folder_map = make_folders(args.folders, 2)
+    rules = make_rules(args.rules, args.conditions, folders=folder_map, seed=args.seed)
+    becky = sieve2becky.generate_becky_string(rules, folder_map)
+    sieve = becky2sieve.rules_to_sieve_string(becky2sieve.parse_becky_content(becky))
+    del rules
+
+    stages = {}
+    for name, parse in [('parse_becky_content', becky2sieve.parse_becky_content),
+                        ('parse_sieve_content', sieve2becky.parse_sieve_content)]:
+        source = becky if name == 'parse_becky_content' else sieve
+        result = {}
+        parsed = {}
+        for mode, compact in [('dict', False), ('compact', True)]:
+            retained, peak, seconds, parsed[mode] = measure_parse(lambda: parse(source, compact=compact))
+            result[mode] = {'retained_bytes': retained, 'peak_bytes': peak, 'seconds': round(seconds, 6)}
+        # 検証 (canonical_rule) も両方の表現で同じ結果になり、同程度の時間で済むこと
+        assert verify.compare_rules(parsed['dict'], parsed['compact']) == []
+        for mode in ('dict', 'compact'):
+            result[mode]['verify_seconds'] = round(
+                measure_time(lambda: verify.compare_rules(parsed[mode], parsed[mode])), 6)
+        del parsed
+        result['retained_ratio'] = round(result['compact']['retained_bytes'] / result['dict']['retained_bytes'], 3)
+        stages[name] = result
+
+    report = {
+        'besieve': besieve.__version__,
+        'python': platform.python_version(),
+        'params': {'rules': args.rules, 'conditions': args.conditions, 'folders': args.folders,
+                   'seed': args.seed},
+        'stages': stages,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
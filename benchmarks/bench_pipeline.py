@@ -0,0 +1,189 @@
+"""
+変換パイプラインのベンチマーク
+
+合成したルールセットで各段階 (Becky 生成・Becky パース・Sieve 生成・Sieve パース・
+ラウンドトリップ検証) を個別に計測し、処理速度 (rules/sec) とピークメモリを JSON で出力します。
+
+    python benchmarks/bench_pipeline.py [--rules 10000] [--conditions 3] [--regex 0.1] [--body 0.1]
+                                        [--depth 2] [--ascii] [--output result.json]
+                                        [--baseline previous.json --threshold 0.8]
+
+--baseline を指定すると、いずれかの段階の rules/sec が基準の threshold 倍を下回った場合に
+終了コード 1 で終了します (デプロイ前の性能劣化チェック用)。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import besieve
+from besieve import becky2sieve
+from besieve import sieve2becky
+from besieve import folder_codec
+from besieve.folder_codec import modified_utf7_encode
+
+JA_WORDS = ['印刷', '請求書', 'メイズ', '営業部', '見積', '会議', '重要', '通知', '顧客', '保存']
+EN_WORDS = ['print', 'invoice', 'maze', 'sales', 'quote', 'meeting', 'important', 'notice', 'customer', 'archive']
+HEADERS = ['Subject', 'From', 'To', 'X-ML-Name', 'List-Id', 'Sender']
+
+# --- 入力生成 ---
+
+def make_folders(count, depth, japanese=True):
+    # 論理フォルダー名 -> 物理パス (INBOX 以下に depth 階層)
+    words = JA_WORDS if japanese else EN_WORDS
+    folder_map = {}
+    for i in range(count):
+        logical = ['INBOX']
+        physical = ['#account#INBOX[1f]']
+        for level in range(depth):
+            word = f"{words[(i + level) % len(words)]}{i}" if level == depth - 1 else words[(i // len(words) + level) % len(words)]
+            logical.append(word)
+            physical.append(f"{modified_utf7_encode(word)}[{i + level:x}]")
+        folder_map['.'.join(logical)] = "45bee44e.mb\\" + '.'.join(physical) + ".ini"
+    return folder_map
+
+def make_rules(count, conditions=3, regex_share=0.1, body_share=0.1, folders=None, seed=0):
+    # sieve2becky/becky2sieve が扱うルール dict のリストを生成する
+    rng = random.Random(seed)
+    names = list(folders) if folders else ['INBOX.Work']
+    rules = []
+    for i in range(count):
+        conds = []
+        for j in range(conditions):
+            r = rng.random()
+            if r < body_share:
+                cond = {'header': '[body]', 'value': f"keyword{i}-{j}", 'flags': ['I']}
+            elif r < body_share + regex_share:
+                cond = {'header': 'Subject', 'value': f"^\\[list{i}\\] .*{j}$", 'flags': ['I', 'R']}
+            else:
+                cond = {'header': HEADERS[rng.randrange(len(HEADERS))], 'value': f"word{i}-{j}",
+                        'flags': ['I'] if rng.random() < 0.8 else []}
+            conds.append(cond)
+        rules.append({'folder': names[i % len(names)], 'conditions': conds, 'actions': []})
+    return rules
+
+# --- 計測 ---
+
+def _quiet(func):
+    # verify_conversion などの診断出力を計測対象から外す
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return func()
+    return run
+
+def measure(func, repeat):
+    # (最速の秒数, ピークメモリのバイト数)
+    # tracemalloc は処理を遅くするため、メモリは時間とは別に 1 回だけ計測する
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def run_pipeline(rules, folder_map, repeat=3):
+    becky = sieve2becky.generate_becky_string(rules, folder_map)
+    parsed = becky2sieve.parse_becky_content(becky)
+    sieve = becky2sieve.rules_to_sieve_string(parsed)
+    reverted = sieve2becky.parse_sieve_content(sieve)
+
+    stages = [
+        ('generate_becky_string', lambda: sieve2becky.generate_becky_string(rules, folder_map)),
+        ('write_becky', lambda: sieve2becky.write_becky(rules, folder_map, io.StringIO())),
+        # フォルダー名のデコードキャッシュは実際の実行と同じく空の状態から計測する
+        ('parse_becky_content', lambda: (folder_codec.decode_folder_path.cache_clear(),
+                                         becky2sieve.parse_becky_content(becky))),
+        ('rules_to_sieve_string', lambda: becky2sieve.rules_to_sieve_string(parsed)),
+        ('parse_sieve_content', lambda: sieve2becky.parse_sieve_content(sieve)),
+        ('becky2sieve.verify_conversion', _quiet(lambda: becky2sieve.verify_conversion(parsed, sieve, None))),
+        ('sieve2becky.verify_conversion', _quiet(lambda: sieve2becky.verify_conversion(reverted, becky))),
+    ]
+    results = {}
+    for name, func in stages:
+        seconds, peak = measure(func, repeat)
+        results[name] = {
+            'seconds': round(seconds, 6),
+            'rules_per_sec': round(len(rules) / seconds, 1) if seconds > 0 else None,
+            'peak_bytes': peak,
+        }
+    sizes = {'becky_bytes': len(becky.encode('cp932', errors='replace')),
+             'sieve_bytes': len(sieve.encode('utf-8'))}
+    return results, sizes
+
+def compare(results, baseline, threshold):
+    # 基準より遅くなった段階のリスト
+    regressions = []
+    for name, base in baseline.get('stages', {}).items():
+        current = results.get(name)
+        if not current or not base.get('rules_per_sec') or not current.get('rules_per_sec'):
+            continue
+        ratio = current['rules_per_sec'] / base['rules_per_sec']
+        if ratio < threshold:
+            regressions.append(f"{name}: {current['rules_per_sec']:.0f} rules/sec "
+                               f"({ratio:.2f}x of baseline {base['rules_per_sec']:.0f})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Becky!/Sieve conversion pipeline.')
+    parser.add_argument('--rules', type=int, default=10000, help='Number of rules')
+    parser.add_argument('--conditions', type=int, default=3, help='Conditions per rule')
+    parser.add_argument('--regex', type=float, default=0.1, help='Share of regex conditions (0-1)')
+    parser.add_argument('--body', type=float, default=0.1, help='Share of body conditions (0-1)')
+    parser.add_argument('--folders', type=int, default=300, help='Number of distinct folders')
+    parser.add_argument('--depth', type=int, default=2, help='Folder depth below INBOX')
+    parser.add_argument('--ascii', action='store_true', help='Use ASCII instead of Japanese folder names')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='Report the best of N runs')
+    parser.add_argument('--output', help='Write JSON to this file instead of stdout')
+    parser.add_argument('--baseline', help='Previous JSON result to compare against')
+    parser.add_argument('--threshold', type=float, default=0.8,
+                        help='Fail if a stage drops below this fraction of the baseline rules/sec')
+    args = parser.parse_args()
+
+    folder_map = make_folders(args.folders, args.depth, japanese=not args.ascii)
+    rules = make_rules(args.rules, args.conditions, args.regex, args.body, folder_map, args.seed)
+    results, sizes = run_pipeline(rules, folder_map, args.repeat)
+
+    report = {
+        'besieve': besieve.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {k: getattr(args, k) for k in ('rules', 'conditions', 'regex', 'body', 'folders',
+                                                   'depth', 'ascii', 'seed', 'repeat')},
+        'sizes': sizes,
+        'stages': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"[REGRESSION] {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
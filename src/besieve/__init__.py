@@ -9,6 +9,7 @@ __version__ = "1.0.0"
 
 from .becky2sieve import (
     parse_becky_content,
+    iter_becky_rules,
     rules_to_sieve_string,
     verify_conversion as verify_becky_conversion,
 )
@@ -20,12 +21,16 @@ from .sieve2becky import (
     verify_conversion as verify_sieve_conversion,
 )
 
+from .sieve_parser import SieveSyntaxError
+
 __all__ = [
     "parse_becky_content",
+    "iter_becky_rules",
     "rules_to_sieve_string",
     "verify_becky_conversion",
     "parse_sieve_content",
     "generate_becky_string",
     "build_folder_map",
     "verify_sieve_conversion",
+    "SieveSyntaxError",
 ]
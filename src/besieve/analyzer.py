@@ -0,0 +1,360 @@
+"""
+ルールの静的解析 (シャドウ・重複・包含の検出)
+
+メールを使わずにルールセットだけを調べ、実行されることのない条件やルールを報告します。
+- 前のルール (stop あり) の条件に包含されるため、一致しても実行されない条件・ルール
+- 同じ振り分け先・条件を持つ重複したルール
+- ルール内で重複する条件、同じルールの他の条件に包含される条件
+- POSIX ERE にできない正規表現、バックトラックが爆発する正規表現 (regex_dialect.check_pattern)
+
+条件 A が条件 B を包含するのは、B に一致するメッセージが必ず A にも一致する場合です
+(同じヘッダーで、:contains のキーが B のキーの部分文字列である、前方一致のキーが B の前方一致の
+キーの先頭部分である、など)。キーは対象ごとに n-gram の索引にまとめ、辞書引きで自分を包含する
+キーを見つけるため、ルール同士を総当たりで比較しません。
+"""
+
+from collections import namedtuple
+
+from .evaluator import ascii_lower, condition_keys, condition_target
+from .matcher import WILDCARDS
+from .regex_dialect import check_pattern
+
+# kind: 'empty-rule' / 'duplicate-rule' / 'shadowed-rule' / 'shadowed-condition' /
+#       'duplicate-condition' / 'subsumed-condition' / 'invalid-regex' / 'slow-regex'
+# rule, condition: 1 始まりの番号 (condition はルール内の条件の位置。ルール単位の指摘では None)
+# key: 対象のキー (リスト形式の値の場合はその要素), related: 原因となったルール番号のタプル
+# detail: 正規表現の指摘の説明 (それ以外は None)
+Finding = namedtuple('Finding', 'kind rule condition key related detail', defaults=(None,))
+
+# これ以下の数のキーしかない段は、索引を作らずに `in` で調べる
+SCAN_KEYS = 4
+
+# 1 つの n-gram に登録するキーの数の目安 (超えた場合はキーの他の位置の n-gram に登録する)
+BUCKET_SIZE = 8
+
+class _SubstringIndex:
+    # 文字列に部分文字列として現れるキーを探す n-gram 索引
+    # キーを長さで段 (1, 2-3, 4-7, 8-15, ...) に分け、段の最も短いキーの長さを n として、
+    # 各キーをその n-gram の 1 つ (ふつうは先頭か末尾) に登録する。
+    # 検索では文字列の n-gram を辞書で引き、登録されたキーが実際に現れるかを確かめる
+    def __init__(self, entries):
+        self.scan = []      # 索引を作らない段の [(キー, 番号)]
+        self.tiers = []     # [(n, {n-gram: [(キー, n-gram の位置, 番号)]})] (n の小さい順)
+        tiers = {}
+        for key, pid in entries:
+            tiers.setdefault(len(key).bit_length(), []).append((key, pid))
+        for level in sorted(tiers):
+            keys = tiers[level]
+            if len(keys) <= SCAN_KEYS:
+                self.scan.extend(keys)
+                continue
+            n = min(len(key) for key, _ in keys)
+            # キーの先頭と末尾の n-gram のうち、種類の多い方 (キーを分けやすい方) に登録する
+            from_end = len({key[-n:] for key, _ in keys}) > len({key[:n] for key, _ in keys})
+            grams = {}
+            for key, pid in keys:
+                offset = len(key) - n if from_end else 0
+                bucket = grams.setdefault(key[offset:offset + n], [])
+                if len(bucket) < BUCKET_SIZE:
+                    bucket.append((key, offset, pid))
+                else:
+                    offset = _least_used_offset(key, n, grams)
+                    grams.setdefault(key[offset:offset + n], []).append((key, offset, pid))
+            self.tiers.append((n, grams))
+
+    def search(self, queries):
+        # queries: [(文字列, 番号)]。文字列に現れるキーごとに (文字列の番号, キーの番号) を返す
+        # 文字列が登録したキー自身 (番号が同じ) の場合は返さない
+        for key, pid in self.scan:
+            for text, qid in queries:
+                if pid != qid and key in text:
+                    yield qid, pid
+        if not self.tiers:
+            return
+        # 同じ長さの文字列をまとめ、n-gram の位置ごとに索引にある文字列だけを取り出す
+        batches = {}
+        for query in queries:
+            batches.setdefault(len(query[0]), []).append(query)
+        for length, batch in batches.items():
+            for n, grams in self.tiers:
+                if n > length:
+                    break
+                for i in range(length - n + 1):
+                    hits = [(text, qid) for text, qid in batch if text[i:i + n] in grams]
+                    for text, qid in hits:
+                        for key, offset, pid in grams[text[i:i + n]]:
+                            if pid != qid and offset <= i and text.startswith(key, i - offset):
+                                yield qid, pid
+
+def _least_used_offset(key, n, grams):
+    # キーの n-gram のうち、登録されたキーが最も少ないものの位置
+    # (同じドメインのアドレスのように先頭が共通するキーが 1 つの n-gram に集まらないようにする)
+    return min(range(len(key) - n + 1), key=lambda i: len(grams.get(key[i:i + n], ())))
+
+# 照合方法
+MATCH_TYPES = ('contains', 'prefix', 'wildcard', 'regex')
+
+def _match_type(flags, key):
+    if 'R' in flags:
+        return 'regex'
+    if 'T' in flags:
+        return 'prefix' if WILDCARDS.isdisjoint(key) else 'wildcard'
+    return 'contains'
+
+def _targets(header):
+    # 条件のヘッダー名 -> 照合の対象のタプル。複数ヘッダーの条件は対象ごとに分ける
+    # 対象は文字列にして、単位の辞書引きでハッシュを使い回す
+    kind, names = condition_target(header)
+    return tuple(f"{kind}:{name}" for name in (sorted(names) or ('',)))
+
+class _Index:
+    # 照合の単位 (対象, fold, 照合方法, 比較用のキー) ごとに番号を振り、包含関係を調べるための索引
+    # 単位は (対象, fold) の組ごとに、照合方法 -> {キー: 番号} の辞書にまとめる
+    def __init__(self):
+        self.groups = {}       # (対象, fold) -> {照合方法: {キー: 番号}}
+        self.first_stop = []   # 番号 -> その単位を持つ最初の stop ありのルール (0 始まり、なければ None)
+
+    def group(self, target, fold):
+        group = self.groups.get((target, fold))
+        if group is None:
+            group = self.groups[(target, fold)] = {match: {} for match in MATCH_TYPES}
+        return group
+
+    def add(self, keys, key, rule_no, stop):
+        # keys: 組の照合方法ごとの辞書
+        pid = keys.get(key)
+        if pid is None:
+            pid = keys[key] = len(self.first_stop)
+            self.first_stop.append(rule_no if stop else None)
+        elif stop and self.first_stop[pid] is None:
+            self.first_stop[pid] = rule_no
+        return pid
+
+    def _covering(self):
+        # (単位, それを包含する他の単位) の番号の組の集合。包含する単位に一致するメッセージは
+        # 包含される単位に必ず一致する
+        covers = set()
+        groups = self.groups
+        for (target, fold), group in groups.items():
+            other = groups.get((target, True))
+            if not fold and other:
+                # 大文字小文字を無視する同じパターンは、区別するパターンを包含する
+                for match in ('wildcard', 'regex'):
+                    for key, pid in group[match].items():
+                        if key in other[match]:
+                            covers.add((pid, other[match][key]))
+
+        # 包含する :contains のキーを探す文字列 (:contains と前方一致のキー) と、
+        # 包含する前方一致のキーを探す文字列 (前方一致のキー)。
+        # 大文字小文字を無視するキーは、区別するキーも包含できる
+        contains = {name: list(group['contains'].items()) for name, group in groups.items()}
+        texts = {}
+        prefixed = {}
+        for (target, fold), group in groups.items():
+            prefix = list(group['prefix'].items())
+            for lists, entries in ((texts, contains[(target, fold)]), (texts, prefix), (prefixed, prefix)):
+                lists.setdefault((target, fold), []).extend(entries)
+                if not fold:
+                    lists.setdefault((target, True), []).extend([(ascii_lower(key), pid) for key, pid in entries])
+
+        for name, queries in texts.items():
+            if contains.get(name):
+                index = _SubstringIndex(contains[name])
+                covers.update(index.search(queries))
+        for name, queries in prefixed.items():
+            group = groups.get(name)
+            if group and group['prefix']:
+                keys = group['prefix']
+                lengths = sorted({len(key) for key in keys})
+                for text, qid in queries:
+                    for n in lengths:
+                        if n > len(text):
+                            break
+                        pid = keys.get(text[:n])
+                        if pid is not None and pid != qid:
+                            covers.add((qid, pid))
+        return covers
+
+    def finish(self):
+        # 単位ごとに、包含する単位の集合と、そのうち最初に stop するルールを求める
+        # (同じ単位は多くのルールに現れるため、ここで 1 回だけ計算する)
+        # covers: 単位 -> それを包含する他の単位の番号のリスト (包含する単位がある単位だけ)
+        first_stop = self.first_stop
+        self.covers = covers = {}
+        self.first_block = first_block = list(first_stop)
+        for pid, other in self._covering():
+            covers.setdefault(pid, []).append(other)
+            stop = first_stop[other]
+            if stop is not None and (first_block[pid] is None or stop < first_block[pid]):
+                first_block[pid] = stop
+
+def _pattern_findings(number, ci, key):
+    # 正規表現のキー 1 つの指摘
+    return [Finding(kind, number, ci + 1, key, (), detail) for kind, detail in check_pattern(key)]
+
+def _regex_findings(number, rule):
+    findings = []
+    for ci, cond in enumerate(rule['conditions']):
+        if 'R' in cond.get('flags', ['I']):
+            for key in condition_keys(cond):
+                findings.extend(_pattern_findings(number, ci, key))
+    return findings
+
+def regex_findings(rules):
+    # 正規表現の指摘だけを返す (besieve-sync の変換時の警告)
+    findings = []
+    for rule_no, rule in enumerate(rules):
+        findings.extend(_regex_findings(rule_no + 1, rule))
+    return findings
+
+def analyze(rules):
+    # parse_becky_content / parse_sieve_content のルール構造を解析し、Finding のリストを返す
+    index = _Index()
+    add = index.add
+    cache = {}      # (ヘッダー名, fold) -> 対象ごとの組のタプル
+    atoms = []      # ルールごとの ([(条件番号, キー, 単位の番号のタプル (重複した条件は None))], 単位の番号のリスト)
+    regex = {}      # ルール番号 -> 正規表現の指摘
+    for rule_no, rule in enumerate(rules):
+        stop = rule.get('stop', True)
+        entries = []
+        flat = []
+        seen = set()
+        # 条件をキーごとに展開し、照合の単位 (対象, fold, 照合方法, 比較用のキー) に番号を振る
+        for ci, cond in enumerate(rule['conditions']):
+            flags = cond.get('flags', ['I'])
+            fold = 'I' in flags
+            groups = cache.get((cond['header'], fold))
+            if groups is None:
+                groups = cache[(cond['header'], fold)] = tuple(
+                    index.group(target, fold) for target in _targets(cond['header']))
+            for key in condition_keys(cond):
+                match = _match_type(flags, key)
+                if match == 'regex':
+                    # 実行されないルールでもサーバーはコンパイルするため、常に調べる
+                    found = _pattern_findings(rule_no + 1, ci, key)
+                    if found:
+                        regex.setdefault(rule_no, []).extend(found)
+                # 正規表現とワイルドカードは小文字にすると意味が変わるため、そのまま比較する
+                norm = ascii_lower(key) if fold and match in ('contains', 'prefix') else key
+                if len(groups) == 1:
+                    pids = (add(groups[0][match], norm, rule_no, stop),)
+                else:
+                    pids = tuple([add(group[match], norm, rule_no, stop) for group in groups])
+                # 同じルールで同じ単位の条件は重複
+                if pids in seen:
+                    entries.append((ci, key, None))
+                else:
+                    seen.add(pids)
+                    entries.append((ci, key, pids))
+                    flat.extend(pids)
+        atoms.append((tuple(entries), tuple(flat)))
+    index.finish()
+    covers = index.covers
+    # stop しない単位は、どのルールよりも後ろで止まるものとして比較する
+    never = len(rules)
+    block = [never if b is None else b for b in index.first_block]
+
+    findings = []
+    seen_rules = {}
+    for rule_no, rule in enumerate(rules):
+        number = rule_no + 1
+        entries, flat = atoms[rule_no]
+        if rule_no in regex:
+            findings.extend(regex[rule_no])
+        if not entries:
+            # 条件のないルールは Sieve に出力されず、実行されない
+            findings.append(Finding('empty-rule', number, None, None, ()))
+            continue
+        actions = rule.get('actions')
+        unique = sorted([pids for _, _, pids in entries if pids])   # 重複した条件を除く
+        signature = (rule.get('folder'), tuple(sorted(set(actions))) if actions else (),
+                     rule.get('stop', True), tuple(unique))
+        if signature in seen_rules:
+            findings.append(Finding('duplicate-rule', number, None, None, (seen_rules[signature] + 1,)))
+            continue
+        seen_rules[signature] = rule_no
+
+        # 前のルールの stop で必ず止まる条件 (複数ヘッダーの条件はすべてのヘッダーについて)
+        # 前のルールで止まる単位がなければ、条件ごとには調べない
+        blocked = None  # 条件ごとの止めるルールのリスト (止まらない条件と重複した条件は None)
+        if min(map(block.__getitem__, flat)) < rule_no:
+            blocked = []
+            all_shadowed = True
+            for _, _, pids in entries:
+                blockers = None
+                if pids is not None:
+                    blockers = [block[pid] for pid in pids] if len(pids) > 1 else (block[pids[0]],)
+                    if max(blockers) >= rule_no:
+                        blockers = None
+                        all_shadowed = False
+                blocked.append(blockers)
+            if all_shadowed:
+                shadowed_by = {r + 1 for blockers in blocked if blockers for r in blockers}
+                findings.append(Finding('shadowed-rule', number, None, None, tuple(sorted(shadowed_by))))
+                continue
+
+        # 他の条件に包含されうるのは、包含する単位があるか、単位を他の条件と共有する場合だけ
+        subsumed = ()
+        if len(flat) > 1 and (not covers.keys().isdisjoint(flat) or len(set(flat)) < len(flat)):
+            subsumed = _subsumed(entries, flat, covers)
+        if not (blocked or subsumed or len(unique) < len(entries)):
+            continue
+        for atom, (ci, key, pids) in enumerate(entries):
+            if pids is None:
+                findings.append(Finding('duplicate-condition', number, ci + 1, key, ()))
+            elif atom in subsumed:
+                # 同じルールの他の条件 (OR) に包含される
+                findings.append(Finding('subsumed-condition', number, ci + 1, key, ()))
+            elif blocked and blocked[atom]:
+                blockers = blocked[atom]
+                related = (blockers[0] + 1,) if len(blockers) == 1 else tuple(sorted({r + 1 for r in blockers}))
+                findings.append(Finding('shadowed-condition', number, ci + 1, key, related))
+    return findings
+
+def _subsumed(entries, flat, covers):
+    # ルールの条件 (展開後) のうち、すべての対象について他の条件の単位に包含されるものの位置の集合
+    # flat: ルールの条件の単位の番号のリスト (重複した条件は含めない)
+    pids = set(flat)
+    if len(pids) == len(flat):
+        # 単位を共有する条件がない場合は、単位ごとにルールの他の単位に包含されるかを調べればよい
+        # (同じ条件の他の単位は対象が異なり、包含しない)
+        hit = {pid for pid in covers.keys() & pids if not pids.isdisjoint(covers[pid])}
+        return {atom for atom, (_, _, p) in enumerate(entries) if p and hit.issuperset(p)}
+    # 重複した条件は、前の条件を「他の条件に包含される」と誤って判定しないよう含めない
+    owner = {}      # 単位 -> それを持つ最初の条件の位置
+    shared = set()  # 複数の条件が持つ単位
+    for atom, (_, _, p) in enumerate(entries):
+        for pid in p or ():
+            if owner.setdefault(pid, atom) != atom:
+                shared.add(pid)
+    subsumed = set()
+    for atom, (_, _, p) in enumerate(entries):
+        if p is None:
+            continue
+        for pid in p:
+            # 他の条件も持つ単位か、他の条件の単位に包含される
+            if not any(c in shared or owner.get(c, atom) != atom for c in (pid, *covers.get(pid, ()))):
+                break
+        else:
+            subsumed.add(atom)
+    return subsumed
+
+def _rules_text(related):
+    return ', '.join(str(r) for r in related)
+
+def format_finding(f):
+    # 1 行の説明 (besieve analyze の出力)
+    if f.kind == 'empty-rule':
+        return f"rule {f.rule}: has no conditions and is never applied"
+    if f.kind == 'duplicate-rule':
+        return f"rule {f.rule}: duplicate of rule {_rules_text(f.related)}"
+    if f.kind == 'shadowed-rule':
+        return f"rule {f.rule}: never fires, shadowed by rule(s) {_rules_text(f.related)}"
+    where = f"rule {f.rule} condition {f.condition} ({f.key!r})"
+    if f.kind == 'duplicate-condition':
+        return f"{where}: duplicate of an earlier condition in the same rule"
+    if f.kind == 'subsumed-condition':
+        return f"{where}: subsumed by another condition in the same rule"
+    if f.kind in ('invalid-regex', 'slow-regex'):
+        return f"{where}: {f.detail}"
+    return f"{where}: never fires, shadowed by rule(s) {_rules_text(f.related)}"
@@ -0,0 +1,100 @@
+"""
+出力ファイルの安全な書き込み
+
+同じディレクトリの一時ファイルに書き込んで fsync し、os.replace で置き換えます。
+途中で落ちても、Becky! が書き込み中のファイルを読んでも、古い内容か新しい内容の
+どちらかしか見えません。内容が今のファイルと同じ場合は書き込まないため、
+変更のないアカウントで Becky! にフィルターを読み直させることもありません。
+"""
+
+import codecs
+import hashlib
+import os
+import shutil
+
+# 今のファイルと比べるときに読む単位
+_READ_SIZE = 1 << 16
+
+def iter_encoded(texts, encoding='cp932', errors='replace'):
+    # 文字列のイテラブルをエンコードしたバイト列を順に返す (全体を 1 つの文字列にしない)
+    encoder = codecs.getincrementalencoder(encoding)(errors=errors)
+    for text in texts:
+        data = encoder.encode(text)
+        if data:
+            yield data
+    tail = encoder.encode('', final=True)
+    if tail:
+        yield tail
+
+def _fsync_dir(directory):
+    # rename をディスクに反映させる (Windows ではディレクトリを開けないため何もしない)
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def write_atomic(path, chunks):
+    # バイト列のイテラブルを path に書き込む。戻り値は (書き込んだか, 内容の sha256)
+    # 今のファイルと先頭から比べながら読み進め、最初に違うところが見つかった時点で一時ファイルを作る
+    # (同じだった部分は今のファイルからコピーする)。最後まで同じなら一時ファイルは作らない
+    digest = hashlib.sha256()
+    try:
+        current = open(path, 'rb')
+    except OSError:
+        current = None
+    tmp = f"{path}.tmp{os.getpid()}"
+    out = None
+    same = 0  # 今のファイルと一致している先頭のバイト数 (out を開くまで)
+    try:
+        for data in chunks:
+            digest.update(data)
+            if out is None and current is not None:
+                if current.read(len(data)) == data:
+                    same += len(data)
+                    continue
+            if out is None:
+                out = open(tmp, 'wb')
+                if same:
+                    current.seek(0)
+                    out.write(current.read(same))
+            out.write(data)
+        if out is None:
+            if current is not None and not current.read(1):
+                # 内容が同じ (今のファイルの方が長い場合は書き直す)
+                return False, digest.hexdigest()
+            out = open(tmp, 'wb')
+            if same:
+                current.seek(0)
+                out.write(current.read(same))
+        out.flush()
+        os.fsync(out.fileno())
+        out.close()
+        if current is not None:
+            current.close()
+            # 置き換えても権限は元のファイルのままにする
+            try:
+                shutil.copymode(path, tmp)
+            except OSError:
+                pass
+        os.replace(tmp, path)
+        _fsync_dir(os.path.dirname(path))
+        return True, digest.hexdigest()
+    except BaseException:
+        if out is not None:
+            out.close()
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        raise
+    finally:
+        if current is not None:
+            current.close()
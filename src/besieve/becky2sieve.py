@@ -1,117 +1,71 @@
+import collections.abc
+import functools
 import os
 import re
-import base64
+import codecs
+import shutil
 import sys
+import tempfile
 
-# Modified UTF-7 (IMAPフォルダ名) をデコードする
-def modified_utf7_decode(s):
-    res = []
-    i = 0
-    while i < len(s):
-        if s[i] == '&':
-            i += 1
-            if i < len(s) and s[i] == '-':
-                res.append('&')
-                i += 1
-            else:
-                start = i
-                while i < len(s) and s[i] != '-':
-                    i += 1
-                b64 = s[start:i]
-                b64 = b64.replace(',', '/')
-                while len(b64) % 4 != 0:
-                    b64 += '='
-                try:
-                    res.append(base64.b64decode(b64, altchars=None).decode('utf-16-be'))
-                except Exception:
-                    res.append(f"&{b64}-") # 失敗時のフォールバック
-                if i < len(s) and s[i] == '-':
-                    i += 1
-        else:
-            res.append(s[i])
-            i += 1
-    return "".join(res)
+from . import sieve_parser
+from . import verify
+from .folder_codec import modified_utf7_decode, decode_folder_path
+from .folder_map import build_folder_map, default_cache_dir
+from .model import Condition, FLAG_BITS, FLAG_ORDER, Rule, mask_to_flags
+from .optimizer import optimize_rules
+from .regex_dialect import RegexError, to_posix as posix_regex
 
-def decode_folder_path(raw_path):
-    raw_path = raw_path.replace('\\', '/')
-    filename = raw_path.split('/')[-1]
-    
-    # 特殊ケース
-    if '!Trash' in raw_path or '!Trash' in filename:
-        return "Trash"
+def parse_condition_line(line):
+    # 条件行 1 行をパースする。条件行でなければ None
+    # @0:Header:Value \t Operator \t Flags
+    # Flags typically: I (Ignore Case), T (Top/Prefix), R (Regex)
+    # Operator: O (Or), A (And)?
+    if not line.startswith('@'):
+        return None
+    parts = line.split('\t')
+    cond_str = parts[0]
 
-    if filename.endswith('.ini'):
-        filename = filename[:-4]
-    
-    match = re.search(r'(?:#|^)(INBOX\[[0-9a-fA-F]+\])(?:\.(.*))?$', filename)
-    parts = []
-    if match:
-        parts.append("INBOX")
-        rest = match.group(2)
-        if rest:
-            subparts = rest.split('.')
-            parts.extend(subparts)
-    else:
-        parts = filename.split('.')
-    
-    decoded_parts = []
-    for part in parts:
-        part = re.sub(r'\[[0-9a-fA-F]+\]$', '', part)
-        decoded = modified_utf7_decode(part)
-        if not decoded or decoded.startswith('#'):
-            continue
-        decoded_parts.append(decoded)
-        
-    return ".".join(decoded_parts)
+    flags = []
+    operator = 'O'
+
+    if len(parts) > 2:
+        flags = list(parts[2]) # "IR" -> ['I', 'R']
+    if len(parts) > 1:
+        operator = parts[1].strip()
+
+    idx1 = cond_str.find(':', 1)
+    if idx1 == -1:
+        return None
+    # Group ID is cond_str[1:idx1], usually "0"
+    idx2 = cond_str.find(':', idx1 + 1)
+    if idx2 == -1:
+        return None
+    return {
+        'header': cond_str[idx1+1:idx2],
+        'value': cond_str[idx2+1:],
+        'flags': flags,
+        'operator': operator
+    }
 
 def parse_conditions(lines):
     conditions = []
     for line in lines:
-        parts = line.split('\t')
-        cond_str = parts[0]
-        
-        # Parse flags if available (Col 2 and 3)
-        # @0:Header:Value \t Operator \t Flags
-        # Flags typically: I (Ignore Case), T (Top/Prefix), R (Regex)
-        # Operator: O (Or), A (And)?
-        
-        flags = []
-        operator = 'O'
-        
-        if len(parts) > 2:
-            flags = list(parts[2]) # "IR" -> ['I', 'R']
-        if len(parts) > 1:
-            operator = parts[1].strip()
-
-        if cond_str.startswith('@'):
-            sub = cond_str[1:]
-            idx1 = sub.find(':')
-            if idx1 != -1:
-                # Group ID is sub[:idx1], usually "0"
-                rest = sub[idx1+1:]
-                idx2 = rest.find(':')
-                if idx2 != -1:
-                    header = rest[:idx2]
-                    value = rest[idx2+1:]
-                    conditions.append({
-                        'header': header, 
-                        'value': value,
-                        'flags': flags,
-                        'operator': operator
-                    })
+        cond = parse_condition_line(line)
+        if cond is not None:
+            conditions.append(cond)
     return conditions
 
-def parse_becky_content(content):
-    rules = []
-    lines = content.splitlines()
-    
+def _iter_rules(lines, folder_map=None):
+    # テキスト行のイテラブルから :End ごとにルールを生成する
+    # folder_map (folder_map.build_folder_map の戻り値) があれば物理パスを逆引きで解決する
+    to_logical = folder_map.to_logical if folder_map is not None else decode_folder_path
     current_rule = {'conditions': [], 'folder': None, 'actions': []}
     in_rule = False
-    
+
     for line in lines:
         line = line.strip()
         if not line: continue
-        
+
         if line.startswith(':Begin'):
             in_rule = True
             current_rule = {'conditions': [], 'folder': None, 'actions': []}
@@ -119,10 +73,10 @@ def parse_becky_content(content):
             in_rule = False
             # Check if valid rule
             if (current_rule['folder'] or current_rule['actions']) and current_rule['conditions']:
-                rules.append(current_rule)
+                yield current_rule
         elif in_rule:
             if line.startswith('!M:'):
-                current_rule['folder'] = decode_folder_path(line[3:])
+                current_rule['folder'] = to_logical(line[3:])
             elif line.startswith('!D'):
                 # Delete action (Server delete?)
                 # Sieve 'discard'
@@ -131,202 +85,304 @@ def parse_becky_content(content):
                 # Copy mode
                 current_rule['actions'].append('keep')
             elif line.startswith('@'):
-                parsed_conds = parse_conditions([line])
-                current_rule['conditions'].extend(parsed_conds)
-    return rules
+                cond = parse_condition_line(line)
+                if cond is not None:
+                    current_rule['conditions'].append(cond)
 
-def rules_to_sieve_string(rules):
-    output = []
-    
+def _iter_decoded_lines(stream, encoding):
+    # バイナリストリームを1行ずつ読み、インクリメンタルにデコードする
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for raw in stream:
+        text = decoder.decode(raw)
+        if text:
+            yield from text.splitlines()
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield from tail.splitlines()
+
+def iter_becky_rules(stream, encoding='cp932', folder_map=None, compact=False):
+    # IFilter.def をバイナリファイルオブジェクトから逐次パースし、ルールを1つずつ返す
+    # ファイル全体を読み込まないため、巨大なファイルでもメモリ使用量は一定
+    # compact=True なら dict の代わりに model.Rule を返す
+    rules = _iter_rules(_iter_decoded_lines(stream, encoding), folder_map)
+    return map(Rule.from_dict, rules) if compact else rules
+
+def parse_becky_content(content, folder_map=None, compact=False):
+    rules = _iter_rules(content.splitlines(), folder_map)
+    return list(map(Rule.from_dict, rules) if compact else rules)
+
+# 必ず宣言する拡張
+BASE_REQUIRES = frozenset({"fileinto", "mailbox"})
+
+# write_sieve が 1 回の write にまとめるルール数
+BATCH_RULES = 256
+
+_REGEX_BIT = FLAG_BITS['R']
+
+# model.Condition のビットマスク -> (大文字小文字無視, 正規表現, 前方一致)
+_MASK_BITS = [tuple(f in mask_to_flags(m) for f in 'IRT') for m in range(1 << len(FLAG_ORDER))]
+
+@functools.lru_cache(maxsize=4096)
+def _condition_prefix(h, bits):
+    # 条件のキーより前の部分 ('header :contains "Subject"' など)、キーに付ける接尾辞、必要な拡張
+    # ヘッダー名とフラグの組み合わせは少ないため、1 回だけ組み立ててキャッシュする
+    ignore_case, regex, prefix = bits
+    ext = None
+
+    # ヘッダのマッピング
+    # 大文字小文字区別: Becky 'I' は無視の意味。
+    # 'I' が無い場合は区別する (デフォルト i;ascii-casemap は大文字小文字無視)
+    comparator = "" if ignore_case else ':comparator "i;octet"'
+    suffix = ""
+    if regex:
+        match_type = ":regex"
+        ext = "regex"
+    elif prefix:
+        match_type = ":matches"
+        suffix = "*"
+    else:
+        match_type = ":contains"
+
+    # 条件文字列の構築
+    # Sieve構文: test-name [flags] [match-type] [comparator] [args]
+    # header [match-type] [comparator] <headers> <keys>
+    # address [match-type] [comparator] [part] <headers> <keys>
+    # body [match-type] [comparator] [trans] <keys> (Extension)
+    # アドレス部分指定 (Beckyは明示的にサポートしていない) は Sieve のデフォルト (:all)
+    test_name = "header"
+    header_arg = ""
+    if h.lower() == '[body]':
+        test_name = "body"
+        ext = "body" if ext is None else (ext, "body")
+        # Body はヘッダ引数なし
+    elif h.lower() in ['from', 'to', 'cc', 'bcc']:
+        test_name = "address"
+        header_arg = f'"{h}"'
+    elif ',' in h:
+        # 複数ヘッダの処理
+        hdrs = [x.strip() for x in h.split(',')]
+        hdrs_str = ", ".join(f'"{hdr}"' for hdr in hdrs)
+        header_arg = f'[{hdrs_str}]'
+    else:
+        header_arg = f'"{h}"'
+
+    # 行の構築: test :match :comparator (headers) "key"
+    parts = [test_name, match_type]
+    if comparator:
+        parts.append(comparator)
+    if header_arg:
+        parts.append(header_arg)
+    exts = () if ext is None else ((ext,) if isinstance(ext, str) else ext)
+    return " ".join(parts) + " ", suffix, frozenset(exts)
+
+def _render_condition(c):
+    # (条件のテキスト, 必要な拡張)
+    if type(c) is Condition:
+        h, v, bits = c.header, c.value, _MASK_BITS[c.mask]
+    else:
+        h, v, flags = c['header'], c['value'], c['flags']
+        bits = ('I' in flags, 'R' in flags, 'T' in flags)
+    head, suffix, exts = _condition_prefix(h, bits)
+    # キー - リスト形式の値をSieveリストに変換
+    # 注: [WATCHDOG] のような単一値は配列ではなく文字列として扱う
+    # リストとして認識する条件: [...] で囲まれ、かつ内部に ", " が存在する (verify.is_list_value と同じ)
+    if '", "' in v and v[:1] == '[' and v[-1:] == ']':
+        # 各要素もエスケープし、前方一致 (T) の場合は要素ごとに * を付ける
+        elems = verify.split_list_value(v)
+        if bits[1]:
+            elems = [posix_regex(e) for e in elems]
+        key_str = '[' + ', '.join(sieve_parser.quote(e + suffix) for e in elems) + ']'
+        return head + key_str, exts
+    if bits[1]:
+        # :regex は POSIX ERE (RFC 3894)。Becky! の構文 (\d など) を書き換える
+        v = posix_regex(v)
+    if '\\' in v or '"' in v:
+        # 値のエスケープ (RFC 5228: \\ と \" のみ)
+        key_str = '"' + v.replace('\\', '\\\\').replace('"', '\\"') + suffix + '"'
+    else:
+        key_str = '"' + v + suffix + '"'
+    return head + key_str, exts
+
+def rule_requires(rule):
+    # ルール 1 つが必要とする拡張 (描画せずにフラグとヘッダー名だけを見る)
+    # 書き出さない条件 (POSIX ERE にできない正規表現) の拡張は含めない
+    required_exts = set()
+    for c in rule['conditions']:
+        if type(c) is Condition:
+            h, regex = c.header, c.mask & _REGEX_BIT
+        else:
+            h, regex = c['header'], 'R' in c['flags']
+        if regex and not _renders(c):
+            continue
+        if regex: required_exts.add("regex")
+        if h.lower() == '[body]': required_exts.add("body")
+    return required_exts
+
+def sieve_requires(rules):
     # Collect required extensions based on usage
-    required_exts = {"fileinto", "mailbox"}
-    
-    # Pre-scan for extensions
+    required_exts = set(BASE_REQUIRES)
     for rule in rules:
-        for c in rule['conditions']:
-            if 'R' in c['flags']: required_exts.add("regex")
-            if c['header'] == '[body]': required_exts.add("body")
-    
+        required_exts |= rule_requires(rule)
+    return required_exts
+
+def require_line(required_exts):
     # Sieveではダブルクォートを使用する必要がある（シングルクォートはエラー）
     dq = '"'
     exts_str = ', '.join(dq + ext + dq for ext in sorted(required_exts))
-    output.append(f'require [{exts_str}];\n')
-    
-    for i, rule in enumerate(rules):
-        folder = rule['folder']
-        conds = rule['conditions']
-        actions = rule['actions']
-        
-        # コメント用にルール名を決定
-        rule_name = folder if folder else "Action Only"
-        output.append(f"# {i+1}. {rule_name}")
-        
-        sieve_conds = []
-        for c in conds:
-            h = c['header']
-            v = c['value']
-            flags = c['flags']
-            
-            # ヘッダのマッピング
-            match_type = ":contains"
-            comparator = "" # デフォルト i;ascii-casemap (大文字小文字無視)
-            
-            # 大文字小文字区別: Becky 'I' は無視の意味。
-            # 'I' が無い場合は区別する。
-            if 'I' not in flags:
-                comparator = ' :comparator "i;octet"'
-            
-            # 値のエスケープ
-            v_escaped = v.replace('"', '\\"')
-            
-            if 'R' in flags:
-                match_type = ":regex"
-            elif 'T' in flags:
-                match_type = ":matches"
-                v_escaped = v_escaped + "*" 
-            
-            # 条件文字列の構築
-            # Sieve構文: test-name [flags] [match-type] [comparator] [args]
-            # header [match-type] [comparator] <headers> <keys>
-            # address [match-type] [comparator] [part] <headers> <keys>
-            # body [match-type] [comparator] [trans] <keys> (Extension)
-            
-            test_name = "header"
-            header_arg = ""
-            
-            if h.lower() == '[body]':
-                test_name = "body"
-                # Body はヘッダ引数なし
-            elif h.lower() in ['from', 'to', 'cc', 'bcc']:
-                test_name = "address"
-                header_arg = f'"{h}"'
-            else:
-                 # 汎用ヘッダ
-                 # 複数ヘッダの処理
-                 if ',' in h:
-                    hdrs = [x.strip() for x in h.split(',')]
-                    hdrs_str = ", ".join(f'"{hdr}"' for hdr in hdrs)
-                    header_arg = f'[{hdrs_str}]'
-                 else:
-                    header_arg = f'"{h}"'
-
-            # 行の構築: test :match :comparator (part) (headers) "key"
-            parts = [test_name]
-            
-            # マッチタイプ
-            parts.append(match_type)
-            
-            # コンパレーター
-            if comparator: parts.append(comparator.strip())
-            
-            # アドレス部分指定 (Beckyは明示的にサポートしていない、デフォルト全て？)
-            # Sieveのデフォルトは :all または状況依存。今はスキップ。
-            
-            # ヘッダリスト (body以外)
-            if header_arg:
-                parts.append(header_arg)
-            
-            # キー - リスト形式の値をSieveリストに変換
-            # 注: [WATCHDOG] のような単一値は配列ではなく文字列として扱う
-            # リストとして認識する条件: [...] で囲まれ、かつ内部に ", " が存在する
-            if v.startswith('[') and v.endswith(']') and '", "' in v:
-                inner = v[1:-1].strip()
-                elements = [e.strip().strip('"').strip() for e in inner.split(',')]
-                elements = [e for e in elements if e]
-                dq = '"'
-                key_str = '[' + ', '.join(dq + e + dq for e in elements) + ']'
-            else:
-                key_str = f'"{v_escaped}"'
-            parts.append(key_str)
-            
-            sieve_conds.append(" ".join(parts))
-        
-        if len(sieve_conds) == 0:
+    return f'require [{exts_str}];\n'
+
+def render_rule(i, rule, required=None):
+    # i 番目 (0 始まり) のルール 1 つ分のテキスト (コメント行と if ブロック、条件がなければコメント行のみ)
+    # スクリプトは require 行と各ルールのテキストを改行でつないだもの
+    # required (set) を渡すと、このルールが必要とする拡張を追加する
+    folder = rule['folder']
+    actions = rule['actions']
+
+    # コメント用にルール名を決定
+    rule_name = folder if folder else "Action Only"
+    output = [f"# {i+1}. {rule_name}"]
+
+    sieve_conds = []
+    for c in rule['conditions']:
+        try:
+            text, exts = _render_condition(c)
+        except RegexError as e:
+            # :regex は POSIX ERE だけを受け付けるため、書き換えられないパターンの条件は出力せず、
+            # コメントで残す (analyzer.regex_findings も invalid-regex として報告する)
+            output.append(f"# skipped condition: regex on {c['header']} is not valid POSIX ERE: {e}")
             continue
-            
-        # グルーピング (Beckyの一般的な使用法としてOR/anyofと仮定)
-        if len(sieve_conds) == 1:
-            cond_str = sieve_conds[0]
-        else:
-            joined = ",\n    ".join(sieve_conds)
-            cond_str = f"anyof (\n    {joined}\n)"
-            
-        output.append(f"if {cond_str} {{")
-        
-        if folder and folder != "Trash": 
-            output.append(f'    fileinto "{folder}";')
-        elif folder == "Trash":
-             # Trash は通常ゴミ箱へ移動または破棄
-             # SieveにTrashフォルダがあれば fileinto "Trash"
-             # "Delete from Server" (!D) の場合は discard
-             output.append(f'    fileinto "Trash";')
-             
-        for act in actions:
-            if act == 'discard':
-                output.append('    discard;')
-            elif act == 'keep':
-                output.append('    keep;')
-        
-        output.append("    stop;")
-        output.append("}\n")
-        
+        sieve_conds.append(text)
+        if exts and required is not None:
+            required |= exts
+
+    if len(sieve_conds) == 0:
+        return "\n".join(output)
+
+    # グルーピング (Beckyの一般的な使用法としてOR/anyofと仮定)
+    if len(sieve_conds) == 1:
+        cond_str = sieve_conds[0]
+    else:
+        joined = ",\n    ".join(sieve_conds)
+        cond_str = f"anyof (\n    {joined}\n)"
+
+    output.append(f"if {cond_str} {{")
+
+    if folder and folder != "Trash":
+        output.append(f'    fileinto {sieve_parser.quote(folder)};')
+    elif folder == "Trash":
+        # Trash は通常ゴミ箱へ移動または破棄
+        # SieveにTrashフォルダがあれば fileinto "Trash"
+        # "Delete from Server" (!D) の場合は discard
+        output.append(f'    fileinto "Trash";')
+
+    for act in actions:
+        if act == 'discard':
+            output.append('    discard;')
+        elif act == 'keep':
+            output.append('    keep;')
+
+    output.append("    stop;")
+    output.append("}\n")
     return "\n".join(output)
 
-def verify_conversion(original_rules, generated_sieve, mb_dir):
+def _iter_rule_chunks(rules, required=None, batch=BATCH_RULES):
+    # "\n" + ルールのテキスト を batch ルールずつまとめて返す
+    blocks = []
+    for i, rule in enumerate(rules):
+        blocks.append(render_rule(i, rule, required))
+        if len(blocks) >= batch:
+            yield "\n" + "\n".join(blocks)
+            blocks = []
+    if blocks:
+        yield "\n" + "\n".join(blocks)
+
+def write_sieve(rules, fp):
+    # rules_to_sieve_string と同じスクリプトを、1 つの文字列にまとめずに fp へ書き出す
+    # リストなどのシーケンスは、先に require だけを集計する (条件の描画はしない軽い走査)。
+    # イテレータの場合は require 行が最後まで決まらないため、ルールを描画しながら一時ファイルに書き、
+    # require 行を書いてからその内容を fp へ写す (ルールは 1 つずつしか保持しない)
+    if isinstance(rules, collections.abc.Sequence):
+        fp.write(require_line(sieve_requires(rules)))
+        for chunk in _iter_rule_chunks(rules):
+            fp.write(chunk)
+        return
+
+    required = set(BASE_REQUIRES)
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as body:
+        for chunk in _iter_rule_chunks(rules, required):
+            body.write(chunk)
+        body.seek(0)
+        fp.write(require_line(required))
+        shutil.copyfileobj(body, fp)
+
+def rules_to_sieve_string(rules):
+    # 文字列にまとめる場合は、描画しながら集めた拡張から require 行を作って先頭に付ける
+    required = set(BASE_REQUIRES)
+    body = "".join(_iter_rule_chunks(rules, required))
+    return require_line(required) + body
+
+def _renders(c):
+    # 条件を Sieve に書き出せるか (POSIX ERE にできない正規表現の条件は render_rule が書き出さない)
+    regex = c.mask & _REGEX_BIT if type(c) is Condition else 'R' in c['flags']
+    if not regex:
+        return True
+    try:
+        _render_condition(c)
+    except RegexError:
+        return False
+    return True
+
+def _sieve_rules(rules):
+    # Sieve に書き出されるルール (書き出せない条件を除き、条件が残らないルールは含めない)
+    # ラウンドトリップ検証で、Sieve から戻したルールと比べる相手
+    result = []
+    for rule in rules:
+        conditions = [c for c in rule['conditions'] if _renders(c)]
+        if len(conditions) == len(rule['conditions']):
+            result.append(rule)
+        elif conditions:
+            result.append({'folder': rule.get('folder'), 'actions': rule.get('actions', []),
+                           'conditions': conditions})
+    return result
+
+def verify_conversion(original_rules, generated_sieve, mb_dir, include=None):
+    # 生成した Sieve を再度ルール構造へパースし、正規形で比較する (mb_dir は互換のため残している)
+    # include: 分割したスクリプトの場合に、スクリプト名 -> 内容 を返す関数
+    # POSIX ERE にできない正規表現の条件は書き出さないため、比較の対象にしない (_sieve_rules)
     try:
         from . import sieve2becky
-        
-        # 生成されたSieveを再度ルール構造へパース
-        reverted_rules = sieve2becky.parse_sieve_content(generated_sieve)
-        
-        # 最小限の構造比較: (Folder, ConditionSet) のリスト
-        # 注: 条件の順序は変わる可能性がある。sieve2beckyはフォルダごとにブロックを作ると仮定。
-        # 長さと内容を大まかに比較。
-        
-        if len(original_rules) != len(reverted_rules):
-            print(f"検証失敗: ルール数の不一致。 元: {len(original_rules)}, 復元: {len(reverted_rules)}", file=sys.stderr)
-            return False
-            
-        # ランダムまたは全項目をチェック
-        for i, org in enumerate(original_rules):
-            rev = reverted_rules[i]
-            if org['folder'] != rev['folder']:
-                print(f"検証失敗 ルール #{i+1}: フォルダ不一致。 '{org['folder']}' vs '{rev['folder']}'", file=sys.stderr)
-                return False
-            # 条件チェック (緩やかに)
-            # スペースの正規化: "[ " -> "[", " ]" -> "]" など
-            def normalize_value(v):
-                import re
-                return re.sub(r'\[\s+', '[', re.sub(r'\s+\]', ']', v))
-            
-            org_conds = set((c['header'].lower(), normalize_value(c['value'])) for c in org['conditions'])
-            rev_conds = set((c['header'].lower(), normalize_value(c['value'])) for c in rev['conditions'])
-            # Sieveで引用符が変わったり結合されたりする可能性があるが、パーサが適切なら近い値が得られるはず。
-            if org_conds != rev_conds:
-                print(f"検証警告 ルール #{i+1}: 条件の不一致または順序変更。 \n元: {org_conds}\n復元: {rev_conds}", file=sys.stderr)
-                # 警告のみで続行?
-        
-        print("検証成功: ラウンドトリップテスト (Becky -> Sieve -> Becky構造) 完了。", file=sys.stderr)
-        return True
-        
+        reverted_rules = sieve2becky.parse_sieve_content(generated_sieve, include)
     except ImportError:
         print("検証スキップ: sieve2becky モジュールが見つかりません。", file=sys.stderr)
+        return None
     except Exception as e:
         print(f"検証中にエラーが発生しました: {e}", file=sys.stderr)
         return False
 
+    mismatches = verify.compare_rules(_sieve_rules(original_rules), reverted_rules)
+    for m in mismatches:
+        print(f"検証失敗 {verify.describe(m)}", file=sys.stderr)
+    if mismatches:
+        return False
+    print("検証成功: ラウンドトリップテスト (Becky -> Sieve -> Becky構造) 完了。", file=sys.stderr)
+    return True
+
 def main():
     import argparse
     parser = argparse.ArgumentParser(description='Convert Becky! IFilter.def to Sieve.')
     parser.add_argument('ifilter', nargs='?', default=r'f:\dev\miyabe-private\mail\work\45bee44e.mb\IFilter.def', help='Path to IFilter.def')
     parser.add_argument('--verify', action='store_true', help='Perform round-trip verification')
+    parser.add_argument('--optimize', action='store_true',
+                        help='Merge duplicate conditions and adjacent rules with the same destination')
     args = parser.parse_args()
     
     if os.path.exists(args.ifilter):
+        folder_map = build_folder_map(os.path.dirname(args.ifilter), cache_dir=default_cache_dir(), lazy=True)
         with open(args.ifilter, 'rb') as f:
-            content = f.read().decode('cp932', errors='replace')
-        
-        rules = parse_becky_content(content)
+            rules = list(iter_becky_rules(f, folder_map=folder_map))
+        if args.optimize:
+            # 検証は最適化後のルールに対して行う
+            rules = optimize_rules(rules)
         sieve_code = rules_to_sieve_string(rules)
         
         # Auto-verify if requested, or maybe always? User asked to "put a check".
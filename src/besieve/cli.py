@@ -0,0 +1,156 @@
+"""
+besieve コマンド
+
+変換したルールを手元のメールで検証するためのサブコマンドをまとめたものです。
+
+    besieve replay IFilter.def mail.mbox [Maildir ...] [-j 0]
+    besieve diff old/IFilter.def new.sieve mail.mbox [Maildir ...]
+    besieve profile IFilter.def mail.mbox --json hits.json --sieve annotated.sieve
+    besieve analyze IFilter.def
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from . import analyzer
+from . import profiler
+from . import replay
+from .folder_map import default_cache_dir
+from .sieve_parser import SieveSyntaxError
+
+def _cache_dir(args):
+    return None if args.no_cache else args.cache_dir
+
+def _add_cache_arguments(parser):
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                        help='Directory for cached mailbox folder listings')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use the cache directory')
+
+def _add_corpus_arguments(parser):
+    parser.add_argument('mailbox', nargs='+', help='mbox file or Maildir directory')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='Number of worker processes (0 = number of CPUs, default)')
+    parser.add_argument('--batch-size', type=int, default=replay.BATCH_SIZE,
+                        help='Messages handed to a worker at a time')
+    _add_cache_arguments(parser)
+
+def _load_rules(path, args):
+    # 正規表現として不正な条件はどのメッセージにも一致せず、ERE にできない条件は Sieve に書き出されないため、
+    # 結果の前に警告として知らせる (besieve analyze の invalid-regex と同じ)
+    rules = replay.load_rules(path, _cache_dir(args))
+    for f in analyzer.regex_findings(rules):
+        if f.kind == 'invalid-regex':
+            print(f"[WARN] {path}: {analyzer.format_finding(f)}", file=sys.stderr)
+    return rules
+
+def cmd_replay(args):
+    rules = _load_rules(args.rules, args)
+    start = time.perf_counter()
+    histogram, total = replay.replay(rules, args.mailbox, jobs=args.jobs, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+
+    for line in replay.format_histogram(histogram, total):
+        print(line)
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"[SUMMARY] {total} message(s), {len(rules)} rule(s), {elapsed:.1f}s ({rate:.0f} msg/s)",
+          file=sys.stderr)
+
+def cmd_diff(args):
+    old_rules = _load_rules(args.old, args)
+    new_rules = _load_rules(args.new, args)
+    changes, total = replay.diff(old_rules, new_rules, args.mailbox, jobs=args.jobs,
+                                 batch_size=args.batch_size, examples=args.examples)
+    for line in replay.format_diff(changes, examples=args.examples > 0):
+        print(line)
+    changed = sum(count for count, _ in changes.values())
+    print(f"[SUMMARY] {changed}/{total} message(s) would be routed differently", file=sys.stderr)
+
+def cmd_profile(args):
+    rules = _load_rules(args.rules, args)
+    stats = profiler.profile(rules, args.mailbox, jobs=args.jobs, batch_size=args.batch_size)
+    result = profiler.report(rules, stats)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+    if args.sieve:
+        with open(args.sieve, 'w', encoding='utf-8') as f:
+            f.write(profiler.annotate_sieve(rules, stats))
+
+    print(f"{'rule':>6}  {'matched':>8}  {'tested':>8}  {'shadowed':>8}  folder")
+    entries = sorted(result['rules'], key=lambda e: (-e['matched'], e['rule']))
+    for e in entries[:args.top] if args.top else entries:
+        print(f"{e['rule']:6d}  {e['matched']:8d}  {e['tested']:8d}  {e['shadowed']:8d}  "
+              f"{e['folder'] or ', '.join(e['actions'])}")
+    for key, seconds in result['condition_time'].items():
+        print(f"[TIME] {key}: {seconds:.3f}s", file=sys.stderr)
+    dead = [e for e in result['rules'] if e['dead']]
+    shadowed = [e for e in dead if e['shadowed']]
+    print(f"[SUMMARY] {result['messages']} message(s), {len(dead)}/{len(rules)} rule(s) never fired "
+          f"({len(shadowed)} shadowed by an earlier stop)", file=sys.stderr)
+
+def cmd_analyze(args):
+    rules = replay.load_rules(args.rules, _cache_dir(args))
+    start = time.perf_counter()
+    findings = analyzer.analyze(rules)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump([f._asdict() for f in findings], f, ensure_ascii=False, indent=1)
+    for f in findings:
+        print(analyzer.format_finding(f))
+    dead = sum(1 for f in findings if f.kind.endswith('-rule'))
+    print(f"[SUMMARY] {len(findings)} finding(s), {dead}/{len(rules)} rule(s) never fire or duplicate "
+          f"an earlier rule ({elapsed:.2f}s)", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='besieve', description='Test Becky!/Sieve rules against local mail.')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    p = sub.add_parser('replay', help='Route a mailbox through a rule set and print a folder histogram')
+    p.add_argument('rules', help='IFilter.def or .sieve file')
+    _add_corpus_arguments(p)
+    p.set_defaults(func=cmd_replay)
+
+    p = sub.add_parser('diff', help='Report messages whose destination differs between two rule sets')
+    p.add_argument('old', help='Current IFilter.def or .sieve file')
+    p.add_argument('new', help='Edited IFilter.def or .sieve file')
+    _add_corpus_arguments(p)
+    p.add_argument('--examples', type=int, default=5,
+                   help='Example messages to list per change (0 = counts only)')
+    p.set_defaults(func=cmd_diff)
+
+    p = sub.add_parser('profile', help='Count rule hits and find rules that never fire')
+    p.add_argument('rules', help='IFilter.def or .sieve file')
+    _add_corpus_arguments(p)
+    p.add_argument('--json', help='Write per-rule statistics to this JSON file')
+    p.add_argument('--sieve', help='Write a Sieve script annotated with hit counts to this file')
+    p.add_argument('--top', type=int, default=20, help='Rules to list (0 = all)')
+    p.set_defaults(func=cmd_profile)
+
+    p = sub.add_parser('analyze', help='Find shadowed, duplicate and subsumed rules without any mail')
+    p.add_argument('rules', help='IFilter.def or .sieve file')
+    _add_cache_arguments(p)
+    p.add_argument('--json', help='Write the findings to this JSON file')
+    p.set_defaults(func=cmd_analyze)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'jobs', 1) == 0:
+        args.jobs = os.cpu_count() or 1
+    try:
+        args.func(args)
+    except SieveSyntaxError as e:
+        print(f"[ERROR] Sieve syntax error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+変換結果のキャッシュ (内容アドレス)
+
+部署単位で配布したテンプレートのルールなど、同じ内容の IFilter.def / Sieve スクリプトを持つ
+アカウントは多く、同じ変換 (parse_becky_content -> rules_to_sieve_string、
+parse_sieve_content -> generate_becky_string) を何度も繰り返しています。
+
+変換元のバイト列のハッシュ、フォルダー構成のフィンガープリント、変換結果のバージョン (CONVERTER_VERSION)、
+出力に影響する変換オプションからキーを作り、変換結果をキャッシュディレクトリに保存します。
+同じ入力は 1 回の実行の中でも、次回以降の実行でも 1 回だけ変換されます。
+
+キャッシュは合計サイズの上限を超えると、最後に使われてから最も時間のたったエントリから削除します
+(使われたエントリは mtime を更新する)。キャッシュに読み書きできなくても変換は続行します。
+"""
+
+import hashlib
+import json
+import os
+
+from .sync_state import CONVERTER_VERSION
+
+# キャッシュのエントリの形式のバージョン。変換結果が変わる変更では sync_state.CONVERTER_VERSION を上げる
+# (キーに含めるため、古い変換結果のエントリは使われなくなる)
+CACHE_VERSION = 1
+
+# キャッシュの合計サイズの既定の上限 (バイト)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, 'conversions', f'{key}.json')
+
+def cache_key(direction, source_hash, folder_fingerprint=None, settings=None):
+    # direction: 'to-sieve' / 'to-becky', source_hash: 変換元のバイト列の sha256
+    # folder_fingerprint: FolderMap.fingerprint(), settings: 出力に影響する変換オプション (dict)
+    material = json.dumps([CACHE_VERSION, CONVERTER_VERSION, direction, source_hash,
+                           folder_fingerprint, settings], sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def _file_hash(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def lookup(cache_dir, key, verified=True, base_dir=None):
+    # キャッシュされた変換結果 (dict: 'output', 'warnings', 'dependencies', 'verified')、なければ None
+    # verified=True なら、ラウンドトリップテストを通った結果だけを返す
+    # dependencies (include したスクリプトなど) は base_dir からの相対パスで、内容が変わっていれば使わない
+    path = cache_path(cache_dir, key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get('version') != CACHE_VERSION or entry.get('key') != key:
+        return None
+    if verified and not entry.get('verified'):
+        return None
+    for rel, expected in entry.get('dependencies', ()):
+        if _file_hash(os.path.join(base_dir or '', rel)) != expected:
+            return None
+    try:
+        # LRU の順序は mtime で管理する
+        os.utime(path)
+    except OSError:
+        pass
+    return entry
+
+def store(cache_dir, key, output, verified, warnings=(), dependencies=(), base_dir=None,
+          max_bytes=DEFAULT_MAX_BYTES):
+    # 変換結果を保存し、上限を超えた分を古いものから削除する
+    # dependencies: 変換で読んだファイル (変換元以外) のパスのリスト
+    entry = {
+        'version': CACHE_VERSION,
+        'key': key,
+        'verified': bool(verified),
+        'warnings': list(warnings),
+        'dependencies': [[os.path.relpath(p, base_dir or os.curdir), _file_hash(p)] for p in dependencies],
+        'output': output,
+    }
+    data = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+    if len(data) > max_bytes:
+        return False
+    path = cache_path(cache_dir, key)
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        return False # キャッシュに書けなくても変換は続行する
+    evict(cache_dir, max_bytes)
+    return True
+
+def evict(cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    # 合計サイズが max_bytes 以下になるまで、最も古く使われたエントリを削除する
+    # 戻り値は削除したエントリ数
+    directory = os.path.join(cache_dir, 'conversions')
+    entries = []
+    total = 0
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, entry.name, st.st_size))
+                total += st.st_size
+    except OSError:
+        return 0
+    removed = 0
+    entries.sort()
+    for _, name, size in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            continue # 他のプロセスが先に削除した
+        total -= size
+        removed += 1
+    return removed
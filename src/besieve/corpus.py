@@ -0,0 +1,94 @@
+"""
+メッセージコーパスの読み込み
+
+mbox ファイルと Maildir ディレクトリから 1 通ずつメッセージを取り出します。
+全体をメモリに読み込まず、本文を使わない場合はヘッダー部分だけを読みます。
+"""
+
+import os
+
+HEADER_READ_SIZE = 8192
+
+def _header_end(data):
+    # ヘッダーと本文の区切り (空行) の直後の位置。見つからなければ -1
+    best = -1
+    for sep in (b'\r\n\r\n', b'\n\n'):
+        i = data.find(sep)
+        if i != -1 and (best == -1 or i + len(sep) < best):
+            best = i + len(sep)
+    return best
+
+def iter_mbox(path, headers_only=False):
+    # mbox (mboxo / mboxrd) の各メッセージを bytes で返す
+    # 区切りは空行 (またはファイル先頭) の直後の "From " 行。本文の ">From " は 1 段戻す
+    with open(path, 'rb') as f:
+        lines = []
+        started = False
+        in_headers = True
+        prev_blank = True
+        for line in f:
+            if prev_blank and line.startswith(b'From '):
+                if started:
+                    yield b''.join(lines)
+                lines = []
+                started = True
+                in_headers = True
+                prev_blank = False
+                continue
+            blank = line in (b'\n', b'\r\n')
+            if in_headers:
+                lines.append(line)
+                if blank:
+                    in_headers = False
+            elif not headers_only:
+                if line.startswith(b'>') and line.lstrip(b'>').startswith(b'From '):
+                    line = line[1:]
+                lines.append(line)
+            prev_blank = blank
+        if started:
+            yield b''.join(lines)
+
+def iter_maildir(path):
+    # Maildir の new/ と cur/ のメッセージファイルのパスを名前順に返す
+    for sub in ('new', 'cur'):
+        directory = os.path.join(path, sub)
+        try:
+            with os.scandir(directory) as it:
+                names = sorted(e.name for e in it if not e.name.startswith('.') and e.is_file())
+        except FileNotFoundError:
+            continue
+        for name in names:
+            yield os.path.join(directory, name)
+
+def read_message(item, headers_only=False):
+    # iter_corpus の要素 (bytes または Maildir のファイルパス) をメッセージの bytes にする
+    if isinstance(item, bytes):
+        return item
+    with open(item, 'rb') as f:
+        if not headers_only:
+            return f.read()
+        data = b''
+        while True:
+            chunk = f.read(HEADER_READ_SIZE)
+            data += chunk
+            end = _header_end(data)
+            if end != -1:
+                return data[:end]
+            if not chunk:
+                return data
+
+def is_maildir(path):
+    return os.path.isdir(os.path.join(path, 'cur')) or os.path.isdir(os.path.join(path, 'new'))
+
+def iter_corpus(paths, headers_only=False):
+    # (ラベル, 要素) を返す。mbox の要素はメッセージの bytes、Maildir はファイルパス
+    # (Maildir はワーカープロセス側で read_message により読み込む)
+    for path in paths:
+        if os.path.isdir(path):
+            if not is_maildir(path):
+                raise ValueError(f"not a Maildir directory: {path}")
+            for file_path in iter_maildir(path):
+                yield os.path.relpath(file_path, path), file_path
+        else:
+            for i, data in enumerate(iter_mbox(path, headers_only)):
+                yield f"{os.path.basename(path)}#{i + 1}", data
@@ -0,0 +1,271 @@
+"""
+ルールのローカル評価
+
+parse_becky_content / parse_sieve_content が返すルール構造を RFC 5322 メッセージに適用し、
+メッセージごとの実行アクションを返します。デプロイ前にメールボックスを再生して、
+振り分け結果を確認するために使います。
+
+評価は rules_to_sieve_string が生成する Sieve と同じ意味になるように行います。
+- ルール内の条件は OR (anyof)
+- From/To/Cc/Bcc は address テスト (:all)、[body] は body テスト (:text)、それ以外は header テスト
+- フラグ R は :regex (regex_dialect.compile_regex でコンパイル)、T は :matches (値の末尾に '*')、それ以外は :contains
+  (不正な正規表現の条件は一致しない。besieve replay / diff / profile は invalid-regex の警告を出す)
+- フラグ I があれば i;ascii-casemap、なければ i;octet
+- 一致したルールは fileinto (フォルダー指定時) と discard/keep を実行し、stop で終了する
+  (Sieve から読み込んだルールで stop がない分岐は 'stop': False)
+
+アクションは ('fileinto', フォルダー) / ('keep',) / ('discard',) のタプルです。
+"""
+
+import email
+import email.policy
+import re
+from email.header import decode_header, make_header
+from email.utils import getaddresses
+from functools import lru_cache
+
+from .regex_dialect import compile_regex
+from .verify import is_list_value, split_list_value
+
+ADDRESS_HEADERS = frozenset(['from', 'to', 'cc', 'bcc'])
+BODY_HEADER = '[body]'
+
+_ASCII_LOWER = {c: c + 32 for c in range(ord('A'), ord('Z') + 1)}
+
+def ascii_lower(s):
+    # i;ascii-casemap: ASCII の英字だけを小文字にする (全角英字などはそのまま)
+    return s.lower() if s.isascii() else s.translate(_ASCII_LOWER)
+
+# --- メッセージ ---
+
+def _decode_header_value(value):
+    # RFC 2047 の encoded-word をデコードする (折り返しは分割時に取り除いてある)
+    if '=?' in value:
+        try:
+            value = str(make_header(decode_header(value)))
+        except (LookupError, ValueError, UnicodeError):
+            pass
+    return value.strip()
+
+class MessageView:
+    # 生のメッセージ (bytes) を必要な部分だけ解析するビュー
+    # ヘッダーは最初の参照時に 1 回だけ分割し、デコードは参照されたヘッダーだけ行う。
+    # 本文 (MIME の解析) は body テストが評価されたときだけ行う。
+    # wanted (小文字のヘッダー名の集合) を指定すると、それ以外のヘッダーは保持しない
+    __slots__ = ('raw', 'wanted', '_headers', '_decoded', '_addresses', '_body')
+
+    def __init__(self, raw, wanted=None):
+        if isinstance(raw, str):
+            raw = raw.encode('utf-8', errors='surrogateescape')
+        self.raw = raw
+        self.wanted = wanted
+        self._headers = None
+        self._decoded = {}
+        self._addresses = {}
+        self._body = None
+
+    def _split_headers(self):
+        raw = self.raw
+        end = len(raw)
+        for sep in (b'\r\n\r\n', b'\n\n'):
+            i = raw.find(sep)
+            if i != -1 and i < end:
+                end = i
+        block = raw[:end].decode('utf-8', errors='replace')
+        headers = {}
+        wanted = self.wanted
+        name = None
+        for line in block.splitlines():
+            if not line:
+                continue
+            if line[0] in ' \t':
+                # 折り返し行 (CRLF を取り除いて前の行につなげる)
+                if name is not None:
+                    values = headers[name]
+                    values[-1] = values[-1] + line
+                continue
+            colon = line.find(':')
+            if colon <= 0:
+                name = None # mbox の "From " 行など
+                continue
+            name = line[:colon].strip().lower()
+            if wanted is not None and name not in wanted:
+                name = None
+                continue
+            headers.setdefault(name, []).append(line[colon + 1:])
+        self._headers = headers
+
+    def raw_headers(self, name):
+        if self._headers is None:
+            self._split_headers()
+        return self._headers.get(name.lower(), ())
+
+    def header(self, name):
+        # デコード済みのヘッダー値のリスト (同名ヘッダーが複数あればすべて)
+        name = name.lower()
+        values = self._decoded.get(name)
+        if values is None:
+            values = [_decode_header_value(v) for v in self.raw_headers(name)]
+            self._decoded[name] = values
+        return values
+
+    def addresses(self, name):
+        # address テスト (:all) の対象: "local@domain" のリスト
+        name = name.lower()
+        values = self._addresses.get(name)
+        if values is None:
+            values = [addr for _, addr in getaddresses(self.header(name)) if addr]
+            self._addresses[name] = values
+        return values
+
+    def body(self):
+        # body テスト (:text) の対象: text/* パートごとのデコード済みテキストのリスト
+        if self._body is None:
+            self._body = _text_parts(self.raw)
+        return self._body
+
+def _text_parts(raw):
+    msg = email.message_from_bytes(raw, policy=email.policy.default)
+    parts = []
+    for part in msg.walk():
+        if part.get_content_maintype() != 'text':
+            continue
+        try:
+            parts.append(part.get_content())
+        except (LookupError, ValueError, UnicodeError, AssertionError):
+            payload = part.get_payload(decode=True) or b''
+            parts.append(payload.decode('utf-8', errors='replace'))
+    return parts
+
+# --- 比較 ---
+
+_WILDCARD_RE = re.compile(r'\\(.)|(\*)|(\?)|([^\\*?]+)', re.S)
+
+def wildcard_to_regex(pattern):
+    # :matches のワイルドカード ('*', '?', '\' によるエスケープ) を正規表現に変換する
+    out = []
+    for m in _WILDCARD_RE.finditer(pattern):
+        escaped, star, question, literal = m.groups()
+        if star:
+            out.append('.*')
+        elif question:
+            out.append('.')
+        else:
+            out.append(re.escape(escaped if escaped is not None else literal))
+    return ''.join(out) + r'\Z'
+
+@lru_cache(maxsize=4096)
+def compile_matches(pattern, fold):
+    # ascii-casemap は re.ASCII | re.IGNORECASE で ASCII の英字だけを同一視できる
+    flags = re.S | (re.ASCII | re.IGNORECASE if fold else 0)
+    return re.compile(wildcard_to_regex(pattern), flags)
+
+def _contains_matcher(keys, fold):
+    if fold:
+        keys = [ascii_lower(k) for k in keys]
+        return lambda value: any(k in ascii_lower(value) for k in keys)
+    return lambda value: any(k in value for k in keys)
+
+def _pattern_matcher(patterns, method):
+    patterns = [p for p in patterns if p is not None]
+    if method == 'search':
+        return lambda value: any(p.search(value) for p in patterns)
+    return lambda value: any(p.match(value) for p in patterns)
+
+def condition_keys(cond):
+    value = cond['value']
+    return split_list_value(value) if is_list_value(value) else [value]
+
+def compile_condition(cond):
+    # (対象の種類, ヘッダー名のタプル, 値 1 つに対する判定関数)
+    header = cond['header']
+    flags = cond.get('flags', ['I'])
+    fold = 'I' in flags
+    keys = condition_keys(cond)
+
+    if 'R' in flags:
+        test = _pattern_matcher([compile_regex(k, fold) for k in keys], 'search')
+    elif 'T' in flags:
+        test = _pattern_matcher([compile_matches(k + '*', fold) for k in keys], 'match')
+    else:
+        test = _contains_matcher(keys, fold)
+
+    kind, names = condition_target(header)
+    return kind, names, test
+
+def condition_target(header):
+    # 条件のヘッダー名 -> (対象の種類, 小文字のヘッダー名のタプル)
+    lower = header.lower()
+    if lower == BODY_HEADER:
+        return 'body', ()
+    if lower in ADDRESS_HEADERS:
+        return 'address', (lower,)
+    return 'header', tuple(h.strip().lower() for h in header.split(',') if h.strip())
+
+def target_values(message, kind, name):
+    # 対象 1 つ分の値のリスト
+    if kind == 'body':
+        return message.body()
+    if kind == 'address':
+        return message.addresses(name)
+    return message.header(name)
+
+def _values(message, kind, names):
+    if kind == 'body':
+        return message.body()
+    return [v for name in names for v in target_values(message, kind, name)]
+
+def condition_matches(message, compiled):
+    kind, names, test = compiled
+    for value in _values(message, kind, names):
+        if test(value):
+            return True
+    return False
+
+def rule_actions(rule):
+    # 一致したときに実行するアクションのリスト
+    actions = []
+    folder = rule.get('folder')
+    if folder:
+        actions.append(('fileinto', folder))
+    for act in rule.get('actions', ()):
+        if act in ('discard', 'keep'):
+            actions.append((act,))
+    return actions
+
+def finish_actions(actions):
+    # 重複を除き、暗黙の keep (fileinto / discard / keep がなければ keep) を加える
+    result = []
+    for act in actions:
+        if act not in result:
+            result.append(act)
+    if not result:
+        result.append(('keep',))
+    return result
+
+class Evaluator:
+    # ルールを 1 回だけコンパイルし、メッセージごとに順に評価する
+    def __init__(self, rules):
+        self.rules = [([compile_condition(c) for c in rule['conditions']],
+                       rule_actions(rule), rule.get('stop', True))
+                      for rule in rules if rule['conditions']]
+
+    def matching_rules(self, message):
+        # 一致したルールの番号 (0 始まり、コンパイル後の順) を実行順に返す
+        if not isinstance(message, MessageView):
+            message = MessageView(message)
+        for i, (conditions, _, stop) in enumerate(self.rules):
+            if any(condition_matches(message, c) for c in conditions):
+                yield i
+                if stop:
+                    return
+
+    def evaluate(self, message):
+        actions = []
+        for i in self.matching_rules(message):
+            actions.extend(self.rules[i][1])
+        return finish_actions(actions)
+
+def evaluate(rules, message):
+    # ルール構造を 1 通のメッセージ (bytes / str / MessageView) に適用する
+    return Evaluator(rules).evaluate(message)
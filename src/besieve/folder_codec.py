@@ -0,0 +1,110 @@
+"""
+Becky! フォルダー名のエンコード・デコード
+
+Becky! の IMAP フォルダーファイル名 (Modified UTF-7, RFC 3501) と
+Sieve の論理フォルダー名 (例: INBOX.印刷) を相互に変換します。
+"""
+
+import base64
+import re
+from functools import lru_cache
+
+# 同じ !M: ターゲットが何度も現れるため、生のパスをキーにキャッシュする
+FOLDER_CACHE_SIZE = 8192
+
+_B64_RUN_RE = re.compile(r'&([^-]*)(-?)')
+_ENCODE_RUN_RE = re.compile(r'&|[^\x20-\x25\x27-\x7e]+')
+_INBOX_RE = re.compile(r'(?:#|^)(INBOX\[[0-9a-fA-F]+\])(?:\.(.*))?$')
+_INDEX_SUFFIX_RE = re.compile(r'\[[0-9a-fA-F]+\]$')
+
+# ローカルフォルダー (ディレクトリ) のうち、先頭に '!' が付く特殊フォルダー
+SPECIAL_FOLDERS = {
+    'inbox': 'INBOX',
+    'outbox': 'Outbox',
+    'sent': 'Sent',
+    'drafts': 'Drafts',
+    'trash': 'Trash',
+    'junk': 'Junk',
+}
+
+def _decode_run(m):
+    b64 = m.group(1)
+    if not b64:
+        # "&-" は '&' そのもの。末尾の '&' 単独は捨てる
+        return '&' if m.group(2) else ''
+    b64 = b64.replace(',', '/')
+    b64 += '=' * (-len(b64) % 4)
+    try:
+        return base64.b64decode(b64).decode('utf-16-be')
+    except Exception:
+        return f"&{b64}-" # 失敗時のフォールバック
+
+# Modified UTF-7 (IMAPフォルダ名) をデコードする
+def modified_utf7_decode(s):
+    if '&' not in s:
+        return s
+    return _B64_RUN_RE.sub(_decode_run, s)
+
+def _encode_run(m):
+    run = m.group(0)
+    if run == '&':
+        return '&-'
+    b64 = base64.b64encode(run.encode('utf-16-be')).decode('ascii')
+    return '&' + b64.rstrip('=').replace('/', ',') + '-'
+
+# Modified UTF-7 (IMAPフォルダ名) にエンコードする
+def modified_utf7_encode(s):
+    # 印字可能 ASCII ('&' を除く) はそのまま、それ以外の連続部分を base64 にまとめる
+    return _ENCODE_RUN_RE.sub(_encode_run, s)
+
+def _decode_directory_path(components):
+    # ディレクトリ形式のフォルダー (例: 45bee44e.mb\!!!!Inbox\Work\) -> INBOX.Work
+    for i in range(len(components) - 1, -1, -1):
+        if components[i].lower().endswith('.mb'):
+            components = components[i + 1:]
+            break
+    decoded_parts = []
+    for part in components:
+        if part.startswith('!'):
+            part = part.lstrip('!')
+            special = SPECIAL_FOLDERS.get(part.lower())
+            if special:
+                decoded_parts.append(special)
+                continue
+        decoded = modified_utf7_decode(_INDEX_SUFFIX_RE.sub('', part))
+        if decoded:
+            decoded_parts.append(decoded)
+    return ".".join(decoded_parts)
+
+@lru_cache(maxsize=FOLDER_CACHE_SIZE)
+def decode_folder_path(raw_path):
+    raw_path = raw_path.replace('\\', '/')
+    if raw_path.endswith('/'):
+        return _decode_directory_path([c for c in raw_path.split('/') if c])
+    filename = raw_path.split('/')[-1]
+
+    # 特殊ケース
+    if '!Trash' in raw_path:
+        return "Trash"
+
+    if filename.endswith('.ini'):
+        filename = filename[:-4]
+
+    match = _INBOX_RE.search(filename)
+    if match:
+        parts = ["INBOX"]
+        rest = match.group(2)
+        if rest:
+            parts.extend(rest.split('.'))
+    else:
+        parts = filename.split('.')
+
+    decoded_parts = []
+    for part in parts:
+        part = _INDEX_SUFFIX_RE.sub('', part)
+        decoded = modified_utf7_decode(part)
+        if not decoded or decoded.startswith('#'):
+            continue # デコード失敗または無効な部分をスキップ
+        decoded_parts.append(decoded)
+
+    return ".".join(decoded_parts)
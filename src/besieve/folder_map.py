@@ -0,0 +1,252 @@
+"""
+Becky! メールボックス (.mb) のフォルダーマップ
+
+論理フォルダー名 (例: INBOX.印刷) から Becky! の物理パス
+(例: 45bee44e.mb\\#account#INBOX[1f].&U3BSNw-[3a].ini) への対応表を作ります。
+
+IMAP フォルダー (*.ini) に加えて、!!!!Inbox や !Trash などのローカルフォルダー
+(ディレクトリ) も入れ子を含めてたどり、物理パスから論理フォルダー名への逆引きも提供します。
+
+ネットワーク共有上の数千フォルダーの一覧取得は遅いため、一覧をユーザーキャッシュ
+ディレクトリに保存し、いずれかのディレクトリの mtime が変わったときだけ取り直します。
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+from collections.abc import Mapping
+
+from .folder_codec import decode_folder_path
+
+CACHE_VERSION = 2
+
+# ローカルフォルダー内の設定ファイル (フォルダーではない)
+FOLDER_SETTINGS_FILE = 'folder.ini'
+
+# mtime の分解能が粗いファイルシステム (FAT: 2秒, SMB) では、mtime と同じ時刻内の
+# 変更を見逃す可能性がある。キャッシュ作成時刻が mtime からこの秒数以内なら再確認する
+RACY_WINDOW_NS = 2 * 10**9
+
+def default_cache_dir():
+    env = os.environ.get('BESIEVE_CACHE_DIR')
+    if env:
+        return env
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        return os.path.join(base, 'besieve', 'Cache')
+    if sys.platform == 'darwin':
+        return os.path.join(os.path.expanduser('~'), 'Library', 'Caches', 'besieve')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'besieve')
+
+def _cache_path(cache_dir, work_dir):
+    key = hashlib.sha1(os.path.abspath(work_dir).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'folder-maps', f'{key}.json')
+
+def _rel_join(rel, name):
+    return f"{rel}\\{name}" if rel else name
+
+def _scan(work_dir):
+    # .mb 以下を os.scandir で再帰的にたどる
+    # 戻り値: (エントリのリスト, {相対ディレクトリ: mtime_ns})
+    # エントリは .mb からの相対パス ('\\' 区切り)。IMAP フォルダーは *.ini ファイル、
+    # ローカルフォルダー (!!!!Inbox, !Trash など) は末尾に '\\' を付けたディレクトリ
+    entries = []
+    dirs = {'': os.stat(work_dir).st_mtime_ns}
+    stack = ['']
+    while stack:
+        rel = stack.pop()
+        full = os.path.join(work_dir, *rel.split('\\')) if rel else work_dir
+        files = set()
+        subdirs = []
+        try:
+            with os.scandir(full) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if is_dir:
+                        subdirs.append(entry)
+                    elif entry.name.endswith('.ini'):
+                        files.add(entry.name)
+        except OSError:
+            continue # 途中で消えたディレクトリは無視する
+        for name in files:
+            if name.lower() != FOLDER_SETTINGS_FILE:
+                entries.append(_rel_join(rel, name))
+        for entry in subdirs:
+            sub = _rel_join(rel, entry.name)
+            # '#' で始まるディレクトリ (IMAP アカウント) と、同名の .ini を持つ
+            # IMAP フォルダーの保存先ディレクトリはフォルダーそのものではない
+            if not entry.name.startswith('#') and f"{entry.name}.ini" not in files:
+                entries.append(sub + '\\')
+            try:
+                dirs[sub] = entry.stat(follow_symlinks=False).st_mtime_ns
+            except OSError:
+                continue
+            stack.append(sub)
+    entries.sort()
+    return entries, dirs
+
+def _dirs_unchanged(work_dir, dirs, checked_ns):
+    # 記録したすべてのディレクトリの mtime が同じで、かつ十分古ければ True
+    # フォルダーの追加・削除・名前変更は親ディレクトリの mtime に現れる
+    for rel, mtime_ns in dirs.items():
+        full = os.path.join(work_dir, *rel.split('\\')) if rel else work_dir
+        try:
+            st = os.stat(full)
+        except OSError:
+            return False
+        if st.st_mtime_ns != mtime_ns or checked_ns - mtime_ns <= RACY_WINDOW_NS:
+            return False
+    return True
+
+def _load_cache(path, work_dir):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+        return None
+    if data.get('dir') != os.path.abspath(work_dir):
+        return None
+    return data
+
+def _save_cache(path, data):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        pass # キャッシュに書けなくても変換は続行する
+
+def list_folder_files(work_dir, cache_dir=None):
+    # .mb 以下のフォルダーのエントリ (相対パス) のリストを返す
+    # cache_dir を指定した場合は一覧とディレクトリごとの mtime をキャッシュし、
+    # どのディレクトリの mtime も変わっていなければ stat だけで再利用する。
+    # キャッシュ自体は .mb の外に置く (.mb 内に書くとディレクトリの mtime が変わってしまうため)
+    if not os.path.isdir(work_dir):
+        return []
+    if not cache_dir:
+        return _scan(work_dir)[0]
+
+    path = _cache_path(cache_dir, work_dir)
+    cached = _load_cache(path, work_dir)
+    if cached and _dirs_unchanged(work_dir, cached.get('dirs', {}), cached.get('checked_ns', 0)):
+        return cached['entries']
+
+    # 変更された (または mtime が信用できない) 場合は一覧を取り直す
+    checked_ns = time.time_ns()
+    entries, dirs = _scan(work_dir)
+    _save_cache(path, {
+        'version': CACHE_VERSION,
+        'dir': os.path.abspath(work_dir),
+        'dirs': dirs,
+        'checked_ns': checked_ns,
+        'entries': entries,
+    })
+    return entries
+
+def _physical_prefix(work_dir):
+    return os.path.basename(os.path.normpath(work_dir))
+
+def _fingerprint(prefix, entries):
+    # フォルダー構成のハッシュ (変換結果のキャッシュのキーに使う)
+    h = hashlib.sha256(prefix.encode('utf-8', errors='surrogatepass'))
+    for rel in entries:
+        h.update(b'\0' + rel.encode('utf-8', errors='surrogatepass'))
+    return h.hexdigest()
+
+def _physical_key(physical):
+    # IFilter.def 中の表記ゆれ ('/' 区切り、大文字小文字) を吸収した逆引き用のキー
+    return physical.replace('/', '\\').lower()
+
+class FolderMap(dict):
+    # 論理フォルダー名 -> 物理パスの dict に、物理パス -> 論理フォルダー名の逆引きを加えたもの
+    def __init__(self, work_dir, entries):
+        super().__init__()
+        self.prefix = _physical_prefix(work_dir)  # .mb ディレクトリ名 (物理パスの先頭)
+        self.entries = entries
+        self.logical = {}
+        for rel in entries:
+            physical = f"{self.prefix}\\{rel}"
+            name = decode_folder_path(physical)
+            self[name] = physical
+            self.logical[_physical_key(physical)] = name
+
+    def to_logical(self, physical):
+        # 物理パス (!M: の値) -> 論理フォルダー名。一覧にないパスはその場でデコードする
+        name = self.logical.get(_physical_key(physical))
+        return name if name is not None else decode_folder_path(physical)
+
+    def fingerprint(self):
+        return _fingerprint(self.prefix, self.entries)
+
+class LazyFolderMap(Mapping):
+    # 参照された論理フォルダーだけを解決するフォルダーマップ
+    # パスは必要になるまでデコードせず、各パスは高々 1 回だけデコードする
+    def __init__(self, work_dir, entries):
+        self.prefix = _physical_prefix(work_dir)
+        # 同じ論理名が複数ある場合は FolderMap と同じく後のものを優先するため逆順に探す
+        self._entries = entries
+        self._pending = list(entries)
+        self._resolved = {}
+        self._physical = None
+        self._logical = {}  # 逆引きキー -> デコード済みの論理フォルダー名
+
+    def _decode_until(self, logical):
+        while self._pending:
+            physical = f"{self.prefix}\\{self._pending.pop()}"
+            name = decode_folder_path(physical)
+            if name not in self._resolved:
+                self._resolved[name] = physical
+            if name == logical:
+                return True
+        return False
+
+    def __getitem__(self, logical):
+        if logical in self._resolved or self._decode_until(logical):
+            return self._resolved[logical]
+        raise KeyError(logical)
+
+    def __iter__(self):
+        self._decode_until(None)
+        return iter(self._resolved)
+
+    def __len__(self):
+        self._decode_until(None)
+        return len(self._resolved)
+
+    def to_logical(self, physical):
+        # 逆引き表はデコードせずに作れるので、最初の呼び出しでまとめて作る
+        # 一覧にあるパスは最初に引かれたときだけデコードし、以降は辞書引きだけで返す
+        key = _physical_key(physical)
+        name = self._logical.get(key)
+        if name is not None:
+            return name
+        if self._physical is None:
+            self._physical = {_physical_key(f"{self.prefix}\\{rel}"): f"{self.prefix}\\{rel}"
+                              for rel in self._entries}
+        listed = self._physical.get(key)
+        if listed is None:
+            return decode_folder_path(physical)
+        name = self._logical[key] = decode_folder_path(listed)
+        return name
+
+    def fingerprint(self):
+        # フォルダー名をデコードせずに求める
+        return _fingerprint(self.prefix, self._entries)
+
+def build_folder_map(work_dir, cache_dir=None, lazy=False):
+    # 論理フォルダー名 -> 物理パス (逆引きは to_logical)
+    # lazy=True の場合は参照されたフォルダーだけをデコードする LazyFolderMap を返す
+    entries = list_folder_files(work_dir, cache_dir)
+    if lazy:
+        return LazyFolderMap(work_dir, entries)
+    return FolderMap(work_dir, entries)
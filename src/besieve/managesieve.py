@@ -0,0 +1,347 @@
+"""
+ManageSieve (RFC 5804) によるスクリプトのアップロード
+
+sync-rules to-sieve で書き出したスクリプトをサーバーへ送ります。
+- サーバーごとに認証済みの接続をプールし、アカウントが変わっても UNAUTHENTICATE で
+  同じ接続を使い回す (サーバーが対応していない場合だけ接続し直す)
+- 1 アカウント分の LISTSCRIPTS/GETSCRIPT、CHECKSCRIPT、PUTSCRIPT/SETACTIVE は
+  それぞれまとめて送り (パイプライン)、応答をまとめて読む
+- サーバー上のスクリプトが手元と同じで、有効になっていればアップロードしない
+  (前回アップロードした内容のハッシュを渡した場合は、GETSCRIPT でスクリプトを取得せずにそれと比べる)
+"""
+
+import base64
+import contextlib
+import hashlib
+import socket
+import threading
+
+DEFAULT_PORT = 4190
+
+class ManageSieveError(Exception):
+    # response: サーバーの応答 (NO / BYE)。通信エラーの場合は None
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+class Response:
+    def __init__(self, status, code, text, data):
+        self.status = status  # 'OK' / 'NO' / 'BYE'
+        self.code = code      # 応答コード ('NONEXISTENT' など、なければ None)
+        self.text = text      # 人が読むためのメッセージ
+        self.data = data      # 応答の前に返された行 (トークンのリスト) のリスト
+
+    def __repr__(self):
+        return f"Response({self.status!r}, {self.code!r}, {self.text!r})"
+
+def parse_server(server):
+    # "host" / "host:port" -> (host, port)
+    host, sep, port = server.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return server, DEFAULT_PORT
+
+def _string(value):
+    # 引数の文字列。改行などを含む場合は literal にする
+    data = value.encode('utf-8') if isinstance(value, str) else value
+    if isinstance(value, str) and not any(c in data for c in b'\r\n\0'):
+        return b'"' + data.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+    # クライアントからは同期を待たない literal ({n+}) を送るため、応答を待たずに続けて送れる
+    return b'{%d+}\r\n' % len(data) + data
+
+def command(name, *args):
+    # 送信するコマンドのバイト列 (str の引数は quoted string、bytes の引数は literal)
+    return b' '.join([name.encode('ascii')] + [_string(a) for a in args]) + b'\r\n'
+
+def read_tokens(rfile):
+    # 1 行分のトークンのリストを読む (literal を含む行は literal の後も同じ行として続ける)
+    # atom は str、文字列 (quoted / literal) は bytes、応答コードは '(...)' の str
+    # 接続が閉じていれば None
+    tokens = []
+    while True:
+        line = rfile.readline()
+        if not line:
+            if tokens:
+                raise ManageSieveError("connection closed in the middle of a line")
+            return None
+        line = line.rstrip(b'\r\n')
+        i = 0
+        n = len(line)
+        literal = None
+        while i < n:
+            c = line[i]
+            if c == 0x20:
+                i += 1
+            elif c == 0x22:  # "
+                buf = bytearray()
+                i += 1
+                while i < n and line[i] != 0x22:
+                    if line[i] == 0x5c:  # \
+                        i += 1
+                    buf += line[i:i + 1]
+                    i += 1
+                if i >= n:
+                    raise ManageSieveError(f"unterminated string: {line!r}")
+                tokens.append(bytes(buf))
+                i += 1
+            elif c == 0x7b and line.endswith(b'}'):  # {n} / {n+}
+                try:
+                    literal = int(line[i + 1:-1].rstrip(b'+'))
+                except ValueError:
+                    raise ManageSieveError(f"bad literal: {line!r}")
+                break
+            elif c == 0x28:  # (
+                end = line.find(b')', i)
+                if end == -1:
+                    raise ManageSieveError(f"unterminated response code: {line!r}")
+                tokens.append(line[i:end + 1].decode('utf-8', errors='replace'))
+                i = end + 1
+            else:
+                end = line.find(b' ', i)
+                if end == -1:
+                    end = n
+                tokens.append(line[i:end].decode('utf-8', errors='replace'))
+                i = end
+        if literal is None:
+            return tokens
+        data = rfile.read(literal)
+        if len(data) != literal:
+            raise ManageSieveError("connection closed in the middle of a literal")
+        tokens.append(data)
+
+def _response(rfile):
+    # OK / NO / BYE の行までを 1 つの応答として読む
+    data = []
+    while True:
+        tokens = read_tokens(rfile)
+        if tokens is None:
+            raise ManageSieveError("connection closed by server")
+        if tokens and isinstance(tokens[0], str) and tokens[0].upper() in ('OK', 'NO', 'BYE'):
+            rest = tokens[1:]
+            code = None
+            if rest and isinstance(rest[0], str) and rest[0].startswith('('):
+                code = rest.pop(0)[1:-1].split(' ', 1)[0].upper()
+            text = rest[0].decode('utf-8', errors='replace') if rest and isinstance(rest[0], bytes) else ''
+            return Response(tokens[0].upper(), code, text, data)
+        data.append(tokens)
+
+def check(response, what):
+    if response.status != 'OK':
+        detail = f" ({response.code})" if response.code else ''
+        raise ManageSieveError(f"{what} failed{detail}: {response.text}", response)
+    return response
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+class Connection:
+    def __init__(self, sock, host=None):
+        self.sock = sock
+        self.host = host
+        self.rfile = sock.makefile('rb')
+        self.user = None  # 認証済みのユーザー (代理認証の場合は authzid)
+        self.capabilities = self._capabilities(check(_response(self.rfile), 'greeting'))
+
+    @staticmethod
+    def _capabilities(response):
+        # 大文字の名前 -> 値 (値のない項目は '')
+        caps = {}
+        for tokens in response.data:
+            if tokens and isinstance(tokens[0], bytes):
+                value = tokens[1].decode('utf-8', errors='replace') if len(tokens) > 1 else ''
+                caps[tokens[0].decode('utf-8', errors='replace').upper()] = value
+        return caps
+
+    def pipeline(self, commands):
+        # コマンドをまとめて送り、それぞれの応答を順に返す (往復は 1 回)
+        self.sock.sendall(b''.join(commands))
+        return [_response(self.rfile) for _ in commands]
+
+    def execute(self, what, *args):
+        return check(self.pipeline([command(what, *args)])[0], what)
+
+    def starttls(self, context):
+        self.execute('STARTTLS')
+        self.rfile.close()
+        self.sock = context.wrap_socket(self.sock, server_hostname=self.host)
+        self.rfile = self.sock.makefile('rb')
+        # TLS の確立後、サーバーは改めて capability を送る
+        self.capabilities = self._capabilities(check(_response(self.rfile), 'STARTTLS'))
+
+    def authenticate(self, user, password, authzid=''):
+        # SASL PLAIN。authzid を指定すると管理者 (user) として authzid のスクリプトを操作する
+        if 'PLAIN' not in self.capabilities.get('SASL', '').upper().split():
+            raise ManageSieveError(f"{self.host} does not offer SASL PLAIN")
+        token = base64.b64encode(f"{authzid}\0{user}\0{password}".encode('utf-8')).decode('ascii')
+        self.execute('AUTHENTICATE', 'PLAIN', token)
+        self.user = authzid or user
+
+    def unauthenticate(self):
+        self.execute('UNAUTHENTICATE')
+        self.user = None
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+    def logout(self):
+        try:
+            self.pipeline([command('LOGOUT')])
+        except (OSError, ManageSieveError):
+            pass
+        self.close()
+
+def connect(host, port=DEFAULT_PORT, timeout=30, starttls=True, ssl_context=None):
+    # starttls=True の場合、サーバーが STARTTLS に対応していなければエラー (平文でパスワードを送らない)
+    conn = Connection(socket.create_connection((host, port), timeout), host)
+    if starttls:
+        if 'STARTTLS' not in conn.capabilities:
+            conn.close()
+            raise ManageSieveError(f"{host}:{port} does not offer STARTTLS")
+        import ssl
+        try:
+            conn.starttls(ssl_context or ssl.create_default_context())
+        except Exception:
+            conn.close()
+            raise
+    return conn
+
+class ConnectionPool:
+    # サーバーごとに最大 size 本の接続を保持し、使い終わった接続を次のアカウントで再利用する
+    # connect: サーバー名 ("host:port") -> Connection
+    def __init__(self, connect, size=1):
+        self.connect = connect
+        self.size = size
+        self.idle = {}    # サーバー -> 空いている接続のリスト
+        self.count = {}   # サーバー -> 開いている接続の数
+        self.connects = 0
+        self.cond = threading.Condition()
+
+    def _take(self, server, identity):
+        # 空いている接続 (同じユーザーで認証済みのものを優先) を取る。新しく接続する場合は None
+        with self.cond:
+            while True:
+                idle = self.idle.setdefault(server, [])
+                for conn in idle:
+                    if conn.user == identity:
+                        idle.remove(conn)
+                        return conn
+                if idle:
+                    return idle.pop(0)
+                if self.count.get(server, 0) < self.size:
+                    self.count[server] = self.count.get(server, 0) + 1
+                    self.connects += 1
+                    return None
+                self.cond.wait()
+
+    def _discard(self, server, conn):
+        if conn is not None:
+            conn.close()
+        with self.cond:
+            self.count[server] -= 1
+            self.cond.notify()
+
+    def acquire(self, server, user, password, authzid=''):
+        identity = authzid or user
+        conn = self._take(server, identity)
+        try:
+            if conn is not None and conn.user != identity:
+                if 'UNAUTHENTICATE' in conn.capabilities:
+                    conn.unauthenticate()
+                else:
+                    # 認証し直せないサーバーでは接続し直す
+                    conn.logout()
+                    conn = None
+                    with self.cond:
+                        self.connects += 1
+            if conn is None:
+                conn = self.connect(server)
+            if conn.user is None:
+                conn.authenticate(user, password, authzid)
+            return conn
+        except Exception:
+            self._discard(server, conn)
+            raise
+
+    def release(self, server, conn, reusable=True):
+        if not reusable:
+            self._discard(server, conn)
+            return
+        with self.cond:
+            self.idle.setdefault(server, []).append(conn)
+            self.cond.notify()
+
+    @contextlib.contextmanager
+    def session(self, server, user, password, authzid=''):
+        conn = self.acquire(server, user, password, authzid)
+        try:
+            yield conn
+        except ManageSieveError as e:
+            # NO の応答なら接続はそのまま使える。BYE や通信エラーの場合は閉じる
+            self.release(server, conn, e.response is not None and e.response.status == 'NO')
+            raise
+        except BaseException:
+            self.release(server, conn, False)
+            raise
+        self.release(server, conn)
+
+    def close(self):
+        with self.cond:
+            conns = [c for idle in self.idle.values() for c in idle]
+            self.idle = {}
+            self.count = {}
+        for conn in conns:
+            conn.logout()
+
+def upload_scripts(conn, scripts, uploaded=None):
+    # scripts: [(スクリプト名, 内容のバイト列)]。最後のスクリプトを有効 (SETACTIVE) にする
+    # (分割したスクリプトの場合は、親スクリプトが最後になるように渡す)
+    # uploaded: 前回このサーバーへアップロードした内容のハッシュ {スクリプト名: digest(内容)}。
+    #   渡した場合は、ハッシュが同じでサーバーの一覧にあるスクリプトを変更なしとみなし、GETSCRIPT しない
+    #   (None ならすべてのスクリプトを GETSCRIPT で取得して内容を比べる)
+    # 戻り値: アップロードしたスクリプト名のリスト (サーバーと同じなら空)
+    names = [name for name, _ in scripts]
+    active_name = names[-1]
+
+    # 1. 一覧を取得し、前回のハッシュかサーバー上の内容と比べる
+    if uploaded is None:
+        responses = conn.pipeline([command('LISTSCRIPTS')] + [command('GETSCRIPT', n) for n in names])
+    else:
+        responses = conn.pipeline([command('LISTSCRIPTS')])
+    listing = check(responses[0], 'LISTSCRIPTS')
+    existing = {t[0].decode('utf-8', errors='replace'): t[1:] for t in listing.data if t}
+    active = {name for name, rest in existing.items()
+              if rest and isinstance(rest[0], str) and rest[0].upper() == 'ACTIVE'}
+    changed = []
+    if uploaded is None:
+        for (name, data), response in zip(scripts, responses[1:]):
+            remote = response.data[0][-1] if response.status == 'OK' and response.data else None
+            if remote != data:
+                changed.append((name, data))
+    else:
+        for name, data in scripts:
+            if name not in existing or uploaded.get(name) != digest(data):
+                changed.append((name, data))
+    if not changed and active_name in active:
+        return []
+
+    # 2. すべての構文を確認してから置き換える (途中のスクリプトだけが更新されないように)
+    responses = conn.pipeline([command('CHECKSCRIPT', data) for _, data in changed])
+    for (name, _), response in zip(changed, responses):
+        check(response, f"CHECKSCRIPT {name}")
+
+    # 3. include される側を先に置き、最後に親スクリプトを置いて有効にする
+    parts = [(n, d) for n, d in changed if n != active_name]
+    if parts:
+        responses = conn.pipeline([command('PUTSCRIPT', n, d) for n, d in parts])
+        for (name, _), response in zip(parts, responses):
+            check(response, f"PUTSCRIPT {name}")
+    commands = [(f"PUTSCRIPT {n}", command('PUTSCRIPT', n, d)) for n, d in changed if n == active_name]
+    if active_name not in active:
+        commands.append((f"SETACTIVE {active_name}", command('SETACTIVE', active_name)))
+    for (what, _), response in zip(commands, conn.pipeline([c for _, c in commands])):
+        check(response, what)
+    return [name for name, _ in changed]
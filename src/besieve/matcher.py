@@ -0,0 +1,197 @@
+"""
+コンパイル済みルールマッチャー
+
+ルールセットの条件を対象 (ヘッダー・アドレス・本文) ごとにまとめ、:contains のキーは
+Aho-Corasick オートマトンで値ごとに 1 回の走査で照合します。大文字小文字の畳み込みは
+値ごとに 1 回だけ行い、正規表現は R (:regex) の条件と、ワイルドカードを含む前方一致にだけ使います。
+
+ルールの順序と stop の扱いは evaluator.Evaluator と同じです。
+"""
+
+from .evaluator import (MessageView, ascii_lower, compile_matches, compile_regex,
+                        condition_keys, condition_target, finish_actions, rule_actions,
+                        target_values)
+
+class AhoCorasick:
+    # 文字列キーの集合を 1 回の走査で検索するオートマトン
+    # search() は本文中に現れたキーの番号 (追加順) の集合を返す
+    def __init__(self, keys):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for i, key in enumerate(keys):
+            self._add(key, i)
+        self._build()
+
+    def _add(self, key, index):
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] = self._out[node] + (index,)
+
+    def _build(self):
+        # 幅優先で失敗リンクを張り、失敗先の出力を自分の出力にまとめておく
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+
+    def search(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0) if node else root.get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+# T フラグのキーがワイルドカード (:matches) として扱われる文字
+WILDCARDS = frozenset('*?\\')
+
+class _Group:
+    # 1 つの対象 (kind, name) に対する条件の集まり
+    def __init__(self):
+        self.literal = {True: [], False: []}  # fold -> [(キー, 条件番号)]
+        self.empty = []                       # 空のキー (値があれば一致)
+        self.prefix = []                      # (fold, キー, 条件番号)
+        self.wildcard = []                    # (:matches の正規表現, 条件番号)
+        self.regex = []                       # (:regex の正規表現, 条件番号)
+        self.automata = {}
+        self.needs_fold = False
+
+    def finish(self):
+        for fold, entries in self.literal.items():
+            if entries:
+                self.automata[fold] = (AhoCorasick([k for k, _ in entries]), [c for _, c in entries])
+        self.needs_fold = bool(self.literal[True]) or any(fold for fold, _, _ in self.prefix)
+
+    def fold(self, values):
+        # 大文字小文字の畳み込みは値ごとに 1 回だけ
+        return [ascii_lower(v) for v in values] if self.needs_fold else None
+
+    def match_contains(self, values, folded, hits):
+        if self.empty:
+            hits.update(self.empty)
+        for fold, (automaton, ids) in self.automata.items():
+            for value in (folded if fold else values):
+                for i in automaton.search(value):
+                    hits.add(ids[i])
+
+    def match_matches(self, values, folded, hits):
+        for fold, key, cond in self.prefix:
+            if cond not in hits and any(v.startswith(key) for v in (folded if fold else values)):
+                hits.add(cond)
+        for pattern, cond in self.wildcard:
+            if cond not in hits and any(pattern.match(v) for v in values):
+                hits.add(cond)
+
+    def match_regex(self, values, folded, hits):
+        for pattern, cond in self.regex:
+            if cond not in hits and any(pattern.search(v) for v in values):
+                hits.add(cond)
+
+    def match(self, values):
+        # 値のリストに一致した条件番号の集合
+        hits = set()
+        if values:
+            folded = self.fold(values)
+            self.match_contains(values, folded, hits)
+            self.match_matches(values, folded, hits)
+            self.match_regex(values, folded, hits)
+        return hits
+
+class CompiledMatcher:
+    # evaluator.Evaluator と同じ結果を返す、インデックス化したルールセット
+    def __init__(self, rules):
+        self.groups = {}
+        self.rules = []  # (条件番号のリスト, その条件が属する対象のリスト, アクション, stop)
+        self.rule_index = []  # コンパイル後の番号 -> 元のルール列での番号 (条件のないルールは除く)
+        cond_id = 0
+        for index, rule in enumerate(rules):
+            if not rule['conditions']:
+                continue
+            self.rule_index.append(index)
+            ids = []
+            targets = set()
+            for cond in rule['conditions']:
+                kind, names = condition_target(cond['header'])
+                for name in (names or (None,)):
+                    target = (kind, name)
+                    self._add_condition(self.groups.setdefault(target, _Group()), cond, cond_id)
+                    targets.add(target)
+                ids.append(cond_id)
+                cond_id += 1
+            self.rules.append((ids, sorted(targets, key=str), rule_actions(rule), rule.get('stop', True)))
+        for group in self.groups.values():
+            group.finish()
+        # ルールセットが参照するヘッダー名と、本文が必要かどうか (replay で読み込む範囲を絞る)
+        self.header_names = frozenset(name for kind, name in self.groups if kind != 'body')
+        self.needs_body = any(kind == 'body' for kind, _ in self.groups)
+
+    @staticmethod
+    def _add_condition(group, cond, cond_id):
+        flags = cond.get('flags', ['I'])
+        fold = 'I' in flags
+        for key in condition_keys(cond):
+            if 'R' in flags:
+                pattern = compile_regex(key, fold)
+                if pattern is not None:
+                    group.regex.append((pattern, cond_id))
+            elif 'T' in flags:
+                if WILDCARDS.isdisjoint(key):
+                    group.prefix.append((fold, ascii_lower(key) if fold else key, cond_id))
+                else:
+                    group.wildcard.append((compile_matches(key + '*', fold), cond_id))
+            elif not key:
+                group.empty.append(cond_id)
+            else:
+                group.literal[fold].append((ascii_lower(key) if fold else key, cond_id))
+
+    def matching_rules(self, message):
+        # 一致したルールの番号 (0 始まり、コンパイル後の順) を実行順に返す
+        # 対象ごとの照合は、その対象を参照するルールに最初に到達したときに 1 回だけ行う
+        if not isinstance(message, MessageView):
+            message = MessageView(message, self.header_names)
+        hits = set()
+        done = set()
+        for i, (ids, targets, _, stop) in enumerate(self.rules):
+            for target in targets:
+                if target not in done:
+                    done.add(target)
+                    hits |= self.groups[target].match(target_values(message, *target))
+            if not hits.isdisjoint(ids):
+                yield i
+                if stop:
+                    return
+
+    def evaluate(self, message):
+        actions = []
+        for i in self.matching_rules(message):
+            actions.extend(self.rules[i][2])
+        return finish_actions(actions)
+
+def compile_rules(rules):
+    # parse_becky_content / parse_sieve_content のルール構造からマッチャーを作る
+    return CompiledMatcher(rules)
@@ -0,0 +1,158 @@
+"""
+省メモリのルール表現
+
+parse_becky_content / parse_sieve_content に compact=True を指定したときに返すルールと条件です。
+__slots__ で属性を固定し、フラグは整数のビットマスク、ヘッダー名は sys.intern した文字列で持つため、
+数十万の条件を読み込んでも dict とリストで持つ場合よりメモリが少なく済みます。
+
+既存のコードがそのまま使えるよう、dict と同じ読み書き (rule['conditions'], cond.get('flags', ['I']),
+'stop' in rule, dict(cond) など) に対応します。flags は読むたびにビットマスクからリストを作ります。
+"""
+
+import sys
+
+# ビットマスクで持つフラグ。リストに戻すときはこの順序に並べる
+FLAG_ORDER = 'IRT'
+FLAG_BITS = {f: 1 << i for i, f in enumerate(FLAG_ORDER)}
+
+def flags_to_mask(flags):
+    # (ビットマスク, ビットマスクで表せないフラグの文字列)
+    mask = 0
+    extra = ''
+    for f in flags:
+        bit = FLAG_BITS.get(f)
+        if bit is None:
+            extra += f
+        else:
+            mask |= bit
+    return mask, extra
+
+def mask_to_flags(mask, extra=''):
+    return [f for f in FLAG_ORDER if mask & FLAG_BITS[f]] + list(extra)
+
+# ビットマスク -> フラグの文字列 (IFilter.def の条件行の表記)
+MASK_STRINGS = [''.join(mask_to_flags(m)) for m in range(1 << len(FLAG_ORDER))]
+
+class _Record:
+    # dict と同じように扱えるようにする共通部分
+    # 値が None の項目はキーがないものとして扱う (dict にキーがない状態と同じ)
+    __slots__ = ()
+    _keys = ()
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            raise KeyError(f"{type(self).__name__} has no field {key!r}")
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._keys and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        if key not in self._keys:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def keys(self):
+        return [k for k in self._keys if getattr(self, k) is not None]
+
+    def items(self):
+        return [(k, getattr(self, k)) for k in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (_Record, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+class Condition(_Record):
+    __slots__ = ('header', 'value', 'mask', 'extra', 'operator')
+    _keys = ('header', 'value', 'flags', 'operator')
+
+    def __init__(self, header, value, flags=('I',), operator=None):
+        self.header = sys.intern(header)
+        self.value = value
+        self.mask, self.extra = flags_to_mask(flags)
+        self.operator = operator
+
+    @property
+    def flags(self):
+        return mask_to_flags(self.mask, self.extra)
+
+    @flags.setter
+    def flags(self, flags):
+        self.mask, self.extra = flags_to_mask(flags)
+
+    def has_flag(self, flag):
+        # リストを作らずにフラグを調べる
+        bit = FLAG_BITS.get(flag)
+        return bool(self.mask & bit) if bit is not None else flag in self.extra
+
+    def __setitem__(self, key, value):
+        if key == 'header':
+            value = sys.intern(value)
+        super().__setitem__(key, value)
+
+    @classmethod
+    def from_dict(cls, cond):
+        if isinstance(cond, Condition):
+            return cond
+        return cls(cond['header'], cond['value'], cond.get('flags', ['I']), cond.get('operator'))
+
+class Rule(_Record):
+    __slots__ = ('folder', 'conditions', 'actions', 'stop')
+    _keys = ('folder', 'conditions', 'actions', 'stop')
+
+    def __init__(self, folder, conditions=(), actions=(), stop=None):
+        # stop: None は指定なし (stop する)。Sieve で stop のない分岐は False
+        self.folder = folder
+        self.conditions = [Condition.from_dict(c) for c in conditions]
+        self.actions = [sys.intern(a) for a in actions]
+        self.stop = stop
+
+    def __getitem__(self, key):
+        # folder は None でも dict と同じくキーとして存在する
+        if key == 'folder':
+            return self.folder
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        return key == 'folder' or super().__contains__(key)
+
+    def keys(self):
+        return ['folder'] + [k for k in self._keys[1:] if getattr(self, k) is not None]
+
+    def get(self, key, default=None):
+        if key == 'folder':
+            return self.folder
+        return super().get(key, default)
+
+    @classmethod
+    def from_dict(cls, rule):
+        if isinstance(rule, Rule):
+            return rule
+        return cls(rule.get('folder'), rule['conditions'], rule.get('actions', ()), rule.get('stop'))
+
+def compact_rules(rules):
+    # dict のルールのリストを、その場で Rule に置き換える (変換済みの dict から順に解放される)
+    for i, rule in enumerate(rules):
+        rules[i] = Rule.from_dict(rule)
+    return rules
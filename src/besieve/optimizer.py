@@ -0,0 +1,73 @@
+"""
+Sieve 出力の最適化
+
+rules_to_sieve_string に渡す前のルール列を小さくします。
+- ルール内の同じ条件 (ヘッダー・値・フラグが同じもの) を 1 つにまとめる
+- 同じヘッダー・同じフラグの条件の値を 1 つのキーリスト (["a", "b"]) にまとめる
+- 振り分け先・アクション・stop が同じ連続したルールを 1 つのルールにまとめる
+
+条件は OR (anyof) なので、ルール内の並べ替えや統合で結果は変わりません。
+ルールの統合は隣り合うルール同士に限るため、最初に一致したルールが適用される順序も保たれます。
+"""
+
+from .verify import SEMANTIC_FLAGS, is_list_value, split_list_value
+
+def _listable(key):
+    # '["a", "b"]' 形式で表せる値か (要素の区切りに使う文字や前後の空白を含まない)
+    return bool(key) and ',' not in key and '"' not in key and key == key.strip() \
+        and not (key.startswith('[') and key.endswith(']'))
+
+def _header_key(header):
+    return ', '.join(h.strip().lower() for h in header.split(','))
+
+def merge_conditions(conditions):
+    # 重複を除き、同じヘッダー・フラグの条件の値をキーリストにまとめた新しい条件のリスト
+    merged = []
+    groups = {}  # (ヘッダー, フラグ) -> merged 内の位置 (キーリストにまとめられる条件)
+    seen = set()
+    for cond in conditions:
+        header = _header_key(cond['header'])
+        flags = ''.join(sorted(SEMANTIC_FLAGS.intersection(cond.get('flags', ()))))
+        value = cond['value']
+        keys = split_list_value(value) if is_list_value(value) else [value]
+        keys = [k for k in keys if (header, k, flags) not in seen]
+        if not keys:
+            continue
+        seen.update((header, k, flags) for k in keys)
+
+        group = (header, flags)
+        if all(_listable(k) for k in keys):
+            if group in groups:
+                merged[groups[group]]['keys'].extend(keys)
+                continue
+            groups[group] = len(merged)
+        merged.append({'cond': cond, 'keys': keys})
+
+    result = []
+    for entry in merged:
+        cond = dict(entry['cond'])
+        keys = entry['keys']
+        cond['value'] = keys[0] if len(keys) == 1 else '[' + ', '.join(f'"{k}"' for k in keys) + ']'
+        result.append(cond)
+    return result
+
+def _destination(rule):
+    return (rule.get('folder'), tuple(rule.get('actions', ())), rule.get('stop', True))
+
+def optimize_rules(rules):
+    # 最適化した新しいルールのリストを返す (元のルールは変更しない)
+    # 条件のないルールは一致しないため取り除く (rules_to_sieve_string も出力しない)
+    result = []
+    for rule in rules:
+        if not rule['conditions']:
+            continue
+        if result and _destination(result[-1]) == _destination(rule):
+            # 隣り合うルールは、間に他のルールがないため 1 つにまとめても結果が変わらない
+            result[-1]['conditions'] = result[-1]['conditions'] + list(rule['conditions'])
+            continue
+        rule = dict(rule)
+        rule['conditions'] = list(rule['conditions'])
+        result.append(rule)
+    for rule in result:
+        rule['conditions'] = merge_conditions(rule['conditions'])
+    return result
@@ -0,0 +1,157 @@
+"""
+ルールのヒット数プロファイラー
+
+ルールセットを手元のメールで再生し、ルールごとに評価された回数・一致した回数・
+前のルールの stop に隠されて実行されなかった回数を数えます。条件の種類
+(header/address/body × contains/matches/regex) ごとの照合時間も記録します。
+結果は JSON と、ヒット数をコメントとして書き込んだ Sieve スクリプトとして出力できます。
+"""
+
+import functools
+import re
+import time
+
+from . import becky2sieve
+from . import corpus
+from . import matcher
+from .evaluator import MessageView, finish_actions, target_values
+from .replay import BATCH_SIZE, iter_batches, map_batches, needs_body
+
+MATCH_TYPES = ('contains', 'matches', 'regex')
+
+def new_stats(rule_count):
+    return {
+        'messages': 0,
+        'tested': [0] * rule_count,
+        'matched': [0] * rule_count,
+        'shadowed': [0] * rule_count,
+        'time': {},  # 'header:contains' などの条件の種類 -> 秒
+    }
+
+def merge_stats(total, stats):
+    total['messages'] += stats['messages']
+    for key in ('tested', 'matched', 'shadowed'):
+        total[key] = [a + b for a, b in zip(total[key], stats[key])]
+    for key, seconds in stats['time'].items():
+        total['time'][key] = total['time'].get(key, 0.0) + seconds
+    return total
+
+class ProfilingMatcher(matcher.CompiledMatcher):
+    # CompiledMatcher と同じ評価を行いながらカウンターを集める
+    # 計時は対象ごと・照合段階ごとに行うため、条件ごとに時計を読むよりオーバーヘッドが小さい
+    def __init__(self, rules):
+        super().__init__(rules)
+        self.rule_count = len(rules)
+        self.stats = new_stats(self.rule_count)
+
+    def _match_target(self, message, target):
+        group = self.groups[target]
+        hits = set()
+        values = target_values(message, *target)
+        if not values:
+            return hits
+        timing = self.stats['time']
+        clock = time.perf_counter
+        t0 = clock()
+        folded = group.fold(values)
+        group.match_contains(values, folded, hits)
+        t1 = clock()
+        group.match_matches(values, folded, hits)
+        t2 = clock()
+        group.match_regex(values, folded, hits)
+        t3 = clock()
+        kind = target[0]
+        for match_type, seconds in zip(MATCH_TYPES, (t1 - t0, t2 - t1, t3 - t2)):
+            key = f"{kind}:{match_type}"
+            timing[key] = timing.get(key, 0.0) + seconds
+        return hits
+
+    def profile(self, message):
+        # 1 通を評価してカウンターを更新し、アクションのリストを返す
+        if not isinstance(message, MessageView):
+            message = MessageView(message, self.header_names)
+        stats = self.stats
+        tested, matched, shadowed = stats['tested'], stats['matched'], stats['shadowed']
+        stats['messages'] += 1
+        hits = set()
+        done = set()
+        actions = []
+        stopped = False
+        for i, (ids, targets, rule_actions, stop) in enumerate(self.rules):
+            for target in targets:
+                if target not in done:
+                    done.add(target)
+                    hits |= self._match_target(message, target)
+            index = self.rule_index[i]
+            if stopped:
+                # stop の後ろのルールは実行されないが、一致したかどうかは数える
+                if not hits.isdisjoint(ids):
+                    shadowed[index] += 1
+                continue
+            tested[index] += 1
+            if not hits.isdisjoint(ids):
+                matched[index] += 1
+                actions.extend(rule_actions)
+                stopped = stop
+        return finish_actions(actions)
+
+# --- ワーカー ---
+
+_profiler = None
+
+def _init_worker(rules):
+    global _profiler
+    _profiler = ProfilingMatcher(rules)
+
+def _profile_batch(batch, headers_only):
+    _profiler.stats = new_stats(_profiler.rule_count)
+    for _, item in batch:
+        _profiler.profile(corpus.read_message(item, headers_only))
+    return _profiler.stats
+
+def profile(rules, paths, jobs=1, batch_size=BATCH_SIZE):
+    # ルールセットをコーパスで再生し、集計したカウンター (new_stats の形式) を返す
+    headers_only = not needs_body(rules)
+    items = corpus.iter_corpus(paths, headers_only=headers_only)
+    total = new_stats(len(rules))
+    func = functools.partial(_profile_batch, headers_only=headers_only)
+    for stats in map_batches(func, iter_batches(items, batch_size), jobs, _init_worker, (rules,)):
+        merge_stats(total, stats)
+    return total
+
+def report(rules, stats):
+    # JSON 出力用の dict
+    entries = []
+    for i, rule in enumerate(rules):
+        matched = stats['matched'][i]
+        entries.append({
+            'rule': i + 1,
+            'folder': rule.get('folder'),
+            'actions': list(rule.get('actions', [])),
+            'tested': stats['tested'][i],
+            'matched': matched,
+            'shadowed': stats['shadowed'][i],
+            # 一度も実行されなかったルール。shadowed > 0 なら前のルールの stop が原因
+            'dead': matched == 0,
+        })
+    return {
+        'messages': stats['messages'],
+        'rules': entries,
+        'condition_time': {k: round(v, 6) for k, v in sorted(stats['time'].items())},
+    }
+
+_RULE_COMMENT_RE = re.compile(r'^# (\d+)\. .*$', re.M)
+
+def annotate_sieve(rules, stats):
+    # rules_to_sieve_string の出力の各ルールのコメントの後ろにヒット数を書き込む
+    def annotate(m):
+        i = int(m.group(1)) - 1
+        if not 0 <= i < len(rules):
+            return m.group(0)
+        note = f"# hits: {stats['matched'][i]}/{stats['tested'][i]} tested"
+        if stats['shadowed'][i]:
+            note += f", {stats['shadowed'][i]} shadowed by an earlier stop"
+        if stats['matched'][i] == 0:
+            note += " (dead)"
+        return m.group(0) + "\n" + note
+    return _RULE_COMMENT_RE.sub(annotate, becky2sieve.rules_to_sieve_string(rules))
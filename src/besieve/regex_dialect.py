@@ -0,0 +1,681 @@
+"""
+正規表現 (フラグ R / :regex) の方言の変換と検査
+
+Becky! の正規表現は Perl 互換の構文 (\\d, \\w, (?:...), *? など) ですが、Sieve の :regex
+(RFC 3894) は POSIX 拡張正規表現 (ERE) です。ルール構造の値は常に Becky! の構文で持ち、
+Sieve に書き出すときに to_posix で ERE に、Sieve から読み込むときに from_posix で Becky! の構文に
+変換します。
+
+- 意味を変えずに書き換えられるもの: \\d \\w \\s (と否定) は文字クラスに、(?:...) は (...) に、
+  \\t \\n \\xHH は文字そのものに、最短一致 (*? など) は最長一致にする
+  (:regex は一致するかどうかだけを調べるため、最短一致と最長一致で結果は変わらない)
+- 単語の先頭・末尾の \\b は、単語でない文字か行頭・行末との連接にする
+  (\\bsale は (^|[^_0-9A-Za-z])sale。一致するかどうかだけを調べるため結果は変わらない)
+- ERE にないもの (後方参照、先読み・後読み、それ以外の位置の \\b、(?i) などのインラインフラグ、
+  強欲な量指定子) は RegexError にする。becky2sieve はその条件を Sieve に書き出さず、
+  analyzer の invalid-regex として報告する
+
+ローカルでの照合 (evaluator / matcher) は compile_regex で Python の re にコンパイルし、
+同じパターンは処理全体で 1 回だけコンパイルします。estimate_complexity はバックトラックの
+回数が入力の長さに対して指数的・高次の多項式的に増えるパターン ((\\w+\\s?)+ など) を見つけます。
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+class RegexError(ValueError):
+    def __init__(self, message, pattern, pos):
+        super().__init__(f"{message} at position {pos} in {pattern!r}")
+        self.message = message
+        self.pattern = pattern
+        self.pos = pos
+
+# ERE で特別な意味を持つ文字 (括弧の外)
+_ERE_SPECIAL = frozenset('.[()*+?{|^$\\')
+
+# 括弧の外のエスケープ -> ERE
+_CLASS_ESCAPES = {
+    'd': '[0-9]', 'D': '[^0-9]',
+    'w': '[_0-9A-Za-z]', 'W': '[^_0-9A-Za-z]',
+    's': '[[:space:]]', 'S': '[^[:space:]]',
+}
+# 括弧の中のエスケープ -> 括弧の要素
+_BRACKET_CLASSES = {'d': ['0-9'], 'w': ['0-9', 'A-Z', 'a-z', '_'], 's': ['[:space:]']}
+_CONTROL_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'f': '\f', 'v': '\v', 'a': '\a', 'e': '\x1b'}
+_CONTROL_CHARS = {v: '\\' + k for k, v in _CONTROL_ESCAPES.items() if k in 'tnrfv'}
+
+# POSIX の文字クラス -> Becky! の括弧の要素 (from_posix)
+_POSIX_CLASSES = {
+    'digit': '0-9', 'alpha': 'A-Za-z', 'alnum': '0-9A-Za-z', 'upper': 'A-Z', 'lower': 'a-z',
+    'xdigit': '0-9A-Fa-f', 'space': '\\s', 'blank': ' \\t',
+    'punct': '!-/:-@\\[-`{-~', 'cntrl': '\\x00-\\x1f\\x7f', 'print': ' -~', 'graph': '!-~',
+}
+
+# 変換の必要がない文字の並び (1 文字ずつ調べずにまとめて出力する)
+_BECKY_PLAIN = re.compile(r'[^\\\[()*+?{|^$.]+')
+_ERE_PLAIN = re.compile(r'[^\\\[\t\n\r\f\v]+')
+_INTERVAL = re.compile(r'\{(\d+)(,(\d*))?\}')
+
+# 変換結果のキャッシュの大きさ (変換・ラウンドトリップ検証で同じパターンを何度も変換するため、
+# 大きなアカウントの正規表現がすべて収まるようにする)
+_CACHE_SIZE = 1 << 16
+
+def _ere_literal(ch):
+    return '\\' + ch if ch in _ERE_SPECIAL else ch
+
+def _hex_escape(pattern, i):
+    # \x の後ろ (i は x の次の位置) -> (文字, 次の位置)
+    if pattern.startswith('{', i):
+        end = pattern.find('}', i)
+        digits, nxt = (pattern[i + 1:end], end + 1) if end != -1 else ('', i)
+    else:
+        digits = pattern[i:i + 2]
+        nxt = i + 2
+    try:
+        return chr(int(digits, 16)), nxt
+    except ValueError:
+        raise RegexError("bad \\x escape", pattern, i - 2) from None
+
+def _parse_bracket(pattern, i):
+    # Becky! の括弧式 (pattern[i] == '[') -> (否定か, 1 文字の要素の集合, 範囲と文字クラスの集合, 次の位置)
+    start = i
+    n = len(pattern)
+    i += 1
+    negate = pattern.startswith('^', i)
+    if negate:
+        i += 1
+    chars = set()
+    others = set()
+    first = True
+    while True:
+        if i >= n:
+            raise RegexError("unterminated character class", pattern, start)
+        c = pattern[i]
+        if c == ']' and not first:
+            return negate, chars, others, i + 1
+        first = False
+        if c == '[' and pattern.startswith('[:', i):
+            end = pattern.find(':]', i + 2)
+            if end == -1:
+                raise RegexError("unterminated character class", pattern, start)
+            name = pattern[i + 2:end]
+            if name not in _POSIX_CLASSES:
+                raise RegexError(f"unknown character class [:{name}:]", pattern, i)
+            # from_posix と同じ範囲に展開する ([:space:] 以外)
+            _, sub_chars, sub_others, _ = _parse_bracket('[' + _POSIX_CLASSES[name] + ']', 0)
+            chars |= sub_chars
+            others |= sub_others
+            i = end + 2
+            continue
+        if c == '\\':
+            if i + 1 >= n:
+                raise RegexError("trailing backslash", pattern, i)
+            d = pattern[i + 1]
+            if d in _BRACKET_CLASSES:
+                for member in _BRACKET_CLASSES[d]:
+                    (chars if len(member) == 1 else others).add(member)
+                i += 2
+                continue
+            if d in 'DWS':
+                raise RegexError(f"\\{d} inside a character class", pattern, i)
+            if d in _CONTROL_ESCAPES:
+                c, i = _CONTROL_ESCAPES[d], i + 2
+            elif d == 'x':
+                c, i = _hex_escape(pattern, i + 2)
+            elif d.isalnum():
+                raise RegexError(f"unsupported escape \\{d}", pattern, i)
+            else:
+                c, i = d, i + 2
+        else:
+            i += 1
+        # 範囲 (a-z)。'-' の後ろが ']' なら '-' は文字
+        if pattern.startswith('-', i) and i + 1 < n and pattern[i + 1] != ']':
+            hi = pattern[i + 1]
+            i += 2
+            if hi == '\\':
+                if i >= n:
+                    raise RegexError("trailing backslash", pattern, i - 1)
+                d = pattern[i]
+                if d in _CONTROL_ESCAPES:
+                    hi, i = _CONTROL_ESCAPES[d], i + 1
+                elif d == 'x':
+                    hi, i = _hex_escape(pattern, i + 1)
+                elif d.isalnum():
+                    raise RegexError(f"bad range end \\{d}", pattern, i - 1)
+                else:
+                    hi, i = d, i + 1
+            if hi < c:
+                raise RegexError("bad character range", pattern, start)
+            if c in ']^-' or hi in ']^-[':
+                raise RegexError("range with a bracket special character", pattern, start)
+            others.add(f'{c}-{hi}')
+        else:
+            chars.add(c)
+
+def _bracket_text(negate, chars, others):
+    # _parse_bracket の結果 -> ERE の括弧式
+    # 要素は並べ替えて出力する (from_posix で戻したものを再び変換しても同じになるように)
+    # ERE の括弧の中では \ は文字。']' は先頭、'-' は末尾、'[' は ':' '.' '=' の前に来ないよう後ろへ
+    neg = '^' if negate else ''
+    body = (']' if ']' in chars else '') + ''.join(sorted(chars - set(']-^['))) + ''.join(sorted(others))
+    if '[' in chars:
+        body += '['
+    if '^' in chars:
+        if body:
+            body += '^'
+        elif '-' in chars:
+            return '[' + neg + '-^]'
+        elif not negate:
+            # [\^] だけは括弧の外に出す ([^] は ERE では不完全な括弧式)
+            return '\\^'
+        else:
+            body = '^'
+    if '-' in chars:
+        body += '-'
+    return '[' + neg + body + ']'
+
+# \b を書き換える、単語の前・後ろの境界 (単語でない文字か行頭・行末)
+_WORD_START = '(^|' + _CLASS_ESCAPES['W'] + ')'
+_WORD_END = '(' + _CLASS_ESCAPES['W'] + '|$)'
+
+def _is_word_char(c):
+    return c.isascii() and (c.isalnum() or c == '_')
+
+def _word_follows(pattern, j):
+    # pattern[j] から、省略されない単語の文字 (英数字、_、\d、\w) が始まるか
+    if pattern.startswith(('\\d', '\\w'), j):
+        k = j + 2
+    elif j < len(pattern) and _is_word_char(pattern[j]):
+        k = j + 1
+    else:
+        return False
+    return pattern[k:k + 1] not in ('*', '?', '{')
+
+def _word_boundary(pattern, i, prev):
+    # pattern[i:i + 2] == '\\b' -> ERE (prev は直前の字句の ERE)。単語の先頭・末尾でなければ None
+    if _word_follows(pattern, i + 2):
+        if prev in ('', '(', '|'):
+            return _WORD_START
+        if prev == '^':
+            return ''
+    word_before = prev in (_CLASS_ESCAPES['d'], _CLASS_ESCAPES['w']) or \
+        (prev[-1:] != '' and _is_word_char(prev[-1]) and not prev.startswith('['))
+    if word_before:
+        nxt = pattern[i + 2:i + 3]
+        if nxt in ('', ')', '|'):
+            return _WORD_END
+        if nxt == '$':
+            return ''
+    return None
+
+def _interval(pattern, i):
+    # pattern[i] == '{' が回数指定ならその終わりの位置、そうでなければ None
+    m = _INTERVAL.match(pattern, i)
+    if m is None:
+        return None
+    lo, hi = int(m.group(1)), m.group(3)
+    if hi and int(hi) < lo:
+        raise RegexError("bad repeat interval", pattern, i)
+    return m.end()
+
+def _repeat_range(text):
+    # 量指定子 -> (最小, 最大)。最大が None なら上限なし
+    if text in _QUANTIFIERS:
+        return _QUANTIFIERS[text]
+    m = _INTERVAL.match(text)
+    lo = int(m.group(1))
+    if m.group(2) is None:
+        return lo, lo
+    return lo, int(m.group(3)) if m.group(3) else None
+
+_QUANTIFIERS = {'*': (0, None), '+': (1, None), '?': (0, 1)}
+
+def _tokens(pattern):
+    # Becky! の正規表現を字句に分ける。(種類, 値, ERE のテキスト) を順に返し、ERE で表せない構文は RegexError
+    # 種類: 'lit' (値は文字の並び), 'class' (値は d w s D W S か '.'), 'bracket' (値は _parse_bracket の結果),
+    #       'at' (幅のない ^ $ \b), 'open', 'close', 'alt', 'repeat' (値は量指定子のテキスト)
+    # to_posix は ERE のテキストをつなげ、estimate_complexity は構文木を組み立てる
+    n = len(pattern)
+    i = 0
+    prev = ''
+    can_repeat = False
+    while i < n:
+        m = _BECKY_PLAIN.match(pattern, i)
+        if m:
+            token = ('lit', m.group(), m.group())
+            i = m.end()
+            can_repeat = True
+            yield token
+            prev = token[2]
+            continue
+        c = pattern[i]
+        if c == '\\':
+            if i + 1 >= n:
+                raise RegexError("trailing backslash", pattern, i)
+            d = pattern[i + 1]
+            if d in _CLASS_ESCAPES:
+                token = ('class', d, _CLASS_ESCAPES[d])
+                i += 2
+            elif d in _CONTROL_ESCAPES:
+                token = ('lit', _CONTROL_ESCAPES[d], _CONTROL_ESCAPES[d])
+                i += 2
+            elif d == 'x':
+                ch, i = _hex_escape(pattern, i + 2)
+                token = ('lit', ch, _ere_literal(ch))
+            elif d == 'b':
+                text = _word_boundary(pattern, i, prev)
+                if text is None:
+                    raise RegexError("\\b not at the start or end of a word", pattern, i)
+                token = ('at', '\\b', text)
+                i += 2
+            elif d.isdigit():
+                raise RegexError(f"backreference \\{d}", pattern, i)
+            elif d.isalnum():
+                raise RegexError(f"unsupported escape \\{d}", pattern, i)
+            else:
+                token = ('lit', d, _ere_literal(d))
+                i += 2
+            can_repeat = True
+        elif c == '[':
+            negate, chars, others, i = _parse_bracket(pattern, i)
+            token = ('bracket', (negate, chars, others), _bracket_text(negate, chars, others))
+            can_repeat = True
+        elif c == '(':
+            if pattern.startswith('(?:', i):
+                i += 3
+            elif pattern.startswith('(?', i):
+                raise RegexError(f"unsupported group {pattern[i:i + 3]!r}", pattern, i)
+            else:
+                i += 1
+            token = ('open', None, '(')
+            can_repeat = False
+        elif c in '*+?' or (c == '{' and _interval(pattern, i) is not None):
+            if not can_repeat:
+                raise RegexError("nothing to repeat", pattern, i)
+            end = _interval(pattern, i) if c == '{' else i + 1
+            token = ('repeat', pattern[i:end], pattern[i:end])
+            i = end
+            if pattern.startswith('?', i):
+                i += 1   # 最短一致は最長一致と同じ結果になる
+            elif pattern.startswith('+', i):
+                raise RegexError("possessive quantifier", pattern, i)
+            can_repeat = False
+        elif c in ')|^$':
+            token = ({')': 'close', '|': 'alt'}.get(c, 'at'), c, c)
+            i += 1
+            can_repeat = c == ')'
+        elif c == '.':
+            token = ('class', c, c)
+            i += 1
+            can_repeat = True
+        else:
+            # '{' (回数指定でないもの)
+            token = ('lit', c, '\\{')
+            i += 1
+            can_repeat = True
+        yield token
+        prev = token[2]
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def to_posix(pattern):
+    # Becky! の正規表現 -> POSIX ERE。ERE で表せない構文は RegexError
+    return ''.join([text for _, _, text in _tokens(pattern)])
+
+def _bracket_from_posix(pattern, i):
+    # ERE の括弧式 (pattern[i] == '[') -> (Becky! の括弧式, 次の位置)。変換できなければ (None, i)
+    n = len(pattern)
+    j = i + 1
+    out = ['[']
+    if pattern.startswith('^', j):
+        out.append('^')
+        j += 1
+    start = j
+    while j < n:
+        c = pattern[j]
+        if c == ']' and j > start:
+            out.append(']')
+            return ''.join(out), j + 1
+        if c == '[' and j + 1 < n and pattern[j + 1] in ':.=':
+            kind = pattern[j + 1]
+            end = pattern.find(kind + ']', j + 2)
+            if end == -1:
+                break
+            name = pattern[j + 2:end]
+            if kind == ':':
+                if name not in _POSIX_CLASSES:
+                    break
+                out.append(_POSIX_CLASSES[name])
+            elif len(name) == 1:
+                # 照合要素 [.x.] と等価クラス [=x=] は 1 文字のものだけ
+                out.append('\\' + name if name in '\\]^-[' else name)
+            else:
+                break
+            j = end + 2
+            continue
+        if c in '\\]^[' or (c == '-' and (j == start or pattern[j + 1:j + 2] == ']')):
+            # ERE では文字として扱われる位置の \ ] ^ [ - はエスケープする ('-' は範囲の途中ならそのまま)
+            out.append('\\' + c)
+        else:
+            out.append(_CONTROL_CHARS.get(c, c))
+        j += 1
+    return None, i
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def from_posix(pattern):
+    # POSIX ERE -> Becky! の正規表現。変換できない部分 ([:cntrl:] など) があればそのまま返す
+    out = []
+    n = len(pattern)
+    i = 0
+    while i < n:
+        m = _ERE_PLAIN.match(pattern, i)
+        if m:
+            out.append(m.group())
+            i = m.end()
+            continue
+        c = pattern[i]
+        if c == '\\' and i + 1 < n:
+            out.append(pattern[i:i + 2])
+            i += 2
+        elif c == '[':
+            text, i = _bracket_from_posix(pattern, i)
+            if text is None:
+                return pattern
+            out.append(text)
+        else:
+            out.append(_CONTROL_CHARS.get(c, c))
+            i += 1
+    return ''.join(out)
+
+def canonical(pattern):
+    # ラウンドトリップ検証の比較に使う値 (同じ意味の \d と [0-9] は同じになる)
+    # ERE にできないパターンはそのまま (check_pattern で報告する)
+    try:
+        return to_posix(pattern)
+    except RegexError:
+        return pattern
+
+@lru_cache(maxsize=4096)
+def python_pattern(pattern):
+    # Becky! の正規表現 -> Python の re で同じ意味になるパターン
+    # ([:alpha:] など Python にない構文は ERE を経由して書き換える)
+    try:
+        return from_posix(to_posix(pattern))
+    except RegexError:
+        return pattern
+
+@lru_cache(maxsize=4096)
+def compile_regex(pattern, fold):
+    # 不正な正規表現は None (その条件は一致しない)
+    # 黙って一致しなくならないよう、check_pattern / analyzer.regex_findings が invalid-regex として報告する
+    # fold は i;ascii-casemap と同じく ASCII の英字だけを同一視する (re.IGNORECASE だけでは Unicode も含む)
+    try:
+        return re.compile(python_pattern(pattern), re.ASCII | re.IGNORECASE if fold else 0)
+    except re.error:
+        return None
+
+# --- バックトラックの計算量 ---
+
+# kind: 'linear' / 'polynomial' / 'exponential', order: 'O(n^3)' などの見積もり,
+# slow: 報告すべきか, detail: 原因の説明
+Complexity = namedtuple('Complexity', 'kind order slow detail')
+
+# この次数以上の多項式は遅いパターンとして報告する (.*a.*b.*c など)
+SLOW_DEGREE = 4
+
+# 上限がこの回数以上の繰り返しは上限のないものとして扱う
+_UNBOUNDED = 32
+
+_DIGITS = frozenset(range(ord('0'), ord('9') + 1))
+_WORD = _DIGITS | frozenset(ord(c) for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_')
+_SPACE = frozenset(ord(c) for c in ' \t\n\r\f\v')
+# _tokens の 'class' -> 文字の集合 (否定と '.' は任意の文字として扱う)
+_CLASS_CHARS = {'d': _DIGITS, 'w': _WORD, 's': _SPACE}
+
+# 文字の集合は frozenset (コードポイント)。None は任意の文字
+# 構文木は要素のリスト。要素は ('chars', 文字の集合), ('at', ^ $), ('group', 要素のリスト),
+# ('branch', [要素のリスト, ...]), ('repeat', 最小, 最大 (上限なしは None), 要素のリスト)
+
+def _union(a, b):
+    return None if a is None or b is None else a | b
+
+def _overlap(a, b):
+    return a is None or b is None or not a.isdisjoint(b)
+
+def _bracket_chars(negate, chars, others):
+    # _parse_bracket の結果 -> 文字の集合
+    if negate:
+        return None
+    result = frozenset(ord(c) for c in chars)
+    for member in others:
+        if member == '[:space:]':
+            result |= _SPACE
+            continue
+        lo, hi = ord(member[0]), ord(member[2])
+        if hi - lo >= 256:
+            return None
+        result |= frozenset(range(lo, hi + 1))
+    return result
+
+def _alternatives(branches, items):
+    # 選択肢のリスト -> 要素のリスト
+    # re と同じく、共通の先頭の文字や ^ は選択の外に出し、1 文字ずつの選択は文字の集合にする
+    if not branches:
+        return items
+    branches = branches + [items]
+    prefix = []
+    while all(branches) and branches[0][0][0] in ('chars', 'at') and \
+            all(b[0] == branches[0][0] for b in branches[1:]):
+        prefix.append(branches[0][0])
+        branches = [b[1:] for b in branches]
+    if all(len(b) == 1 and b[0][0] == 'chars' and b[0][1] is not None for b in branches):
+        return prefix + [('chars', frozenset().union(*(b[0][1] for b in branches)))]
+    return prefix + [('branch', branches)]
+
+def _word_edge(text):
+    # \b を書き換えた ERE (_WORD_START / _WORD_END) -> 要素のリスト。^ や $ の隣では空
+    if text == _WORD_START:
+        return [('group', [('branch', [[('at', '^')], [('chars', None)]])])]
+    if text == _WORD_END:
+        return [('group', [('branch', [[('chars', None)], [('at', '$')]])])]
+    return []
+
+def _tree(pattern):
+    # Becky! の正規表現 -> 構文木。ERE にできない・括弧の対応しないパターンは None
+    stack = []
+    branches, items = [], []
+    try:
+        for kind, value, text in _tokens(pattern):
+            if kind == 'lit':
+                items.extend(('chars', frozenset({ord(c)})) for c in value)
+            elif kind == 'class':
+                items.append(('chars', _CLASS_CHARS.get(value)))
+            elif kind == 'bracket':
+                items.append(('chars', _bracket_chars(*value)))
+            elif kind == 'at':
+                # サーバーで照合するのは書き換えた ERE のため、\b は単語でない文字を消費するものとして調べる
+                items.extend(_word_edge(text) if value == '\\b' else [('at', value)])
+            elif kind == 'open':
+                stack.append((branches, items))
+                branches, items = [], []
+            elif kind == 'alt':
+                branches.append(items)
+                items = []
+            elif kind == 'close':
+                if not stack:
+                    return None
+                group = ('group', _alternatives(branches, items))
+                branches, items = stack.pop()
+                items.append(group)
+            else:
+                lo, hi = _repeat_range(value)
+                items[-1] = ('repeat', lo, hi, [items[-1]])
+    except RegexError:
+        return None
+    if stack:
+        return None
+    return _alternatives(branches, items)
+
+def _is_unbounded(node):
+    return node[0] == 'repeat' and (node[2] is None or node[2] >= _UNBOUNDED)
+
+def _item_first(node):
+    # (先頭に現れうる文字, 空文字列に一致しうるか)
+    kind = node[0]
+    if kind == 'chars':
+        return node[1], False
+    if kind == 'repeat':
+        chars, nullable = _first(node[3])
+        return chars, nullable or node[1] == 0
+    if kind == 'group':
+        return _first(node[1])
+    if kind == 'branch':
+        chars, nullable = frozenset(), False
+        for branch in node[1]:
+            c, e = _first(branch)
+            chars, nullable = _union(chars, c), nullable or e
+        return chars, nullable
+    return frozenset(), True   # ^ $ \b は文字を消費しない
+
+def _first(items):
+    chars = frozenset()
+    for node in items:
+        c, nullable = _item_first(node)
+        chars = _union(chars, c)
+        if not nullable:
+            return chars, False
+    return chars, True
+
+def _all_chars(items):
+    # 部分パターンが消費しうるすべての文字
+    chars = frozenset()
+    for node in items:
+        kind = node[0]
+        if kind == 'repeat':
+            c = _all_chars(node[3])
+        elif kind == 'group':
+            c = _all_chars(node[1])
+        elif kind == 'branch':
+            c = frozenset()
+            for branch in node[1]:
+                c = _union(c, _all_chars(branch))
+        else:
+            c = _item_first(node)[0]
+        chars = _union(chars, c)
+    return chars
+
+def _unwrap(node):
+    # 要素が 1 つだけのグループ ((?:a+) など) は中身として扱う
+    while node[0] == 'group' and len(node[1]) == 1:
+        node = node[1][0]
+    return node
+
+def _tails(items, found):
+    # 部分パターンの末尾 (後ろが空文字列に一致しうる位置) で長さの変わる要素が消費しうる文字
+    for node in reversed(items):
+        node = _unwrap(node)
+        nullable = _item_first(node)[1]
+        if _is_unbounded(node) or (nullable and node[0] in ('repeat', 'branch')):
+            found.append(_all_chars([node]))
+        elif node[0] == 'group':
+            _tails(node[1], found)
+        elif node[0] == 'branch':
+            for branch in node[1]:
+                _tails(branch, found)
+        if not nullable:
+            return
+
+def _nested(items):
+    # 指数的なバックトラックの原因 (繰り返しの中で、1 回分の区切り方が複数ある) の説明、なければ None
+    for node in items:
+        node = _unwrap(node)
+        kind = node[0]
+        found = None
+        if kind == 'repeat':
+            body = node[3]
+            if _is_unbounded(node):
+                first = _first(body)[0]
+                tails = []
+                _tails(body, tails)
+                if any(_overlap(t, first) for t in tails):
+                    return "nested quantifiers can split the same text in many ways"
+                if len(body) == 1:
+                    sub = _unwrap(body[0])
+                    if sub[0] == 'branch':
+                        firsts = [_first(b)[0] for b in sub[1]]
+                        if any(_overlap(a, b) for k, a in enumerate(firsts) for b in firsts[k + 1:]):
+                            return "repeated alternatives overlap"
+            found = _nested(body)
+        elif kind == 'group':
+            found = _nested(node[1])
+        elif kind == 'branch':
+            found = next(filter(None, (_nested(b) for b in node[1])), None)
+        if found:
+            return found
+    return None
+
+def _degree(items):
+    # 文字の重なる上限のない繰り返しが並ぶ最大の数 (.*a.* は 2、\d+-\d+ は 1)
+    best = 0
+    count = 0
+    chars = frozenset()
+    for node in items:
+        node = _unwrap(node)
+        if _is_unbounded(node):
+            c = _all_chars(node[3])
+            if count and _overlap(c, chars):
+                count += 1
+                chars = _union(chars, c)
+            else:
+                count, chars = 1, c
+            best = max(best, count, _degree(node[3]))
+            continue
+        if node[0] == 'group':
+            best = max(best, _degree(node[1]))
+        elif node[0] == 'branch':
+            best = max([best] + [_degree(b) for b in node[1]])
+        nullable = _item_first(node)[1]
+        if not nullable and not _overlap(_all_chars([node]), chars):
+            count, chars = 0, frozenset()
+    return best
+
+@lru_cache(maxsize=4096)
+def estimate_complexity(pattern):
+    # 一致しない長さ n の文字列に対するバックトラックの回数の見積もり (Complexity)
+    # to_posix と同じ字句 (_tokens) から組み立てた構文木で調べる。ERE にできないパターンなど、
+    # 解析できないものは None
+    try:
+        items = _tree(pattern)
+        if items is None:
+            return None
+        detail = _nested(items)
+        degree = _degree(items)
+    except RecursionError:
+        return None
+    if detail:
+        return Complexity('exponential', 'O(2^n)', True, detail)
+    # 先頭が ^ でなければ、一致を試す開始位置の数 (n) が掛かる
+    anchored = bool(items) and items[0] == ('at', '^')
+    degree = max(degree, 1) + (0 if anchored else 1)
+    if degree <= 1:
+        return Complexity('linear', 'O(n)', False, '')
+    slow = degree >= SLOW_DEGREE
+    return Complexity('polynomial', f'O(n^{degree})', slow,
+                      'overlapping quantifiers in sequence' if slow else '')
+
+def check_pattern(pattern):
+    # サーバーで問題になる点の (種類, 説明) のリスト (なければ空)
+    # 種類は 'invalid-regex' (ERE にできない・正規表現として不正) / 'slow-regex' (バックトラックが爆発する)
+    problems = []
+    try:
+        to_posix(pattern)
+    except RegexError as e:
+        problems.append(('invalid-regex', f"not valid POSIX ERE, left out of the Sieve script: {e.message}"))
+    if compile_regex(pattern, False) is None:
+        if not problems:
+            problems.append(('invalid-regex', "invalid regular expression, never matches"))
+        return problems
+    complexity = estimate_complexity(pattern)
+    if complexity is not None and complexity.slow:
+        problems.append(('slow-regex', f"catastrophic backtracking, {complexity.order}: {complexity.detail}"))
+    return problems
@@ -0,0 +1,172 @@
+"""
+メールボックスの再生 (replay)
+
+変換したルールを実際のメール (mbox / Maildir) に適用し、振り分け先フォルダーごとの件数や、
+2 つのルールセットで振り分け先が変わるメッセージを集計します。
+メッセージはストリームで読み込み、ルールが参照するヘッダーだけを解析します
+(本文は body テストがある場合だけ読み込みます)。複数のワーカープロセスで並列に処理できます。
+"""
+
+import functools
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from . import becky2sieve
+from . import corpus
+from . import matcher
+from . import sieve2becky
+from .evaluator import BODY_HEADER, MessageView
+from .folder_map import build_folder_map
+
+# ワーカーに 1 回で渡すメッセージ数
+BATCH_SIZE = 200
+
+KEEP_FOLDER = 'INBOX'
+DISCARD = '(discard)'
+
+def load_rules(path, cache_dir=None):
+    # .sieve は Sieve スクリプト、それ以外は Becky! の IFilter.def として読み込む
+    if path.lower().endswith('.sieve'):
+        return sieve2becky.parse_sieve(path)
+    mb_dir = os.path.dirname(os.path.abspath(path))
+    folder_map = build_folder_map(mb_dir, cache_dir=cache_dir, lazy=True)
+    with open(path, 'rb') as f:
+        return list(becky2sieve.iter_becky_rules(f, folder_map=folder_map))
+
+def needs_body(rules):
+    return any(c['header'].lower() == BODY_HEADER for rule in rules for c in rule['conditions'])
+
+def destinations(actions):
+    # アクションのリスト -> 保存先フォルダーのリスト (keep は INBOX、discard は '(discard)')
+    result = []
+    for act in actions:
+        if act[0] == 'fileinto':
+            folder = act[1]
+        elif act[0] == 'keep':
+            folder = KEEP_FOLDER
+        else:
+            folder = DISCARD
+        if folder not in result:
+            result.append(folder)
+    return result
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def map_batches(func, batches, jobs=1, initializer=None, initargs=()):
+    # func をバッチごとに実行し、結果を入力と同じ順に返す
+    # 先読みはワーカー数の 2 倍までに抑え、コーパス全体をメモリに載せない
+    if jobs == 1:
+        if initializer:
+            initializer(*initargs)
+        for batch in batches:
+            yield func(batch)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(func, batch))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# --- ワーカー ---
+
+_engine = None
+
+def _init_worker(rules):
+    global _engine
+    _engine = matcher.compile_rules(rules)
+
+def _route_batch(batch):
+    # (ラベル, 要素) のリスト -> (フォルダーごとの件数, メッセージ数)
+    headers_only = not _engine.needs_body
+    histogram = Counter()
+    for _, item in batch:
+        data = corpus.read_message(item, headers_only)
+        histogram.update(destinations(_engine.evaluate(data)))
+    return histogram, len(batch)
+
+def route_label(actions):
+    # 比較・表示用の振り分け先 (複数ある場合は ' + ' でつなぐ)
+    return ' + '.join(destinations(actions))
+
+_diff_engines = None
+
+def _init_diff_worker(old_rules, new_rules):
+    global _diff_engines
+    _diff_engines = (matcher.compile_rules(old_rules), matcher.compile_rules(new_rules))
+
+def _diff_batch(batch, examples):
+    # ((旧, 新) -> [件数, 例のラベル]、メッセージ数)
+    old, new = _diff_engines
+    headers_only = not (old.needs_body or new.needs_body)
+    wanted = old.header_names | new.header_names
+    changes = {}
+    for label, item in batch:
+        # ヘッダーの解析結果は両方のルールセットで共有する
+        view = MessageView(corpus.read_message(item, headers_only), wanted)
+        before = route_label(old.evaluate(view))
+        after = route_label(new.evaluate(view))
+        if before != after:
+            entry = changes.setdefault((before, after), [0, []])
+            entry[0] += 1
+            if len(entry[1]) < examples:
+                entry[1].append(label)
+    return changes, len(batch)
+
+def diff(old_rules, new_rules, paths, jobs=1, batch_size=BATCH_SIZE, examples=5):
+    # 振り分け先が変わるメッセージを (旧, 新) ごとに集計する
+    # 戻り値: ({(旧, 新): [件数, 例のラベル (最大 examples 件)]}, メッセージ数)
+    # メッセージごとの結果は保持しないため、コーパスの大きさによらずメモリ使用量は一定
+    headers_only = not (needs_body(old_rules) or needs_body(new_rules))
+    items = corpus.iter_corpus(paths, headers_only=headers_only)
+    changes = {}
+    total = 0
+    func = functools.partial(_diff_batch, examples=examples)
+    for batch_changes, n in map_batches(func, iter_batches(items, batch_size), jobs,
+                                        _init_diff_worker, (old_rules, new_rules)):
+        total += n
+        for key, (count, labels) in batch_changes.items():
+            entry = changes.setdefault(key, [0, []])
+            entry[0] += count
+            entry[1].extend(labels[:examples - len(entry[1])])
+    return changes, total
+
+def format_diff(changes, examples=True):
+    # 件数の多い順に「旧 -> 新」とその例を返す
+    lines = []
+    for (before, after), (count, labels) in sorted(changes.items(), key=lambda x: (-x[1][0], x[0])):
+        lines.append(f"{count:8d}  {before} -> {after}")
+        if examples:
+            lines.extend(f"            {label}" for label in labels)
+    return lines
+
+def replay(rules, paths, jobs=1, batch_size=BATCH_SIZE):
+    # (フォルダーごとの件数, メッセージ数) を返す
+    headers_only = not needs_body(rules)
+    items = corpus.iter_corpus(paths, headers_only=headers_only)
+    histogram = Counter()
+    total = 0
+    for counts, n in map_batches(_route_batch, iter_batches(items, batch_size), jobs,
+                                 _init_worker, (rules,)):
+        histogram.update(counts)
+        total += n
+    return histogram, total
+
+def format_histogram(histogram, total):
+    # 件数の多い順に「件数 割合 フォルダー」の行を返す
+    lines = [f"{'count':>8}  {'share':>6}  folder"]
+    for folder, count in sorted(histogram.items(), key=lambda x: (-x[1], x[0])):
+        share = count * 100.0 / total if total else 0.0
+        lines.append(f"{count:8d}  {share:5.1f}%  {folder}")
+    return lines
@@ -1,414 +1,335 @@
+import functools
 import os
-import re
-import base64
-import glob
 import sys
 
-# Modified UTF-7 (IMAPフォルダ名) をデコードする
-def modified_utf7_decode(s):
-    res = []
-    i = 0
-    while i < len(s):
-        if s[i] == '&':
-            i += 1
-            if i < len(s) and s[i] == '-':
-                res.append('&')
-                i += 1
-            else:
-                start = i
-                while i < len(s) and s[i] != '-':
-                    i += 1
-                b64 = s[start:i]
-                b64 = b64.replace(',', '/')
-                while len(b64) % 4 != 0:
-                    b64 += '='
-                try:
-                    res.append(base64.b64decode(b64, altchars=None).decode('utf-16-be'))
-                except Exception:
-                    res.append(f"&{b64}-") # 失敗時のフォールバック
-                if i < len(s) and s[i] == '-':
-                    i += 1
-        else:
-            res.append(s[i])
-            i += 1
-    return "".join(res)
+from . import sieve_parser
+from . import verify
+from .folder_codec import modified_utf7_decode, decode_folder_path
+from .folder_map import build_folder_map, default_cache_dir
+from .model import Condition, MASK_STRINGS, compact_rules
+from .regex_dialect import from_posix
 
-def decode_folder_path(raw_path):
-    raw_path = raw_path.replace('\\', '/')
-    filename = raw_path.split('/')[-1]
-    
-    # 特殊ケース
-    if '!Trash' in raw_path or '!Trash' in filename:
-        return "Trash"
-    if filename.endswith('.ini'):
-        filename = filename[:-4]
-    
-    match = re.search(r'(?:#|^)(INBOX\[[0-9a-fA-F]+\])(?:\.(.*))?$', filename)
-    parts = []
-    if match:
-        parts.append("INBOX")
-        rest = match.group(2)
-        if rest:
-            subparts = rest.split('.')
-            parts.extend(subparts)
+class _Unsupported(Exception):
+    # Becky! のルールで正確に表せないテスト・分岐 (メッセージは理由)
+    pass
+
+# テストごとに受け付けるタグ (これ以外のタグは Becky! で表せない)
+_TEST_TAGS = {
+    'header': frozenset(['contains', 'matches', 'regex', 'comparator']),
+    'address': frozenset(['contains', 'matches', 'regex', 'comparator', 'all']),
+    'body': frozenset(['contains', 'matches', 'regex', 'comparator', 'text']),
+}
+
+# Becky! の I フラグ (大文字小文字無視) の有無に対応する比較器
+_COMPARATORS = {'i;ascii-casemap': True, 'i;octet': False}
+
+def _prefix_key(key):
+    # :matches のキーが「エスケープされていない * で終わる」なら、その * を除いたもの (T フラグのキー)
+    if not key.endswith('*'):
+        return None
+    escapes = len(key[:-1]) - len(key[:-1].rstrip('\\'))
+    if escapes % 2:
+        return None
+    return key[:-1]
+
+def _test_to_conditions(test, conditions):
+    # テストを Becky! の条件 (OR で並ぶ) に展開する
+    # 正確に表せないテスト (allof, not, exists, :is など) は _Unsupported を送出する
+    name = test.name
+    if name == 'anyof':
+        for sub in test.tests:
+            _test_to_conditions(sub, conditions)
+        return
+    if name == 'allof' and len(test.tests) == 1:
+        _test_to_conditions(test.tests[0], conditions)
+        return
+    if name not in _TEST_TAGS:
+        raise _Unsupported(f"test '{name}' cannot be expressed in Becky!")
+
+    tagged = test.tagged()
+    positional = test.positional()
+    for tag in tagged:
+        if tag not in _TEST_TAGS[name]:
+            raise _Unsupported(f"{name} :{tag} cannot be expressed in Becky!")
+    match_types = [t for t in ('contains', 'matches', 'regex') if t in tagged]
+    if len(match_types) != 1:
+        # 省略時は :is (完全一致) で、Becky! にはない
+        raise _Unsupported(f"{name} needs :contains, :matches or :regex")
+
+    comparator = sieve_parser.string_values(tagged['comparator']) if 'comparator' in tagged else ['i;ascii-casemap']
+    if len(comparator) != 1 or comparator[0] not in _COMPARATORS:
+        raise _Unsupported(f"comparator {comparator} cannot be expressed in Becky!")
+    ignore_case = _COMPARATORS[comparator[0]]
+
+    keys = sieve_parser.string_values(positional[-1]) if positional else []
+    if name == 'body':
+        header_name = '[body]'
     else:
-        parts = filename.split('.')
-    
-    decoded_parts = []
-    for part in parts:
-        part = re.sub(r'\[[0-9a-fA-F]+\]$', '', part)
-        decoded = modified_utf7_decode(part)
-        if not decoded or decoded.startswith('#'): continue # デコード失敗または無効な部分をスキップ
-        decoded_parts.append(decoded)
-        
-    return ".".join(decoded_parts)
+        # Header/Address は2つの引数を期待: HeaderNames, Keys
+        header_name = ", ".join(sieve_parser.string_values(positional[-2])) if len(positional) >= 2 else ''
+    if not header_name or not keys:
+        raise _Unsupported(f"{name} test without header names or keys")
 
-def build_folder_map(work_dir):
-    folder_map = {}
-    if not os.path.exists(work_dir):
-        return folder_map
-        
-    files = glob.glob(os.path.join(work_dir, "*.ini"))
-    for f in files:
-        filename = os.path.basename(f)
-        logical = decode_folder_path(filename)
-        physical = f"{os.path.basename(work_dir)}\\{filename}"
-        folder_map[logical] = physical
-    return folder_map
-
-def tokenize_sieve(text):
-    tokens = []
-    i = 0
-    n = len(text)
-    while i < n:
-        if text[i].isspace():
-            i += 1
-            continue
-        
-        # 文字列 "..."
-        if text[i] == '"':
-            start = i
-            i += 1
-            while i < n:
-                if text[i] == '"' and text[i-1] != '\\': # 単純なエスケープチェック
-                    break
-                i += 1
-            if i < n: # 閉じ引用符
-                i += 1
-            tokens.append(text[start:i])
+    # Beckyの 'T' フラグは「キーの後ろに * を付けた :matches」。すべてのキーが * で終わるときだけ表せる
+    if 'matches' in tagged:
+        keys = [_prefix_key(k) for k in keys]
+        if None in keys:
+            raise _Unsupported(f"{name} :matches keys must end with '*'")
+    elif 'regex' in tagged:
+        # POSIX ERE ([[:digit:]] など) を Becky! の正規表現にする
+        keys = [from_posix(k) for k in keys]
+
+    # 複数キーはリスト形式の値として保持 (generate_becky_string で個別条件に展開)
+    if len(keys) == 1:
+        val = keys[0]
+    else:
+        val = '[' + ', '.join(f'"{k}"' for k in keys) + ']'
+
+    # デフォルトは 'I' (無視) だが、i;octet なら大文字小文字を区別
+    final_flags = []
+    if ignore_case:
+        final_flags.append('I')
+    if 'regex' in tagged:
+        final_flags.append('R')
+    elif 'matches' in tagged:
+        final_flags.append('T')
+
+    conditions.append({
+        'header': header_name,
+        'value': val,
+        'flags': final_flags
+    })
+
+def _include(cmd, rules, include, stack, warn):
+    # include :personal "name" (RFC 6609) で読み込まれるスクリプトのルールを、その位置に展開する
+    # :global のスクリプトはサーバー側にしかないため無視する
+    tagged = cmd.tagged()
+    positional = cmd.positional()
+    if include is None or 'global' in tagged or not positional:
+        return
+    for name in sieve_parser.string_values(positional[-1]):
+        if name in stack:
+            raise ValueError(f"include loop: {' -> '.join(stack + [name])}")
+        try:
+            content = include(name)
+        except OSError:
+            # :optional の場合はスクリプトがなくてもエラーにしない
+            if 'optional' in tagged:
+                continue
+            raise
+        _collect_rules(sieve_parser.parse(content).commands, rules, include, stack + [name], warn)
+
+def _branch_rule(cmd):
+    # if / elsif の 1 分岐をルールにする
+    conditions = []
+    for test in cmd.tests:
+        _test_to_conditions(test, conditions)
+    folder = None
+    actions = []
+    for action in cmd.block or []:
+        if action.name in ('if', 'elsif', 'else', 'include'):
+            # 外側のテストとの AND になるため表せない
+            raise _Unsupported(f"nested '{action.name}' (line {action.line}) cannot be expressed in Becky!")
+        if action.name == 'fileinto':
+            args = action.positional()
+            if args:
+                values = sieve_parser.string_values(args[-1])
+                if values:
+                    folder = values[0]
+        elif action.name == 'discard':
+            actions.append('discard')
+        elif action.name == 'keep':
+            actions.append('keep')
+    if not (folder or actions):
+        raise _Unsupported("no fileinto, discard or keep action")
+
+    rule = {'folder': folder, 'conditions': conditions, 'actions': actions}
+    # stop のない分岐は後続のルールも評価される
+    if not any(action.name == 'stop' for action in cmd.block or []):
+        rule['stop'] = False
+    return rule
+
+def _collect_rules(commands, rules, include, stack, warn):
+    # if / elsif / else の連なりは 1 つのまとまりとして扱う
+    # elsif は前の分岐がすべて stop 付きのルールになったときだけ、同じ意味のルールにできる
+    # (前の分岐に一致したら評価が止まるため、後の分岐は一致しない)
+    broken = None  # 連なりの後続の分岐をルールにできない理由
+    for cmd in commands:
+        if cmd.name == 'include':
+            _include(cmd, rules, include, list(stack), warn)
             continue
-            
-        # リスト [...]
-        if text[i] == '[':
-            start = i
-            i += 1
-            depth = 1
-            while i < n and depth > 0:
-                if text[i] == '[': depth += 1
-                elif text[i] == ']': depth -= 1
-                i += 1
-            tokens.append(text[start:i])
+        if cmd.name not in ('if', 'elsif', 'else'):
             continue
-            
-        # 記号
-        if text[i] in ',;(){}':
-            tokens.append(text[i])
-            i += 1
+        try:
+            if cmd.name == 'if':
+                broken = None
+            elif broken:
+                raise _Unsupported(broken)
+            elif cmd.name == 'else':
+                raise _Unsupported("else has no test")
+            rule = _branch_rule(cmd)
+        except _Unsupported as e:
+            where = f"{stack[-1]} line {cmd.line}" if stack else f"line {cmd.line}"
+            warn(f"{where}: {cmd.name} skipped: {e}")
+            broken = f"an earlier branch (line {cmd.line}) was skipped"
             continue
-            
-        # 識別子 / タグ
-        start = i
-        while i < n and not text[i].isspace() and text[i] not in ',;(){}':
-            i += 1
-        tokens.append(text[start:i])
-    return tokens
-
-# Sieveの文字列アンクオート関数 (エスケープ解除)
-def unquote_sieve_string(s):
-    if s.startswith('"') and s.endswith('"'):
-        # 引用符を削除
-        inner = s[1:-1]
-        # \" と \\ をアンエスケープ
-        # 注: 単純な置換だが、Sieve生成時の replace('"', '\\"') と対になる
-        return inner.replace('\\"', '"').replace('\\\\', '\\')
-    return s
-
-def parse_sieve_content(content):
+        rules.append(rule)
+        if rule.get('stop', True) is False:
+            broken = f"the earlier branch (line {cmd.line}) does not stop"
+
+def _print_warning(message):
+    print(f"[WARN] {message}", file=sys.stderr)
+
+def parse_sieve_content(content, include=None, compact=False, warnings=None):
+    # Sieve スクリプトをルール構造 (folder / conditions / actions) のリストに変換する
+    # 構文エラーは sieve_parser.SieveSyntaxError (行・桁位置付き) を送出する
+    # include: スクリプト名 -> 内容 を返す関数。指定した場合は include コマンドの先のルールも展開する
+    # compact=True なら dict の代わりに model.Rule のリストを返す
+    # Becky! で正確に表せない分岐 (allof, not, ネストした if, else など) はルールにせず、
+    # 理由を warnings (リスト) に追加する。省略時は標準エラーに出力する
+    script = sieve_parser.parse(content)
     rules = []
-    lines = content.splitlines()
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if line.startswith('if '):
-            conditions = []
-            folder = None
-            actions = []
-            
-            cond_lines = line
-            # 条件ブロックの行全体を収集
-            while '{' not in cond_lines and i+1 < len(lines):
-                i += 1
-                cond_lines += " " + lines[i].strip()
-            
-            # 条件部分 (if ... { の中) をトークナイズ
-            try:
-                tokens = tokenize_sieve(cond_lines)
-                
-                # 単純なトークン分割パーサ
-                idx = 0
-                while idx < len(tokens):
-                    tok = tokens[idx]
-                    
-                    # 'header', 'address', 'body' コマンドを探す
-                    if tok.lower() in ['header', 'address', 'body']:
-                        ctype = tok.lower()
-                        idx += 1
-                        
-                        flags = []
-                        header_name = ""
-                        val = ""
-                        
-                        # タグやフラグを処理
-                        while idx < len(tokens) and tokens[idx].startswith(':'):
-                            tag = tokens[idx].lower()
-                            idx += 1
-                            
-                            if tag == ':comparator':
-                                # コンパレーター文字列引数が続く
-                                if idx < len(tokens) and tokens[idx].startswith('"'):
-                                    comp_val = tokens[idx].strip('"')
-                                    idx += 1
-                                    if comp_val == 'i;octet':
-                                        # 大文字小文字区別。デフォルトの 'I' を削除するか、下記ロジックで対応
-                                        flags.append('__CASE_SENSITIVE__')
-                            elif tag == ':regex':
-                                flags.append('R')
-                            elif tag == ':matches':
-                                flags.append('MATCHES') # Tフラグ判定用
-                            elif tag == ':contains':
-                                pass # デフォルト一致タイプ
-                            
-                            # その他のタグはとりあえず無視
-                        
-                        # 引数 (ヘッダ名リストとキーリスト)
-                        args = []
-                        while idx < len(tokens) and (tokens[idx].startswith('"') or tokens[idx].startswith('[')):
-                             args.append(tokens[idx])
-                             idx += 1
-                        
-                        if ctype == 'body':
-                            header_name = '[body]'
-                            if args: val = unquote_sieve_string(args[0])
-                        else: # header or address
-                            # Header/Address は2つの引数を期待: HeaderNames, Keys
-                            if len(args) >= 2:
-                                h_raw = args[-2] # 最後から2番目がヘッダ名
-                                v_raw = args[-1] # 最後がキー
-                                
-                                # ヘッダ名のクリーンアップ
-                                if h_raw.startswith('['):
-                                    header_name = h_raw.strip('[]')
-                                    # リスト内の要素もアンエスケープすべきだが、
-                                    # 現状は単純に構造を維持して文字列化しているだけかも？
-                                    # 警告を見ると: 元 '["...", "..."]', 復元 '[\\"...", \\"..."]'
-                                    # h_raw 自体は tokenize_sieve で取得した生文字列。
-                                    # リストの中身の引用符もエスケープされている可能性がある。
-                                    
-                                    # 簡易的な置換で対応
-                                    header_name = header_name.replace('\\"', '"').replace('\\\\', '\\')
-                                    header_name = re.sub(r'"\s*,\s*"', ', ', header_name).replace('"', '')
-                                else:
-                                    header_name = unquote_sieve_string(h_raw)
-                                
-                                val = unquote_sieve_string(v_raw)
-                        
-                        # フラグの後処理
-                        final_flags = []
-                        # デフォルトは 'I' (無視) だが、__CASE_SENSITIVE__ があれば除外
-                        if '__CASE_SENSITIVE__' not in flags:
-                            final_flags.append('I')
-                        
-                        if 'R' in flags:
-                            final_flags.append('R')
-                        if 'MATCHES' in flags:
-                             # Beckyの 'T' フラグは前方一致 (*)
-                             if val.endswith('*') and not val.startswith('*'):
-                                val = val[:-1]
-                                final_flags.append('T')
-                        
-                        if header_name: # ヘッダ名が正しくパースできた場合のみ追加
-                            conditions.append({
-                                'header': header_name,
-                                'value': val,
-                                'flags': final_flags
-                            })
-                    else:
-                        idx += 1 # 関係ないトークンはスキップ
-            except Exception as e:
-                # ログ出力など行うべきだが、ここでは簡易的にパス
-                pass
-
-            # アクション部分のパース
-            # } が来るまで行を読む
-            while i+1 < len(lines):
-                i += 1
-                body = lines[i].strip()
-                if body.startswith('fileinto'):
-                    m = re.search(r'fileinto "([^"]+)"', body)
-                    if m:
-                        folder = m.group(1)
-                elif body == 'discard;':
-                    actions.append('discard')
-                elif body == 'keep;':
-                    actions.append('keep')
-                elif body == '}':
-                    break
-            
-            if (folder or actions) and conditions:
-                rules.append({'folder': folder, 'conditions': conditions, 'actions': actions})
-        i += 1
-    return rules
+    warn = _print_warning if warnings is None else warnings.append
+    _collect_rules(script.commands, rules, include, (), warn)
+    return compact_rules(rules) if compact else rules
 
-def generate_becky_string(rules, folder_map):
-    output = []
-    output.append("Version=1")
-    output.append("AutoSorting=1")
-    output.append("OnlyRead=0")
-    output.append("OnlyOneFolder=1")
-    
-    for rule in rules:
-        folder = rule['folder']
-        actions = rule['actions']
-        physical = None
-        
-        # ターゲットフォルダのパスを決定
-        if folder == 'Trash':
-            physical = "45bee44e.mb\\!Trash\\"
-        elif folder:
-            physical = folder_map.get(folder)
-        
-        # フォールバック
-        if not physical and folder == 'Trash':
-             physical = "45bee44e.mb\\!Trash\\"
+def file_includer(directory, read=None):
+    # include "name" を directory/name.sieve として読む関数を返す
+    # read: パス -> 内容 (省略時は UTF-8 のテキストとして読む)。読んだファイルを記録したい場合に使う
+    def include(name):
+        path = os.path.join(directory, name + '.sieve')
+        if read is not None:
+            return read(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    return include
 
-        # 削除アクション (!D) かどうか
-        is_delete = 'discard' in actions
-        is_copy = 'keep' in actions
-        
-        # ルール開始
-        if physical or is_delete:
-            output.append(f':Begin ""')
-            
-            if is_delete and not physical:
-                # フォルダ指定なきdiscardのみの場合
-                # Beckyでは通常 !D で処理
-                pass 
-                
-            if physical:
-                output.append(f"!M:{physical}")
-            
-            if is_delete:
-                output.append("!D")
-                
-            for cond in rule['conditions']:
-                hdr = cond['header']
-                val = cond['value']
-                flags = cond.get('flags', ['I']) # 指定なければデフォルト I
-                
-                # フラグ文字列
-                # オペレータはデフォルト O (OR)
-                flag_str = "".join(flags)
-                op_str = "O"
-                
-                # 標準ヘッダのマッピングと大文字化
-                h_map = {
-                    'from': 'From', 'to': 'To', 'cc': 'Cc', 'subject': 'Subject',
-                    'reply-to': 'Reply-To', 'sender': 'Sender', 'x-sender': 'X-Sender'
-                }
-                # カンマ区切りなど複数ヘッダの処理
-                if ',' in hdr:
-                    # 分割してマップし、結合
-                    parts = [h_map.get(x.strip().lower(), x.strip()) for x in hdr.split(',')]
-                    becky_hdr = ", ".join(parts)
-                else:
-                    becky_hdr = h_map.get(hdr.lower(), hdr)
-                
-                # Becky!は配列形式をサポートしない
-                # リスト形式の値は個別の条件行に展開する
-                values_to_output = []
-                if val.startswith('[') and val.endswith(']') and '", "' in val:
-                    # リスト形式: ["a", "b", "c"] -> 個別に展開
-                    inner = val[1:-1].strip()
-                    values_to_output = [v.strip().strip('"').strip() for v in inner.split(',')]
-                    values_to_output = [v for v in values_to_output if v]
-                else:
-                    values_to_output = [val]
-                
-                for single_val in values_to_output:
-                    output.append(f"@0:{becky_hdr}:{single_val}\t{op_str}\t{flag_str}")
-            
-            if is_copy:
-                 output.append("$O:Sort=0")
-            else:
-                 output.append("$O:Sort=1")
-                 
-            output.append(':End ""')
-    
-    return "\n".join(output)
+# 標準ヘッダのマッピングと大文字化 (小文字のヘッダー名 -> Becky! での表記)
+HEADER_NAMES = {
+    'from': 'From', 'to': 'To', 'cc': 'Cc', 'subject': 'Subject',
+    'reply-to': 'Reply-To', 'sender': 'Sender', 'x-sender': 'X-Sender'
+}
+
+BECKY_HEADER = "Version=1\nAutoSorting=1\nOnlyRead=0\nOnlyOneFolder=1"
+
+# write_becky が 1 回の write にまとめるルール数
+BATCH_RULES = 256
+
+@functools.lru_cache(maxsize=4096)
+def becky_header(hdr):
+    # 条件のヘッダー名を Becky! の表記にする (ルールごとに同じヘッダーが何度も現れるためキャッシュする)
+    # カンマ区切りなど複数ヘッダの処理
+    if ',' in hdr:
+        # 分割してマップし、結合
+        return ", ".join(HEADER_NAMES.get(x.strip().lower(), x.strip()) for x in hdr.split(','))
+    return HEADER_NAMES.get(hdr.lower(), hdr)
+
+@functools.lru_cache(maxsize=4096)
+def _split_values(val):
+    # リスト形式: ["a", "b", "c"] -> 個別に展開 (optimizer でまとめた同じリストは 1 回だけ分割する)
+    # verify.split_list_value と同じ結果になるようにする
+    values = [v.strip().strip('"').strip() for v in val[1:-1].split(',')]
+    return tuple([v for v in values if v])
+
+def _rule_lines(rule, folder_map, lines):
+    # 1 ルール分の行を lines に追加する (Becky! で表せないルールは何も追加しない)
+    folder = rule['folder']
+    actions = rule['actions']
+    physical = None
+
+    # ターゲットフォルダのパスを決定
+    if folder:
+        physical = folder_map.get(folder)
+
+    # フォールバック: .mb に !Trash が見つからない場合
+    if not physical and folder == 'Trash':
+        prefix = getattr(folder_map, 'prefix', None) or "45bee44e.mb"
+        physical = f"{prefix}\\!Trash\\"
+
+    # 削除アクション (!D) かどうか
+    is_delete = 'discard' in actions
+    if not physical and not is_delete:
+        return
+
+    # ルール開始
+    # フォルダ指定なき discard のみの場合は !D だけで処理する
+    lines.append(':Begin ""')
+    if physical:
+        lines.append(f"!M:{physical}")
+    if is_delete:
+        lines.append("!D")
+
+    append = lines.append
+    for cond in rule['conditions']:
+        # オペレータはデフォルト O (OR)。フラグは指定なければデフォルト I
+        if type(cond) is Condition:
+            hdr, val = cond.header, cond.value
+            flag_str = MASK_STRINGS[cond.mask] + cond.extra
+        else:
+            hdr, val = cond['header'], cond['value']
+            flag_str = "".join(cond.get('flags', ['I']))
+        becky_hdr = becky_header(hdr)
+
+        # Becky!は配列形式をサポートしない
+        # リスト形式の値は個別の条件行に展開する
+        if verify.is_list_value(val):
+            # 要素ごとの行を 1 回の join で作る
+            prefix = f"@0:{becky_hdr}:"
+            suffix = f"\tO\t{flag_str}"
+            values = _split_values(val)
+            if values:
+                append(prefix + (suffix + "\n" + prefix).join(values) + suffix)
+        else:
+            append(f"@0:{becky_hdr}:{val}\tO\t{flag_str}")
+
+    lines.append("$O:Sort=0" if 'keep' in actions else "$O:Sort=1")
+    lines.append(':End ""')
+
+def iter_becky_chunks(rules, folder_map, batch=BATCH_RULES):
+    # IFilter.def の内容を、batch ルールずつまとめた文字列として順に返す
+    # ルールをイテレータで渡せば、出力全体を 1 つの文字列として持たずに書き出せる
+    yield BECKY_HEADER
+    lines = []
+    for i, rule in enumerate(rules, 1):
+        _rule_lines(rule, folder_map, lines)
+        if i % batch == 0 and lines:
+            yield "\n" + "\n".join(lines)
+            lines = []
+    if lines:
+        yield "\n" + "\n".join(lines)
+
+def write_becky(rules, folder_map, fp):
+    # IFilter.def の内容をテキストのファイルオブジェクト fp に書き出す
+    for chunk in iter_becky_chunks(rules, folder_map):
+        fp.write(chunk)
+
+def generate_becky_string(rules, folder_map):
+    return "".join(iter_becky_chunks(rules, folder_map))
 
 def verify_conversion(original_rules, generated_becky):
+    # 生成した Becky! 形式を再度ルール構造へパースし、正規形で比較する
     try:
         from . import becky2sieve
-        
-        # 生成されたBecky形式を再度ルール構造へパース
         reverted_rules = becky2sieve.parse_becky_content(generated_becky)
-        
-        if len(original_rules) != len(reverted_rules):
-            print(f"検証失敗: ルール数の不一致。 元: {len(original_rules)}, 復元: {len(reverted_rules)}", file=sys.stderr)
-            return False
-            
-        for i, org in enumerate(original_rules):
-            rev = reverted_rules[i]
-            if org['folder'] != rev['folder']:
-                print(f"検証失敗 ルール #{i+1}: フォルダ不一致。 '{org['folder']}' vs '{rev['folder']}'", file=sys.stderr)
-                return False
-            
-            # 条件チェック
-            # リスト形式の値は展開して比較（Becky!はリストを個別条件に展開するため）
-            def expand_conditions(conds):
-                result = set()
-                for c in conds:
-                    hdr = c['header'].lower()
-                    val = c['value']
-                    # リスト形式の場合は展開
-                    if val.startswith('[') and val.endswith(']') and '", "' in val:
-                        inner = val[1:-1].strip()
-                        for v in inner.split(','):
-                            v = v.strip().strip('"').strip()
-                            if v:
-                                result.add((hdr, v))
-                    else:
-                        result.add((hdr, val))
-                return result
-            
-            org_conds = expand_conditions(org['conditions'])
-            rev_conds = expand_conditions(rev['conditions'])
-            
-            if org_conds != rev_conds:
-                print(f"検証警告 ルール #{i+1}: 条件の不一致。\n元: {org_conds}\n復元: {rev_conds}", file=sys.stderr)
-        
-        print("検証成功: ラウンドトリップテスト (Sieve -> Becky -> Sieve構造) 完了。", file=sys.stderr)
-        return True
-        
     except ImportError:
         print("検証スキップ: becky2sieve モジュールが見つかりません。", file=sys.stderr)
+        return None
     except Exception as e:
         print(f"検証中にエラーが発生しました: {e}", file=sys.stderr)
         return False
 
+    mismatches = verify.compare_rules(original_rules, reverted_rules)
+    for m in mismatches:
+        print(f"検証失敗 {verify.describe(m)}", file=sys.stderr)
+    if mismatches:
+        return False
+    print("検証成功: ラウンドトリップテスト (Sieve -> Becky -> Sieve構造) 完了。", file=sys.stderr)
+    return True
+
 def parse_sieve(sieve_path):
+    # 同じディレクトリの include 先のスクリプトも展開する (sieve_writer で分割したスクリプト)
     with open(sieve_path, 'r', encoding='utf-8') as f:
-        return parse_sieve_content(f.read())
+        return parse_sieve_content(f.read(), file_includer(os.path.dirname(sieve_path)))
 
 def main():
     import argparse
@@ -418,8 +339,8 @@ def main():
     args = parser.parse_args()
     
     if os.path.exists(args.sieve_file):
-        folder_map = build_folder_map(args.mb_dir)
         rules = parse_sieve(args.sieve_file)
+        folder_map = build_folder_map(args.mb_dir, cache_dir=default_cache_dir(), lazy=True)
         
         becky_code = generate_becky_string(rules, folder_map)
         
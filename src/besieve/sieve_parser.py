@@ -0,0 +1,347 @@
+"""
+Sieve (RFC 5228) の字句解析・構文解析
+
+スクリプト全体を 1 パスでトークン化し、再帰下降で AST を構築します。
+エラーは行・桁位置付きの SieveSyntaxError として報告します。
+"""
+
+import re
+from collections import namedtuple
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
+
+class SieveSyntaxError(ValueError):
+    def __init__(self, message, line, col):
+        super().__init__(f"line {line}, column {col}: {message}")
+        self.message = message
+        self.line = line
+        self.col = col
+
+# kind: 'identifier', 'tag', 'number', 'string', 'text', 'punct', 'eof'
+Token = namedtuple('Token', 'kind value line col')
+
+# --- AST ---
+
+@dataclass
+class String:
+    value: str
+    multiline: bool = False
+    line: int = 0
+    col: int = 0
+
+@dataclass
+class StringList:
+    values: List[str]
+    line: int = 0
+    col: int = 0
+
+@dataclass
+class Number:
+    value: int
+    line: int = 0
+    col: int = 0
+
+@dataclass
+class Tag:
+    name: str  # 先頭の ':' を除いた小文字の名前
+    line: int = 0
+    col: int = 0
+
+Argument = Union[String, StringList, Number, Tag]
+
+@dataclass
+class Test:
+    name: str
+    arguments: List[Argument] = field(default_factory=list)
+    tests: List['Test'] = field(default_factory=list)
+    line: int = 0
+    col: int = 0
+
+    def tagged(self):
+        # タグ名 -> 直後の引数 (引数を取らないタグは None)
+        return _tagged_arguments(self.arguments)
+
+    def positional(self):
+        # タグとタグ引数を除いた位置引数
+        return _positional_arguments(self.arguments)
+
+@dataclass
+class Command:
+    name: str
+    arguments: List[Argument] = field(default_factory=list)
+    tests: List[Test] = field(default_factory=list)
+    block: Optional[List['Command']] = None
+    line: int = 0
+    col: int = 0
+
+    def tagged(self):
+        return _tagged_arguments(self.arguments)
+
+    def positional(self):
+        return _positional_arguments(self.arguments)
+
+@dataclass
+class Script:
+    commands: List[Command]
+
+# 引数を 1 つ取るタグ (comparator, body の :content, imap4flags の :flags など)
+TAGS_WITH_ARGUMENT = {'comparator', 'content', 'flags', 'importance', 'handle', 'from',
+                      'subject', 'days', 'seconds', 'addresses', 'mime', 'specialuse'}
+
+def _tagged_arguments(arguments):
+    result = {}
+    i = 0
+    while i < len(arguments):
+        arg = arguments[i]
+        if isinstance(arg, Tag):
+            value = None
+            if arg.name in TAGS_WITH_ARGUMENT and i + 1 < len(arguments) \
+                    and not isinstance(arguments[i + 1], Tag):
+                value = arguments[i + 1]
+                i += 1
+            result[arg.name] = value
+        i += 1
+    return result
+
+def _positional_arguments(arguments):
+    result = []
+    i = 0
+    while i < len(arguments):
+        arg = arguments[i]
+        if isinstance(arg, Tag):
+            if arg.name in TAGS_WITH_ARGUMENT and i + 1 < len(arguments) \
+                    and not isinstance(arguments[i + 1], Tag):
+                i += 1
+        else:
+            result.append(arg)
+        i += 1
+    return result
+
+def string_values(arg):
+    # String / StringList をキーのリストに変換
+    if isinstance(arg, String):
+        return [arg.value]
+    if isinstance(arg, StringList):
+        return list(arg.values)
+    return []
+
+# --- 字句解析 ---
+
+# 先頭の空白はトークンと同じマッチで読み飛ばす
+_TOKEN_RE = re.compile(r"""[ \t\r\n]*(?:
+      (?P<comment>\#[^\n]*|/\*.*?\*/)
+    | (?P<text>text:[ \t]*(?:\#[^\n]*)?\r?\n)
+    | (?P<tag>:[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<number>[0-9]+[KMGkmg]?)
+    | (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+    | (?P<punct>[\[\](){},;])
+    | (?P<eof>\Z)
+)""", re.X | re.S)
+
+_TEXT_END_RE = re.compile(r'^\.\r?(?:\n|\Z)', re.M)
+_ESCAPE_RE = re.compile(r'\\(.)', re.S)
+_DOT_STUFF_RE = re.compile(r'^\.\.', re.M)
+
+_MULTIPLIERS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+def unescape(s):
+    # quoted-string の中身: "\\" -> "\", "\"" -> '"', それ以外の "\x" は "x"
+    if '\\' not in s:
+        return s
+    return _ESCAPE_RE.sub(r'\1', s)
+
+def quote(s):
+    return '"' + s.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _scan(text):
+    # (kind, value, line, col) のタプルのリストを返す (末尾は 'eof')
+    tokens = []
+    append = tokens.append
+    pos = 0
+    last = 0         # 直前のトークンの開始位置 (ここから改行を数える)
+    line = 1
+    line_start = 0
+    match = _TOKEN_RE.match
+    count = text.count
+    while True:
+        m = match(text, pos)
+        if m is None:
+            # 空白の後ろの不正な文字の位置を報告する
+            start = pos
+            while text[start] in ' \t\r\n':
+                start += 1
+        else:
+            kind = m.lastgroup
+            start = m.start(kind)
+
+        nl = count('\n', last, start)
+        if nl:
+            line += nl
+            line_start = text.rfind('\n', last, start) + 1
+        col = start - line_start + 1
+        last = start
+
+        if m is None:
+            ch = text[start]
+            if ch == '"':
+                raise SieveSyntaxError("unterminated string", line, col)
+            if text.startswith('/*', start):
+                raise SieveSyntaxError("unterminated comment", line, col)
+            raise SieveSyntaxError(f"unexpected character {ch!r}", line, col)
+
+        pos = m.end()
+        if kind == 'identifier':
+            append(('identifier', m.group(kind).lower(), line, col))
+        elif kind == 'string':
+            append(('string', unescape(text[start + 1:pos - 1]), line, col))
+        elif kind == 'punct':
+            append(('punct', m.group(kind), line, col))
+        elif kind == 'tag':
+            append(('tag', m.group(kind)[1:].lower(), line, col))
+        elif kind == 'comment':
+            continue
+        elif kind == 'number':
+            raw = m.group(kind)
+            mult = _MULTIPLIERS.get(raw[-1].upper())
+            append(('number', int(raw[:-1]) * mult if mult else int(raw), line, col))
+        elif kind == 'text':
+            # 複数行文字列: "." のみの行まで
+            e = _TEXT_END_RE.search(text, pos)
+            if e is None:
+                raise SieveSyntaxError("unterminated multi-line string", line, col)
+            append(('text', _DOT_STUFF_RE.sub('.', text[pos:e.start()]), line, col))
+            pos = e.end()
+        else:
+            append(('eof', None, line, col))
+            return tokens
+
+def tokenize(text):
+    # Token (kind, value, line, col) のリストを返す (末尾は 'eof')
+    return [Token(*tok) for tok in _scan(text)]
+
+# --- 構文解析 ---
+
+class _Parser:
+    # トークンは (kind, value, line, col) のタプル
+    def __init__(self, text):
+        self.tokens = _scan(text)
+        self.pos = 0
+
+    def next(self):
+        tok = self.tokens[self.pos]
+        if tok[0] != 'eof':
+            self.pos += 1
+        return tok
+
+    def error(self, message, tok=None):
+        tok = tok or self.tokens[self.pos]
+        return SieveSyntaxError(message, tok[2], tok[3])
+
+    def unexpected(self, expected, tok):
+        found = 'end of script' if tok[0] == 'eof' else repr(tok[1])
+        return self.error(f"expected {expected}, found {found}", tok)
+
+    def expect_punct(self, ch):
+        tok = self.next()
+        if tok[0] != 'punct' or tok[1] != ch:
+            raise self.unexpected(repr(ch), tok)
+        return tok
+
+    def parse_script(self):
+        commands = self.parse_commands()
+        tok = self.tokens[self.pos]
+        if tok[0] != 'eof':
+            raise self.error(f"unexpected {tok[1]!r}")
+        return Script(commands)
+
+    def parse_commands(self):
+        commands = []
+        tokens = self.tokens
+        while True:
+            kind, value, _, _ = tokens[self.pos]
+            if kind == 'eof' or (kind == 'punct' and value == '}'):
+                return commands
+            commands.append(self.parse_command())
+
+    def parse_command(self):
+        tok = self.next()
+        if tok[0] != 'identifier':
+            raise self.unexpected("command", tok)
+        arguments, tests = self.parse_arguments()
+        cmd = Command(tok[1], arguments, tests, None, tok[2], tok[3])
+        kind, value, _, _ = self.tokens[self.pos]
+        if kind == 'punct' and value == ';':
+            self.pos += 1
+        elif kind == 'punct' and value == '{':
+            self.pos += 1
+            cmd.block = self.parse_commands()
+            self.expect_punct('}')
+        else:
+            raise self.unexpected(f"';' or '{{' after {cmd.name!r}", self.tokens[self.pos])
+        return cmd
+
+    def parse_arguments(self):
+        arguments = []
+        tokens = self.tokens
+        while True:
+            kind, value, line, col = tokens[self.pos]
+            if kind == 'string' or kind == 'text':
+                self.pos += 1
+                arguments.append(String(value, kind == 'text', line, col))
+            elif kind == 'tag':
+                self.pos += 1
+                arguments.append(Tag(value, line, col))
+            elif kind == 'number':
+                self.pos += 1
+                arguments.append(Number(value, line, col))
+            elif kind == 'punct' and value == '[':
+                arguments.append(self.parse_string_list())
+            else:
+                break
+
+        tests = []
+        if kind == 'identifier':
+            tests.append(self.parse_test())
+        elif kind == 'punct' and value == '(':
+            self.pos += 1
+            tests.append(self.parse_test())
+            while True:
+                tok = self.next()
+                if tok[0] == 'punct' and tok[1] == ',':
+                    tests.append(self.parse_test())
+                elif tok[0] == 'punct' and tok[1] == ')':
+                    break
+                else:
+                    raise self.unexpected("',' or ')'", tok)
+        return arguments, tests
+
+    def parse_string_list(self):
+        start = self.expect_punct('[')
+        values = []
+        while True:
+            tok = self.next()
+            if tok[0] != 'string' and tok[0] != 'text':
+                raise self.unexpected("string in string list", tok)
+            values.append(tok[1])
+            tok = self.next()
+            if tok[0] == 'punct' and tok[1] == ',':
+                continue
+            if tok[0] == 'punct' and tok[1] == ']':
+                return StringList(values, start[2], start[3])
+            raise self.unexpected("',' or ']'", tok)
+
+    def parse_test(self):
+        tok = self.next()
+        if tok[0] != 'identifier':
+            raise self.unexpected("test", tok)
+        arguments, tests = self.parse_arguments()
+        return Test(tok[1], arguments, tests, tok[2], tok[3])
+
+def parse(text):
+    # Sieve スクリプトを Script (AST) に変換する
+    parser = _Parser(text)
+    try:
+        return parser.parse_script()
+    except RecursionError:
+        raise parser.error("nesting too deep") from None
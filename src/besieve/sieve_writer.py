@@ -0,0 +1,156 @@
+"""
+Sieve スクリプトの書き出し (サイズ上限による分割)
+
+上限を指定しない場合は、becky2sieve のルールごとのテキストを 1 つの文字列にまとめずにファイルへ順に書き出します。
+ManageSieve サーバーのスクリプトサイズ上限を超える場合は、ルールの順序を保ったまま
+複数のスクリプト (name-1.sieve, name-2.sieve, ...) に分け、それらを順に include する
+親スクリプト (name.sieve) を作ります (RFC 6609)。
+include 先のスクリプトで実行された stop はスクリプト全体の処理を止めるため、
+分割しても最初に一致したルールで止まる動作は変わりません。
+どちらの場合もルールを描画しながら一時ファイルに書き (分割する場合に持つのは 1 スクリプト分だけ)、
+すべての一時ファイルがそろってから置き換えます。途中で失敗しても、前回と今回のスクリプトは混ざりません。
+"""
+
+import os
+
+from . import becky2sieve
+from . import sieve_parser
+
+def _size(text):
+    return len(text.encode('utf-8'))
+
+def iter_chunks(rules, max_bytes):
+    # ルールを、1 つのスクリプトが max_bytes バイト以下になるように分ける
+    # (require の集合, ルールのテキストのリスト) を順に返す。保持するのは 1 スクリプト分だけ
+    # 1 ルールだけで上限を超える場合は ValueError
+    requires = becky2sieve.BASE_REQUIRES
+    blocks = []
+    body = 0  # blocks の合計バイト数 (区切りの改行を含む)
+    for i, rule in enumerate(rules):
+        # テキストと必要な拡張は 1 回の描画で求める
+        rule_exts = set()
+        block = becky2sieve.render_rule(i, rule, rule_exts)
+        block_size = _size(block) + 1
+        merged = requires | rule_exts
+        if blocks and _size(becky2sieve.require_line(merged)) + body + block_size > max_bytes:
+            yield requires, blocks
+            merged = becky2sieve.BASE_REQUIRES | rule_exts
+            blocks = []
+            body = 0
+        if _size(becky2sieve.require_line(merged)) + block_size > max_bytes:
+            raise ValueError(f"rule {i + 1} alone is larger than the {max_bytes}-byte script limit")
+        requires = merged
+        blocks.append(block)
+        body += block_size
+    if blocks:
+        yield requires, blocks
+
+def part_name(name, n):
+    return f"{name}-{n}"
+
+def include_script(names):
+    # 分割したスクリプトを順に読み込む親スクリプト
+    lines = ['require ["include"];\n']
+    lines.extend(f'include :personal {sieve_parser.quote(name)};' for name in names)
+    return "\n".join(lines) + "\n"
+
+def _write_file(path, write):
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        return write(f)
+
+def _write_chunk(f, requires, blocks):
+    # iter_chunks の 1 スクリプト分を書く
+    f.write(becky2sieve.require_line(requires))
+    for block in blocks:
+        f.write("\n")
+        f.write(block)
+
+def _read_file(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return f.read()
+
+def _tmp_path(path):
+    return f"{path}.tmp{os.getpid()}"
+
+def _part_path(path, n):
+    # path を親スクリプトとする n 番目の分割スクリプトのパス
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(path), part_name(name, n) + '.sieve')
+
+def part_paths(path, start=1):
+    # path を親スクリプトとする分割スクリプトのうち、存在するもののパス (start 番から連番で)
+    paths = []
+    n = start
+    while os.path.exists(_part_path(path, n)):
+        paths.append(_part_path(path, n))
+        n += 1
+    return paths
+
+def remove_parts(path, start=1):
+    # 前回の分割で作った、今回は使わない番号のスクリプトを削除する
+    for part in part_paths(path, start):
+        os.remove(part)
+
+def _write_part(path, n, chunk, targets):
+    # n 番目の分割スクリプトを一時ファイルに書き、その名前を返す
+    target = _part_path(path, n)
+    targets.append(target)
+    _write_file(_tmp_path(target), lambda f: _write_chunk(f, *chunk))
+    return os.path.splitext(os.path.basename(target))[0]
+
+def _write_split(rules, path, max_bytes, targets):
+    # iter_chunks のスクリプトを一時ファイルに書き、書き込み先を targets に追加する (親スクリプトは最後)
+    # 後にスクリプトが続くと分かるまで 1 つ前のスクリプトは書かずに持ち、1 つしかなければ分割しない
+    names = []
+    previous = None
+    for chunk in iter_chunks(rules, max_bytes):
+        if previous is not None:
+            names.append(_write_part(path, len(names) + 1, previous, targets))
+        previous = chunk
+    if names:
+        names.append(_write_part(path, len(names) + 1, previous, targets))
+    targets.append(path)
+    if names:
+        _write_file(_tmp_path(path), lambda f: f.write(include_script(names)))
+    else:
+        requires, blocks = previous or (becky2sieve.BASE_REQUIRES, [])
+        _write_file(_tmp_path(path), lambda f: _write_chunk(f, requires, blocks))
+
+def _remove_temp_files(targets):
+    for target in targets:
+        try:
+            os.remove(_tmp_path(target))
+        except OSError:
+            pass
+
+def write_sieve_files(rules, path, max_bytes=None, check=None):
+    # path にスクリプトを書き出す。max_bytes (UTF-8 のバイト数) を超える場合は同じディレクトリに
+    # <名前>-1.sieve, <名前>-2.sieve, ... を書き、path はそれらを include する親スクリプトにする
+    # check: (親スクリプトの内容, include 関数) -> bool。すべての一時ファイルを書いた後、置き換える前に呼ぶ
+    #   (include 関数は分割したスクリプトの名前から、書き込んだ内容を返す)。
+    #   偽を返した場合は何も置き換えずに None を返す
+    # 1 ルールだけで上限を超える場合は ValueError。どちらの場合も前回のスクリプトはそのまま残る
+    # 戻り値: 分割したスクリプトのパスのリスト (分割しなかった場合は空)
+    targets = []    # 書き込み先のパス (一時ファイルは _tmp_path)。親スクリプトは最後
+    try:
+        if max_bytes is None:
+            targets.append(path)
+            _write_file(_tmp_path(path), lambda f: becky2sieve.write_sieve(rules, f))
+        else:
+            _write_split(rules, path, max_bytes, targets)
+        if check is not None:
+            directory = os.path.dirname(path)
+
+            def include(name):
+                return _read_file(_tmp_path(os.path.join(directory, name + '.sieve')))
+            if not check(_read_file(_tmp_path(path)), include):
+                _remove_temp_files(targets)
+                return None
+    except BaseException:
+        _remove_temp_files(targets)
+        raise
+    for target in targets:
+        os.replace(_tmp_path(target), target)
+    parts = targets[:-1]
+    remove_parts(path, len(parts) + 1)
+    return parts
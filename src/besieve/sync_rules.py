@@ -1,10 +1,26 @@
 import json
 import os
 import argparse
+import contextlib
+import io
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+from . import analyzer
+from . import atomic_write
 from . import becky2sieve
+from . import conversion_cache
+from . import managesieve
+from . import optimizer
 from . import sieve2becky
+from . import sieve_writer
+from . import sync_state
+from . import watcher
+from .folder_map import default_cache_dir
+
+# IFilter.def をエンコードして書き込む単位 (文字数)
+CHUNK_CHARS = 1 << 16
 
 def get_sieve_path(account):
     return os.path.join('config', 'sieve', f'{account}.sieve')
@@ -12,102 +28,558 @@ def get_sieve_path(account):
 def get_becky_filter_path(mb_path):
     return os.path.join(mb_path, 'IFilter.def')
 
-def convert_to_sieve(mappings, skip_verify=False):
-    print("Converting Becky! rules to Sieve...")
-    for entry in mappings:
-        account = entry['account']
-        mb_path = entry['path']
-        
-        becky_filter_path = get_becky_filter_path(mb_path)
-        sieve_path = get_sieve_path(account)
-        
-        if not os.path.exists(becky_filter_path):
-            print(f"[SKIP] Becky file not found for {account}: {becky_filter_path}")
-            continue
-            
-        print(f"[PROCESS] {account} (Becky -> Sieve)")
-        try:
-            with open(becky_filter_path, 'rb') as f:
-                content = f.read().decode('cp932', errors='replace')
-            
-            rules = becky2sieve.parse_becky_content(content)
-            sieve_code = becky2sieve.rules_to_sieve_string(rules)
-            
-            # ラウンドトリップテスト（相互変換でデータ欠損がないか確認）
+def account_files(mode, entry):
+    # (変換元, 出力先, フォルダ構成ディレクトリ) を返す
+    if mode == 'to-sieve':
+        return get_becky_filter_path(entry['path']), get_sieve_path(entry['account']), None
+    return get_sieve_path(entry['account']), get_becky_filter_path(entry['path']), entry['path']
+
+def conversion_settings(optimize=False, max_script_size=None):
+    # ステートに記録する変換オプション (既定値のみなら None)
+    settings = {}
+    if optimize:
+        settings['optimize'] = True
+    if max_script_size is not None:
+        settings['max_script_size'] = max_script_size
+    return settings or None
+
+def _collect(chunks, out):
+    # chunks をそのまま返しながら out に集める
+    for chunk in chunks:
+        out.append(chunk)
+        yield chunk
+
+def convert_account_to_sieve(entry, skip_verify=False, previous=None, cache_dir=None, optimize=False,
+                             max_script_size=None, conversion_cache_size=conversion_cache.DEFAULT_MAX_BYTES):
+    # 1アカウント分の変換。戻り値は (status, state record)
+    # status は 'ok' / 'unchanged' / 'skip' / 'error'
+    # optimize: 出力前に optimizer.optimize_rules でルールをまとめる
+    # max_script_size: 1 スクリプトの上限 (バイト)。超える場合は sieve_writer で分割して include する
+    # conversion_cache_size: cache_dir に置く変換結果のキャッシュの上限 (バイト、0 なら使わない)
+    #   同じ内容の IFilter.def とフォルダー構成は変換済みの結果を使う (分割する場合はルールが必要なため使わない)
+    account = entry['account']
+    mb_path = entry['path']
+
+    becky_filter_path = get_becky_filter_path(mb_path)
+    sieve_path = get_sieve_path(account)
+
+    if not os.path.exists(becky_filter_path):
+        print(f"[SKIP] Becky file not found for {account}: {becky_filter_path}")
+        return 'skip', None
+
+    try:
+        source_stat = sync_state.snapshot(becky_filter_path)
+        with open(becky_filter_path, 'rb') as f:
+            data = f.read()
+        source_hash = sync_state.digest(data)
+
+        settings = conversion_settings(optimize, max_script_size)
+        if sync_state.same_content(previous, becky_filter_path, source_hash, sieve_path,
+                                   settings=settings):
+            print(f"[SKIP] {account} unchanged since last run")
+            record = dict(previous, source_stat=source_stat)
+            return 'unchanged', record
+
+        folder_map = sieve2becky.build_folder_map(os.path.dirname(becky_filter_path),
+                                                  cache_dir=cache_dir, lazy=True)
+        key = cached = None
+        if cache_dir and conversion_cache_size and max_script_size is None:
+            key = conversion_cache.cache_key('to-sieve', source_hash, folder_map.fingerprint(), settings)
+            cached = conversion_cache.lookup(cache_dir, key, verified=not skip_verify)
+
+        if cached:
+            print(f"[PROCESS] {account} (Becky -> Sieve, cached)")
+            warnings = cached['warnings']
+        else:
+            print(f"[PROCESS] {account} (Becky -> Sieve)")
+            content = data.decode('cp932', errors='replace')
+            # 大きなアカウントでもメモリを抑えるため、省メモリのルール表現 (model.Rule) で読み込む
+            rules = becky2sieve.parse_becky_content(content, folder_map=folder_map, compact=True)
+            if optimize:
+                # ラウンドトリップテストは最適化後のルールに対して行う
+                rules = optimizer.optimize_rules(rules)
+            warnings = [analyzer.format_finding(f) for f in analyzer.regex_findings(rules)]
+
+        # サーバーの配送を遅くする正規表現を知らせる (変換は続ける)
+        # POSIX ERE にできない正規表現の条件は Sieve に書き出さない (invalid-regex の警告になる)
+        for warning in warnings:
+            print(f"[WARN] {account}: {warning}")
+
+        # Ensure dir exists
+        os.makedirs(os.path.dirname(sieve_path), exist_ok=True)
+
+        if cached:
+            # キャッシュの結果は保存時に検証済み (skip_verify で保存したものは検証する実行では使わない)
+            atomic_write.write_atomic(sieve_path, [cached['output'].encode('utf-8')])
+            sieve_writer.remove_parts(sieve_path)
+            parts = []
+        else:
+            check = None
             if not skip_verify:
                 mb_dir = os.path.dirname(becky_filter_path)
-                if not becky2sieve.verify_conversion(rules, sieve_code, mb_dir):
-                    print(f"[ERROR] ラウンドトリップテスト失敗: {account}. ファイル書き込みをスキップします。")
-                    continue
 
-            # Ensure dir exists
-            os.makedirs(os.path.dirname(sieve_path), exist_ok=True)
-            
-            with open(sieve_path, 'w', encoding='utf-8') as f:
-                f.write(sieve_code)
+                def check(script, include):
+                    # ラウンドトリップテスト（相互変換でデータ欠損がないか確認）
+                    # 分割したスクリプトは、置き換える前の一時ファイルの内容を読む
+                    return becky2sieve.verify_conversion(rules, script, mb_dir, include)
+            # ルールを描画しながら一時ファイルに書き、すべてそろってから置き換える
+            # 以前に分割して書き出したスクリプトが残っていれば削除される
+            parts = sieve_writer.write_sieve_files(rules, sieve_path, max_script_size, check)
+            if parts is None:
+                print(f"[ERROR] ラウンドトリップテスト失敗: {account}. ファイル書き込みをスキップします。")
+                return 'error', None
+        if parts:
+            print(f"[OK] Wrote {sieve_path} (split into {len(parts)} scripts)")
+        else:
             print(f"[OK] Wrote {sieve_path}")
-            
-        except Exception as e:
-            print(f"[ERROR] Failed to convert {account}: {e}")
+        with open(sieve_path, 'rb') as f:
+            output = f.read()
+        if key and not cached:
+            conversion_cache.store(cache_dir, key, output.decode('utf-8'), not skip_verify, warnings,
+                                   max_bytes=conversion_cache_size)
+        record = sync_state.make_record(becky_filter_path, source_stat, source_hash,
+                                        sieve_path, sync_state.digest(output),
+                                        settings=settings, dependencies=parts)
+        return 'ok', record
 
-def convert_to_becky(mappings, skip_verify=False):
-    print("Converting Sieve rules to Becky!...")
-    for entry in mappings:
-        account = entry['account']
-        mb_path = entry['path']
-        
-        becky_filter_path = get_becky_filter_path(mb_path)
-        sieve_path = get_sieve_path(account)
-        
-        if not os.path.exists(sieve_path):
-            print(f"[SKIP] Sieve file not found for {account}: {sieve_path}")
-            continue
+    except Exception as e:
+        print(f"[ERROR] Failed to convert {account}: {e}")
+        return 'error', None
 
-        if not os.path.exists(mb_path):
-            print(f"[WARN] Mailbox directory not found: {mb_path}. Mapping might be partial.")
-            
-        print(f"[PROCESS] {account} (Sieve -> Becky)")
-        try:
-            with open(sieve_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            folder_map = sieve2becky.build_folder_map(mb_path)
-            rules = sieve2becky.parse_sieve_content(content)
-            becky_code = sieve2becky.generate_becky_string(rules, folder_map)
-            
-            # ラウンドトリップテスト（相互変換でデータ欠損がないか確認）
-            if not skip_verify:
+def convert_account_to_becky(entry, skip_verify=False, previous=None, cache_dir=None,
+                             conversion_cache_size=conversion_cache.DEFAULT_MAX_BYTES):
+    # 1アカウント分の変換。戻り値は (status, state record)
+    # conversion_cache_size: convert_account_to_sieve と同じ (include したスクリプトの内容も確かめる)
+    account = entry['account']
+    mb_path = entry['path']
+
+    becky_filter_path = get_becky_filter_path(mb_path)
+    sieve_path = get_sieve_path(account)
+
+    if not os.path.exists(sieve_path):
+        print(f"[SKIP] Sieve file not found for {account}: {sieve_path}")
+        return 'skip', None
+
+    if not os.path.exists(mb_path):
+        print(f"[WARN] Mailbox directory not found: {mb_path}. Mapping might be partial.")
+
+    try:
+        source_stat = sync_state.snapshot(sieve_path)
+        with open(sieve_path, 'rb') as f:
+            data = f.read()
+        source_hash = sync_state.digest(data)
+
+        if sync_state.same_content(previous, sieve_path, source_hash, becky_filter_path, mb_path):
+            print(f"[SKIP] {account} unchanged since last run")
+            record = dict(previous, source_stat=source_stat)
+            return 'unchanged', record
+
+        # フォルダー一覧はキャッシュを使い、スクリプトが参照するフォルダーだけをデコードする
+        folder_map = sieve2becky.build_folder_map(mb_path, cache_dir=cache_dir, lazy=True)
+        sieve_dir = os.path.dirname(sieve_path)
+        key = cached = None
+        if cache_dir and conversion_cache_size:
+            key = conversion_cache.cache_key('to-becky', source_hash, folder_map.fingerprint())
+            cached = conversion_cache.lookup(cache_dir, key, verified=not skip_verify, base_dir=sieve_dir)
+
+        becky_code = None
+        collected = []
+        if cached:
+            print(f"[PROCESS] {account} (Sieve -> Becky, cached)")
+            becky_code = cached['output']
+            warnings = cached['warnings']
+            included = [os.path.join(sieve_dir, rel) for rel, _ in cached['dependencies']]
+        else:
+            print(f"[PROCESS] {account} (Sieve -> Becky)")
+            content = data.decode('utf-8')
+
+            # 分割したスクリプトは include 先も読み込み、ステートに記録する
+            included = []
+            def read(path):
+                included.append(path)
+                with open(path, 'r', encoding='utf-8') as f:
+                    return f.read()
+            # Becky! で表せない分岐は変換せずに知らせる
+            warnings = []
+            rules = sieve2becky.parse_sieve_content(
+                content, include=sieve2becky.file_includer(sieve_dir, read=read), compact=True,
+                warnings=warnings)
+            if skip_verify:
+                # 検証しない場合は出力全体を 1 つの文字列にせず、生成しながら書き込む
+                chunks = sieve2becky.iter_becky_chunks(rules, folder_map)
+                if key:
+                    chunks = _collect(chunks, collected)
+            else:
+                becky_code = sieve2becky.generate_becky_string(rules, folder_map)
+                # ラウンドトリップテスト（相互変換でデータ欠損がないか確認）
                 if not sieve2becky.verify_conversion(rules, becky_code):
                     print(f"[ERROR] ラウンドトリップテスト失敗: {account}. ファイル書き込みをスキップします。")
-                    continue
+                    return 'error', None
+        for warning in warnings:
+            print(f"[WARN] {account}: {warning}")
+        if becky_code is not None:
+            chunks = (becky_code[i:i + CHUNK_CHARS] for i in range(0, len(becky_code), CHUNK_CHARS))
 
-            with open(becky_filter_path, 'wb') as f:
-                f.write(becky_code.encode('cp932', errors='replace'))
-                
+        # 一時ファイルに書いてから置き換え、Becky! が書きかけのファイルを読まないようにする
+        # 内容が今のファイルと同じなら書き込まない (Becky! にフィルターを読み直させない)
+        written, output_hash = atomic_write.write_atomic(becky_filter_path,
+                                                         atomic_write.iter_encoded(chunks, 'cp932'))
+        if written:
             print(f"[OK] Wrote {becky_filter_path}")
+        else:
+            print(f"[OK] {becky_filter_path} is already up to date")
+        if key and not cached:
+            output = becky_code if becky_code is not None else ''.join(collected)
+            conversion_cache.store(cache_dir, key, output, not skip_verify, warnings,
+                                   dependencies=included, base_dir=sieve_dir,
+                                   max_bytes=conversion_cache_size)
+        record = sync_state.make_record(sieve_path, source_stat, source_hash,
+                                        becky_filter_path, output_hash, mb_path,
+                                        dependencies=included)
+        return 'ok', record
 
+    except Exception as e:
+        print(f"[ERROR] Failed to convert {account}: {e}")
+        return 'error', None
+
+def _run_captured(worker, entry, previous, options):
+    # ワーカープロセスでも出力順が崩れないよう、アカウント単位で出力を捕捉して返す
+    out = io.StringIO()
+    err = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            status, record = worker(entry, previous=previous, **options)
         except Exception as e:
-            print(f"[ERROR] Failed to convert {account}: {e}")
+            print(f"[ERROR] Failed to convert {entry.get('account')}: {e}")
+            status, record = 'error', None
+    return status, record, out.getvalue(), err.getvalue()
+
+def _run_accounts(mode, worker, mappings, jobs, state, force, options):
+    # 各アカウントを (並列) 実行し、becky.json の順序で結果を出力する
+    # 戻り値は失敗したアカウント名のリスト
+    if jobs is not None and jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    # stat だけで変更なしと分かるアカウントはワーカーに渡さない
+    settings = conversion_settings(options.get('optimize', False), options.get('max_script_size'))
+    previous = []
+    todo = []
+    for i, entry in enumerate(mappings):
+        record = None
+        if state is not None and not force:
+            record = state.get(sync_state.state_key(mode, entry['account']))
+        previous.append(record)
+        source, output, layout = account_files(mode, entry)
+        if not sync_state.is_fresh(record, source, output, layout, settings):
+            todo.append(i)
+
+    if not jobs or jobs == 1 or len(todo) <= 1:
+        results = (_run_captured(worker, mappings[i], previous[i], options) for i in todo)
+        return _report(mode, results, mappings, previous, todo, state)
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(todo))) as executor:
+        def run(indexes):
+            return executor.map(_run_captured, [worker] * len(indexes), [mappings[i] for i in indexes],
+                                [previous[i] for i in indexes], [options] * len(indexes))
+
+        first, rest = todo, []
+        if options.get('cache_dir') and options.get('conversion_cache_size'):
+            first, rest = _split_duplicates(mode, mappings, todo)
+        if not rest:
+            return _report(mode, run(todo), mappings, previous, todo, state)
+        # 同じ内容の変換元は、最初のアカウントの変換が終わってから変換する (変換キャッシュを使う)
+        done = dict(zip(first, run(first)))
+        later = run(rest)
+        results = (done[i] if i in done else next(later) for i in todo)
+        return _report(mode, results, mappings, previous, todo, state)
+
+def _split_duplicates(mode, mappings, todo):
+    # 変換するアカウントを、変換元の内容ごとの最初のもの (first) とそれ以外 (rest) に分ける
+    first = []
+    rest = []
+    seen = set()
+    for i in todo:
+        try:
+            with open(account_files(mode, mappings[i])[0], 'rb') as f:
+                source_hash = sync_state.digest(f.read())
+        except OSError:
+            first.append(i)
+            continue
+        if source_hash in seen:
+            rest.append(i)
+        else:
+            seen.add(source_hash)
+            first.append(i)
+    return first, rest
+
+def _report(mode, results, mappings, previous, todo, state):
+    failed = []
+    todo = set(todo)
+    for i, entry in enumerate(mappings):
+        if i in todo:
+            status, record, out, err = next(results)
+        else:
+            status, record = 'unchanged', previous[i]
+            out, err = f"[SKIP] {entry['account']} unchanged since last run\n", ''
+
+        if state is not None:
+            key = sync_state.state_key(mode, entry['account'])
+            if record is not None:
+                state[key] = record
+            else:
+                state.pop(key, None)
+
+        if err:
+            sys.stderr.write(err)
+            sys.stderr.flush()
+        if out:
+            sys.stdout.write(out)
+            sys.stdout.flush()
+        if status == 'error':
+            failed.append(entry['account'])
+    return failed
+
+def convert_to_sieve(mappings, skip_verify=False, jobs=1, state=None, force=False, cache_dir=None,
+                     optimize=False, max_script_size=None,
+                     conversion_cache_size=conversion_cache.DEFAULT_MAX_BYTES):
+    # state: sync_state.load_state() の結果。渡した場合は変更のないアカウントをスキップし、
+    # 結果を書き戻す (保存は呼び出し側)。force=True なら全アカウントを変換する
+    # cache_dir: フォルダー一覧や変換結果のキャッシュを置くディレクトリ (None ならキャッシュしない)
+    print("Converting Becky! rules to Sieve...")
+    sys.stdout.flush()
+    options = {'skip_verify': skip_verify, 'cache_dir': cache_dir, 'optimize': optimize,
+               'max_script_size': max_script_size, 'conversion_cache_size': conversion_cache_size}
+    return _run_accounts('to-sieve', convert_account_to_sieve, mappings, jobs, state, force, options)
+
+def convert_to_becky(mappings, skip_verify=False, jobs=1, state=None, force=False, cache_dir=None,
+                     conversion_cache_size=conversion_cache.DEFAULT_MAX_BYTES):
+    print("Converting Sieve rules to Becky!...")
+    sys.stdout.flush()
+    options = {'skip_verify': skip_verify, 'cache_dir': cache_dir,
+               'conversion_cache_size': conversion_cache_size}
+    return _run_accounts('to-becky', convert_account_to_becky, mappings, jobs, state, force, options)
+
+def account_scripts(account):
+    # アップロードするスクリプト [(名前, 内容)]。分割したスクリプトを先に、親スクリプトを最後に並べる
+    # サーバー上の名前はファイル名 (.sieve を除く) と同じにする (親スクリプトの include が参照するため)
+    sieve_path = get_sieve_path(account)
+    scripts = []
+    for path in sieve_writer.part_paths(sieve_path) + [sieve_path]:
+        with open(path, 'rb') as f:
+            scripts.append((os.path.splitext(os.path.basename(path))[0], f.read()))
+    return scripts
+
+def upload_account(entry, pool, server, admin=None, password=None, previous=None):
+    # 1アカウント分のアップロード。戻り値は (status, メッセージ, ステートに記録するアップロードの記録)
+    # becky.json の sieve_server / sieve_user / sieve_password でアカウントごとに上書きできる
+    # previous: 前回のアップロードの記録 ({'server', 'user', 'scripts': {名前: ハッシュ}})。
+    #   同じサーバー・ユーザーへの記録なら、サーバーからスクリプトを取得せずにハッシュで比べる
+    account = entry['account']
+    server = entry.get('sieve_server', server)
+    user = entry.get('sieve_user', account)
+    password = entry.get('sieve_password', password)
+    if not os.path.exists(get_sieve_path(account)):
+        return 'skip', f"[SKIP] Sieve file not found for {account}: {get_sieve_path(account)}", None
+    if password is None:
+        return 'error', f"[ERROR] Upload failed for {account}: no password (set BESIEVE_SIEVE_PASSWORD)", None
+    uploaded = None
+    if previous and previous.get('server') == server and previous.get('user') == user:
+        uploaded = previous.get('scripts')
+    try:
+        scripts = account_scripts(account)
+        # 管理者で認証する場合は、アカウントを authzid にして代理で操作する
+        login = (admin, password, user) if admin else (user, password)
+        with pool.session(server, *login) as conn:
+            changed = managesieve.upload_scripts(conn, scripts, uploaded)
+    except (OSError, managesieve.ManageSieveError) as e:
+        return 'error', f"[ERROR] Upload failed for {account}: {e}", None
+    record = {'server': server, 'user': user,
+              'scripts': {name: managesieve.digest(data) for name, data in scripts}}
+    if not changed:
+        return 'unchanged', f"[SKIP] {account} already up to date on {server}", record
+    return 'ok', f"[OK] Uploaded {len(changed)} script(s) for {account} to {server}", record
+
+def upload_to_server(mappings, server, jobs=1, admin=None, password=None, starttls=True, skip=(),
+                     connect=None, state=None):
+    # 書き出したスクリプトを ManageSieve でアップロードする。戻り値は失敗したアカウント名のリスト
+    # skip: アップロードしないアカウント (変換に失敗したものなど)
+    # 接続はサーバーごとに最大 jobs 本で、アカウントをまたいで再利用する
+    # connect: サーバー名 -> managesieve.Connection (テスト用。省略時は TCP で接続する)
+    # state: sync_state.load_state() の結果。渡した場合はアップロードした内容のハッシュを記録し、
+    #   次回は変更のないアカウントのスクリプトをサーバーから取得しない
+    print("Uploading Sieve scripts...")
+    sys.stdout.flush()
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    def connect_server(name):
+        host, port = managesieve.parse_server(name)
+        return managesieve.connect(host, port, starttls=starttls)
+
+    def upload(entry):
+        previous = state.get(sync_state.state_key('upload', entry['account'])) if state is not None else None
+        return upload_account(entry, pool, server, admin, password, previous)
+
+    pool = managesieve.ConnectionPool(connect or connect_server, size=jobs)
+    entries = [e for e in mappings if e['account'] not in skip]
+    failed = []
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(upload, entries)
+            # becky.json の順序で出力する
+            for entry, (status, message, record) in zip(entries, results):
+                print(message)
+                sys.stdout.flush()
+                if status == 'error':
+                    failed.append(entry['account'])
+                if state is not None and status != 'skip':
+                    # 失敗した場合は記録を消し、次回はサーバーの内容と比べる
+                    key = sync_state.state_key('upload', entry['account'])
+                    if record:
+                        state[key] = record
+                    else:
+                        state.pop(key, None)
+    finally:
+        pool.close()
+    return failed
+
+def watched_files(mode, entry, state=None):
+    # アカウントの変換元と、to-becky では include する分割スクリプト (<account>-N.sieve と、
+    # 前回の変換で読んだ include 先) の絶対パスのリスト
+    source = account_files(mode, entry)[0]
+    paths = [source]
+    if mode == 'to-becky':
+        paths += sieve_writer.part_paths(source)
+        record = state.get(sync_state.state_key(mode, entry['account'])) if state is not None else None
+        if record:
+            paths += [p for p, _ in record.get('dependencies', ())]
+    return list(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+def watch_accounts(mode, mappings, state=None, state_path=None, backend='auto', interval=1.0,
+                   debounce=2.0, stop_event=None, **options):
+    # 変換元ファイルを監視し、変更されたアカウントだけを再変換する
+    # Becky! の保存時は短時間に何度も書き込まれるため、debounce 秒間変化がなくなってから変換する
+    # to-becky では include する分割スクリプトも監視する (変換のたびに監視するファイルを更新する)
+    convert = convert_to_sieve if mode == 'to-sieve' else convert_to_becky
+    owners = {}  # 監視するパス -> mappings の位置
+
+    def run(entries):
+        convert(entries, state=state, **options)
+        if state is not None and state_path:
+            sync_state.save_state(state_path, state)
+        owners.clear()
+        for i, entry in enumerate(mappings):
+            for path in watched_files(mode, entry, state):
+                owners.setdefault(path, i)
+
+    # 起動時に一度全体を同期する (ステートがあれば変更分のみ)
+    run(mappings)
+
+    w = watcher.create_watcher(list(owners), backend=backend, interval=interval)
+    if w.fallback:
+        print(f"[WARN] inotify is not available ({w.fallback}); polling every {interval}s")
+    for d in w.missing:
+        print(f"[WARN] Directory not found, watching it once it is created: {d}")
+    print(f"Watching {len(owners)} file(s) for changes ({w.name})...")
+    sys.stdout.flush()
+    pending = {}  # 変換元パス -> 最後に変更を検出した時刻
+    try:
+        while stop_event is None or not stop_event.is_set():
+            timeout = debounce if pending else interval
+            for path in w.wait(timeout):
+                pending[path] = time.monotonic()
+            now = time.monotonic()
+            ready = [p for p, t in pending.items() if now - t >= debounce]
+            if not ready:
+                continue
+            for p in ready:
+                del pending[p]
+            changed = {owners[p] for p in ready if p in owners}
+            run([e for i, e in enumerate(mappings) if i in changed])
+            w.set_paths(list(owners))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        w.close()
 
 def main():
     parser = argparse.ArgumentParser(description='Batch convert mail rules.')
-    parser.add_argument('mode', choices=['to-sieve', 'to-becky'], help='Conversion direction')
+    parser.add_argument('mode', choices=['to-sieve', 'to-becky', 'watch'],
+                        help='Conversion direction, or watch to re-convert on file change')
+    parser.add_argument('--direction', choices=['to-sieve', 'to-becky'], default='to-sieve',
+                        help='Conversion direction for watch mode')
+    parser.add_argument('--backend', choices=['auto', 'inotify', 'poll'], default='auto',
+                        help='File watching backend for watch mode')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='Polling interval in seconds for watch mode')
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help='Seconds without further writes before re-converting in watch mode')
     parser.add_argument('--config', default='becky.json', help='Path to becky.json')
-    parser.add_argument('--skip-verify', action='store_true', 
+    parser.add_argument('--skip-verify', action='store_true',
                         help='ラウンドトリップテストをスキップする（データ欠損を許容する場合）')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes (0 = number of CPUs)')
+    parser.add_argument('--state', default=sync_state.default_state_path(),
+                        help='Path to the incremental sync state file')
+    parser.add_argument('--no-state', action='store_true',
+                        help='Do not read or write the state file')
+    parser.add_argument('--force', action='store_true',
+                        help='Convert every account even if nothing changed')
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                        help='Directory for cached mailbox folder listings')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use the cache directory')
+    parser.add_argument('--conversion-cache-size', type=int, default=conversion_cache.DEFAULT_MAX_BYTES,
+                        metavar='BYTES',
+                        help='Size limit of the cache of converted rules (0 = do not cache conversions)')
+    parser.add_argument('--optimize', action='store_true',
+                        help='to-sieve: merge duplicate conditions and adjacent rules with the same destination')
+    parser.add_argument('--max-script-size', type=int, default=None, metavar='BYTES',
+                        help='to-sieve: split scripts larger than BYTES into parts loaded with include')
+    parser.add_argument('--upload', metavar='HOST[:PORT]',
+                        help='to-sieve: upload the scripts with ManageSieve (password from BESIEVE_SIEVE_PASSWORD)')
+    parser.add_argument('--sieve-admin', metavar='USER',
+                        help='Authenticate as USER and upload on behalf of each account')
+    parser.add_argument('--no-starttls', action='store_true',
+                        help='Upload without STARTTLS (only for trusted local servers)')
     args = parser.parse_args()
-    
+
     if not os.path.exists(args.config):
         print(f"Config file not found: {args.config}")
         sys.exit(1)
-        
+
     with open(args.config, 'r', encoding='utf-8') as f:
         mappings = json.load(f)
-        
+
+    state = None if args.no_state else sync_state.load_state(args.state)
+    options = dict(skip_verify=args.skip_verify, jobs=args.jobs, state=state, force=args.force,
+                   cache_dir=None if args.no_cache else args.cache_dir,
+                   conversion_cache_size=args.conversion_cache_size)
+    if (args.direction if args.mode == 'watch' else args.mode) == 'to-sieve':
+        options['optimize'] = args.optimize
+        options['max_script_size'] = args.max_script_size
+
+    if args.mode == 'watch':
+        watch_accounts(args.direction, mappings, state_path=args.state, backend=args.backend,
+                       interval=args.interval, debounce=args.debounce, **options)
+        return
+
     if args.mode == 'to-sieve':
-        convert_to_sieve(mappings, skip_verify=args.skip_verify)
+        failed = convert_to_sieve(mappings, **options)
     else:
-        convert_to_becky(mappings, skip_verify=args.skip_verify)
+        failed = convert_to_becky(mappings, **options)
+
+    if args.upload and args.mode == 'to-sieve':
+        failed += upload_to_server(mappings, args.upload, jobs=args.jobs, admin=args.sieve_admin,
+                                   password=os.environ.get('BESIEVE_SIEVE_PASSWORD'),
+                                   starttls=not args.no_starttls, skip=failed, state=state)
+
+    if state is not None:
+        sync_state.save_state(args.state, state)
+
+    if failed:
+        print(f"[SUMMARY] {len(failed)}/{len(mappings)} account(s) failed: {', '.join(failed)}")
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
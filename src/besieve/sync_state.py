@@ -0,0 +1,114 @@
+"""
+sync-rules の差分実行用ステートファイル
+
+アカウントごとに変換元ファイルの mtime/サイズ/ハッシュと、
+生成したファイルのハッシュを記録し、変更のないアカウントを解析せずにスキップします。
+"""
+
+import hashlib
+import json
+import os
+
+STATE_VERSION = 1
+
+# 変換結果 (生成する Sieve / IFilter.def) のバージョン。変わった場合は全アカウントを再変換する
+# パッケージのバージョンとは別に、出力が変わる変更のたびに上げること (conversion_cache のキーにも使う)
+#   1: 初版
+#   2: optimizer のキーごとのエスケープと :regex の T 接尾辞
+#   3: write_sieve の [BODY] 用の require
+#   4: R 条件を POSIX ERE に変換
+#   5: POSIX ERE にできない R 条件をそのまま出力せず、変換をエラーにする
+#   6: Sieve -> Becky! で表せない分岐 (allof, elsif, ネストした if など) を広いルールにせず飛ばす
+#   7: POSIX ERE にできない R 条件は変換をエラーにせず、その条件だけを書き出さない。単語の先頭・末尾の \b を書き換える
+CONVERTER_VERSION = 7
+
+def default_state_path():
+    return os.path.join('config', 'sync-state.json')
+
+def load_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+        return {}
+    return state.get('accounts', {})
+
+def save_state(path, accounts):
+    # 途中で落ちても壊れたステートが残らないよう一時ファイル経由で置き換える
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': STATE_VERSION, 'accounts': accounts}, f,
+                  ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def state_key(mode, account):
+    return f"{mode}:{account}"
+
+def snapshot(path):
+    # [mtime_ns, size]。存在しない場合は None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def make_record(source, source_stat, source_hash, output, output_hash, layout=None, settings=None,
+                dependencies=None):
+    # 出力を書き込んだ後に呼ぶ (出力ファイル・ディレクトリの stat を記録するため)
+    # settings: 出力に影響する変換オプション ({'optimize': True} など)。変わった場合は再変換する
+    # dependencies: 変換元・出力以外に関係するファイル (分割したスクリプトや include 先)。
+    #               どれかの stat が変わった場合は再変換する
+    record = {
+        'converter': CONVERTER_VERSION,
+        'source': source,
+        'source_stat': source_stat,
+        'source_hash': source_hash,
+        'output': output,
+        'output_stat': snapshot(output),
+        'output_hash': output_hash,
+    }
+    if layout is not None:
+        record['layout'] = layout
+        record['layout_stat'] = snapshot(layout)
+    if settings is not None:
+        record['settings'] = settings
+    if dependencies:
+        record['dependencies'] = [[p, snapshot(p)] for p in dependencies]
+    return record
+
+def _output_untouched(record, output, layout, settings):
+    if record.get('converter') != CONVERTER_VERSION or record.get('output') != output:
+        return False
+    if record.get('settings') != settings:
+        return False
+    if record.get('output_stat') is None or snapshot(output) != record['output_stat']:
+        return False
+    if layout is not None:
+        if record.get('layout') != layout or snapshot(layout) != record.get('layout_stat'):
+            return False
+    for p, stat in record.get('dependencies', ()):
+        if stat is None or snapshot(p) != stat:
+            return False
+    return True
+
+def is_fresh(record, source, output, layout=None, settings=None):
+    # stat のみで判定する高速パス (ファイルを読まない)
+    if not record or record.get('source') != source:
+        return False
+    if record.get('source_stat') is None or snapshot(source) != record['source_stat']:
+        return False
+    return _output_untouched(record, output, layout, settings)
+
+def same_content(record, source, source_hash, output, layout=None, settings=None):
+    # mtime は変わったが内容が同じ場合 (touch やコピーし直し)
+    if not record or record.get('source') != source or record.get('source_hash') != source_hash:
+        return False
+    return _output_untouched(record, output, layout, settings)
@@ -0,0 +1,119 @@
+"""
+ラウンドトリップ検証
+
+ルールを正規形 (フォルダー・アクション・条件のタプル) に 1 回だけ変換し、
+元のルール列と再パースしたルール列を 1 パスで比較して、すべての不一致を報告します。
+"""
+
+import difflib
+from collections import namedtuple
+
+from .model import Condition, FLAG_ORDER, mask_to_flags
+from .regex_dialect import canonical as canonical_regex
+
+# 変換で意味を持つ Becky! のフラグ (I: 大文字小文字無視, R: 正規表現, T: 前方一致)
+SEMANTIC_FLAGS = frozenset('IRT')
+
+# model.Condition のビットマスク -> 正規形のフラグ文字列
+_MASK_FLAGS = [''.join(sorted(SEMANTIC_FLAGS.intersection(mask_to_flags(m))))
+               for m in range(1 << len(FLAG_ORDER))]
+
+# rule: 1 始まりのルール番号 (元のルール列の位置), field: 'count' / 'folder' / 'actions' / 'conditions' / 'rule'
+Mismatch = namedtuple('Mismatch', 'rule field expected actual')
+
+def is_list_value(value):
+    # '["a", "b"]' 形式の値 (Sieve の文字列リストを 1 つの値にまとめたもの)
+    return value.startswith('[') and value.endswith(']') and '", "' in value
+
+def split_list_value(value):
+    inner = value[1:-1].strip()
+    return [e for e in (v.strip().strip('"').strip() for v in inner.split(',')) if e]
+
+def _canonical_header(header):
+    # 'Subject, To' と 'subject,to' を同じものとして扱う
+    if ',' in header:
+        return ', '.join(h.strip().lower() for h in header.split(','))
+    return header.lower()
+
+def canonical_conditions(conditions):
+    # 条件は OR で並ぶため順序は意味を持たない。リスト形式の値は個別の条件に展開する
+    result = []
+    for c in conditions:
+        if type(c) is Condition:
+            # 省メモリのルールはフラグのリストを作らずにビットマスクから引く
+            header = _canonical_header(c.header)
+            flags = _MASK_FLAGS[c.mask]
+            value = c.value
+        else:
+            header = _canonical_header(c['header'])
+            flags = ''.join(sorted(SEMANTIC_FLAGS.intersection(c.get('flags', ()))))
+            value = c['value']
+        # 正規表現は ERE に変換した形で比べる (Sieve から戻すと \d が [0-9] になるため)
+        regex = 'R' in flags
+        if is_list_value(value):
+            for v in split_list_value(value):
+                result.append((header, canonical_regex(v) if regex else v, flags))
+        else:
+            result.append((header, canonical_regex(value) if regex else value, flags))
+    result.sort()
+    return tuple(result)
+
+def canonical_rule(rule):
+    # (フォルダー, アクション, 条件) のタプル。ハッシュ可能で、比較はタプルの比較 1 回で済む
+    # アクションは順序と重複も意味を持つため、そのまま比べる
+    return (rule.get('folder'), tuple(rule.get('actions', ())),
+            canonical_conditions(rule['conditions']))
+
+def _diff_rule(index, expected, actual, mismatches):
+    if expected[0] != actual[0]:
+        mismatches.append(Mismatch(index, 'folder', expected[0], actual[0]))
+    if expected[1] != actual[1]:
+        mismatches.append(Mismatch(index, 'actions', list(expected[1]), list(actual[1])))
+    if expected[2] != actual[2]:
+        exp, act = set(expected[2]), set(actual[2])
+        mismatches.append(Mismatch(index, 'conditions', sorted(exp - act), sorted(act - exp)))
+
+def compare_rules(original_rules, reverted_rules):
+    # 不一致 (Mismatch) のリストを返す。空なら一致
+    original = [canonical_rule(r) for r in original_rules]
+    reverted = [canonical_rule(r) for r in reverted_rules]
+    mismatches = []
+
+    if len(original) == len(reverted):
+        # 通常はルール数が同じなので、位置ごとに比較するだけで済む
+        for i, (exp, act) in enumerate(zip(original, reverted)):
+            if exp != act:
+                _diff_rule(i + 1, exp, act, mismatches)
+        return mismatches
+
+    # ルールの欠落・追加がある場合は対応を取り直し、ずれた後ろのルールを誤って報告しない
+    mismatches.append(Mismatch(0, 'count', len(original), len(reverted)))
+    matcher = difflib.SequenceMatcher(None, original, reverted, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        if tag == 'replace' and i2 - i1 == j2 - j1:
+            for k in range(i2 - i1):
+                _diff_rule(i1 + k + 1, original[i1 + k], reverted[j1 + k], mismatches)
+            continue
+        for k in range(i1, i2):
+            mismatches.append(Mismatch(k + 1, 'rule', original[k], None))
+        for k in range(j1, j2):
+            mismatches.append(Mismatch(i1 + 1, 'rule', None, reverted[k]))
+    return mismatches
+
+def describe(mismatch):
+    # 表示用のメッセージ
+    m = mismatch
+    if m.field == 'count':
+        return f"ルール数の不一致。 元: {m.expected}, 復元: {m.actual}"
+    prefix = f"ルール #{m.rule}:"
+    if m.field == 'folder':
+        return f"{prefix} フォルダ不一致。 '{m.expected}' vs '{m.actual}'"
+    if m.field == 'actions':
+        return f"{prefix} アクション不一致。 元: {m.expected}, 復元: {m.actual}"
+    if m.field == 'conditions':
+        return f"{prefix} 条件不一致。 欠落: {m.expected}, 余分: {m.actual}"
+    if m.expected is None:
+        return f"{prefix} 復元側にのみ存在するルール: {m.actual}"
+    return f"{prefix} 復元されなかったルール: {m.expected}"
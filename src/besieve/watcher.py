@@ -0,0 +1,189 @@
+"""
+ファイル変更の監視
+
+sync-rules watch で使用します。inotify が使える環境 (Linux) では inotify を、
+それ以外では stat のポーリングで変更を検出します。
+inotify はディレクトリ単位で監視するため、まだ存在しないディレクトリのファイルは、
+ディレクトリが作られるまで wait のたびに監視を再試行します。
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+def _snapshot(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+class PollingWatcher:
+    # stat を定期的に比較する汎用バックエンド
+    name = 'poll'
+    fallback = None  # create_watcher が inotify の代わりに使った場合の理由
+
+    def __init__(self, paths, interval=1.0):
+        self.interval = interval
+        self.paths = []
+        self.missing = {}  # ポーリングはディレクトリがなくても監視できる
+        self._stats = {}
+        self.set_paths(paths)
+
+    def set_paths(self, paths):
+        # 監視するパスを置き換える (引き続き監視するパスの状態はそのまま)
+        self.paths = [os.path.abspath(p) for p in paths]
+        self._stats = {p: self._stats[p] if p in self._stats else _snapshot(p) for p in self.paths}
+
+    def wait(self, timeout=None):
+        # timeout 秒以内に変更されたパスの集合を返す
+        deadline = time.monotonic() + (self.interval if timeout is None else timeout)
+        while True:
+            changed = set()
+            for p in self.paths:
+                st = _snapshot(p)
+                if st != self._stats[p]:
+                    self._stats[p] = st
+                    changed.add(p)
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    # Linux の inotify を ctypes 経由で使うバックエンド
+    # Becky! は一時ファイル経由で保存することがあるため、親ディレクトリを監視する
+    name = 'inotify'
+    fallback = None
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self, paths, interval=1.0):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.interval = interval
+        self.paths = []
+        self._watches = {}  # 監視しているディレクトリ -> wd
+        self._dirs = {}     # wd -> {ファイル名: フルパス}
+        self.missing = {}   # 監視できなかったディレクトリ -> {ファイル名: フルパス}
+        try:
+            self.set_paths(paths)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, d):
+        # ディレクトリの監視を始める。ディレクトリがなければ None
+        mask = (self.IN_MODIFY | self.IN_ATTRIB | self.IN_CLOSE_WRITE |
+                self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE)
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(d), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return None
+            raise OSError(err, f"inotify_add_watch failed: {d}")
+        self._watches[d] = wd
+        return wd
+
+    def set_paths(self, paths):
+        # 監視するパスを置き換える。監視済みのディレクトリはそのまま使い、不要になった名前は無視する
+        self.paths = [os.path.abspath(p) for p in paths]
+        by_dir = {}
+        for p in self.paths:
+            by_dir.setdefault(os.path.dirname(p), {})[os.path.basename(p)] = p
+        for wd in self._dirs:
+            self._dirs[wd] = {}
+        self.missing = {}
+        for d, names in by_dir.items():
+            wd = self._watches.get(d)
+            if wd is None:
+                wd = self._add_watch(d)
+            if wd is None:
+                self.missing[d] = names
+            else:
+                self._dirs[wd] = names
+
+    def _retry_missing(self):
+        # ディレクトリが作られていれば監視を始め、監視の前に作られたファイルを変更として返す
+        changed = set()
+        for d, names in list(self.missing.items()):
+            wd = self._add_watch(d)
+            if wd is None:
+                continue
+            del self.missing[d]
+            self._dirs[wd] = names
+            changed.update(p for p in names.values() if os.path.exists(p))
+        return changed
+
+    def wait(self, timeout=None):
+        # ディレクトリが見つからないパスがある間は、interval ごとに監視を再試行する
+        if self.missing:
+            changed = self._retry_missing()
+            if changed:
+                return changed
+            if self.missing:
+                timeout = self.interval if timeout is None else min(timeout, self.interval)
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos + self._EVENT.size <= len(data):
+                wd, mask, cookie, length = self._EVENT.unpack_from(data, pos)
+                pos += self._EVENT.size
+                name = data[pos:pos + length].rstrip(b'\0')
+                pos += length
+                path = self._dirs.get(wd, {}).get(os.fsdecode(name))
+                if path:
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def create_watcher(paths, backend='auto', interval=1.0):
+    # backend: 'auto' (inotify が使えれば inotify) / 'inotify' / 'poll'
+    # auto で inotify を使えなかった場合は、ポーリングの watcher の fallback にその理由を入れる
+    reason = None
+    if backend in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher(paths, interval=interval)
+        except (OSError, AttributeError) as e:
+            if backend == 'inotify':
+                raise
+            reason = str(e)
+    w = PollingWatcher(paths, interval=interval)
+    w.fallback = reason
+    return w
@@ -0,0 +1,165 @@
+"""
+テスト用の ManageSieve サーバー (RFC 5804 の一部)
+
+SASL PLAIN (代理認証を含む)、UNAUTHENTICATE、LISTSCRIPTS、GETSCRIPT、PUTSCRIPT、
+CHECKSCRIPT、SETACTIVE、LOGOUT に対応し、スクリプトはメモリー上に保存します。
+スクリプトの構文は besieve.sieve_parser で確認します。
+"""
+
+import base64
+import os
+import socketserver
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import managesieve
+from besieve import sieve_parser
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.user = None
+        self.write_line(b'"IMPLEMENTATION" "besieve test server"')
+        self.write_line(b'"SASL" "PLAIN"')
+        self.write_line(b'"SIEVE" "fileinto mailbox regex body include"')
+        if server.unauthenticate:
+            self.write_line(b'"UNAUTHENTICATE"')
+        self.write_line(b'"VERSION" "1.0"')
+        self.reply('OK', 'ready')
+        while True:
+            try:
+                tokens = managesieve.read_tokens(self.rfile)
+            except (OSError, managesieve.ManageSieveError):
+                return
+            if tokens is None:
+                return
+            if not tokens or not isinstance(tokens[0], str):
+                self.reply('NO', 'bad command')
+                continue
+            name = tokens[0].upper()
+            with server.lock:
+                server.commands.append((self.user, name))
+            method = getattr(self, 'do_' + name, None)
+            if method is None:
+                self.reply('NO', f'unknown command {name}')
+            elif self.user is None and name not in ('AUTHENTICATE', 'LOGOUT', 'NOOP'):
+                self.reply('NO', 'not authenticated')
+            elif method(*tokens[1:]) is False:
+                return
+
+    def write_line(self, data):
+        self.wfile.write(data + b'\r\n')
+
+    def reply(self, status, text='', code=None):
+        line = status.encode('ascii')
+        if code:
+            line += b' (' + code.encode('ascii') + b')'
+        if text:
+            line += b' "' + text.encode('utf-8').replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+        self.write_line(line)
+
+    def _scripts(self):
+        return self.server.scripts.setdefault(self.user, {})
+
+    def _check(self, data):
+        try:
+            sieve_parser.parse(data.decode('utf-8'))
+        except (UnicodeDecodeError, sieve_parser.SieveSyntaxError) as e:
+            self.reply('NO', str(e))
+            return False
+        return True
+
+    def do_AUTHENTICATE(self, mechanism, token=b''):
+        try:
+            authzid, authcid, password = base64.b64decode(token).decode('utf-8').split('\0')
+        except ValueError:
+            self.reply('NO', 'bad token')
+            return
+        if mechanism != b'PLAIN' or self.server.passwords.get(authcid) != password:
+            self.reply('NO', 'authentication failed', 'AUTH-TOO-WEAK' if mechanism != b'PLAIN' else None)
+            return
+        if authzid and authzid != authcid and authcid not in self.server.admins:
+            self.reply('NO', 'not authorized')
+            return
+        self.user = authzid or authcid
+        self.reply('OK', 'authenticated')
+
+    def do_UNAUTHENTICATE(self):
+        self.user = None
+        self.reply('OK')
+
+    def do_NOOP(self, *args):
+        self.reply('OK')
+
+    def do_LISTSCRIPTS(self):
+        active = self.server.active.get(self.user)
+        for name in sorted(self._scripts()):
+            line = b'"' + name.encode('utf-8') + b'"'
+            self.write_line(line + b' ACTIVE' if name == active else line)
+        self.reply('OK')
+
+    def do_GETSCRIPT(self, name):
+        data = self._scripts().get(name.decode('utf-8'))
+        if data is None:
+            self.reply('NO', 'no such script', 'NONEXISTENT')
+            return
+        self.wfile.write(b'{%d}\r\n' % len(data) + data + b'\r\n')
+        self.reply('OK')
+
+    def do_CHECKSCRIPT(self, data):
+        if self._check(data):
+            self.reply('OK')
+
+    def do_PUTSCRIPT(self, name, data):
+        if self._check(data):
+            with self.server.lock:
+                self._scripts()[name.decode('utf-8')] = data
+            self.reply('OK')
+
+    def do_SETACTIVE(self, name):
+        name = name.decode('utf-8')
+        if name and name not in self._scripts():
+            self.reply('NO', 'no such script', 'NONEXISTENT')
+            return
+        self.server.active[self.user] = name
+        self.reply('OK')
+
+    def do_LOGOUT(self):
+        self.reply('OK', 'bye')
+        return False
+
+class FakeManageSieveServer(socketserver.ThreadingTCPServer):
+    # passwords: ユーザー -> パスワード, admins: 他のユーザーとして代理認証できるユーザー
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, passwords, admins=(), unauthenticate=True):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.passwords = passwords
+        self.admins = set(admins)
+        self.unauthenticate = unauthenticate
+        self.scripts = {}   # ユーザー -> {スクリプト名: 内容}
+        self.active = {}    # ユーザー -> 有効なスクリプト名
+        self.connections = 0
+        self.commands = []  # (ユーザー, コマンド名)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.server_address
+        return f"{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
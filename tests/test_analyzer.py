@@ -0,0 +1,91 @@
+import unittest
+import os
+import sys
+import time
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import analyzer
+
+def _rule(folder, *conds, **extra):
+    rule = {'folder': folder, 'actions': [],
+            'conditions': [{'header': h, 'value': v, 'flags': list(flags)} for h, v, flags in conds]}
+    rule.update(extra)
+    return rule
+
+def _kinds(findings):
+    return [(f.kind, f.rule, f.condition, f.related) for f in findings]
+
+class TestAnalyzer(unittest.TestCase):
+
+    def test_shadowed_rules_and_conditions(self):
+        rules = [
+            _rule('INBOX.Invoice', ('Subject', 'invoice', 'I')),
+            _rule('INBOX.Other', ('Subject', 'Monthly INVOICE', 'I'), ('Subject', 'receipt', 'I')),
+            _rule('INBOX.Prefix', ('Subject', '[ML:', 'IT')),
+            _rule('INBOX.Longer', ('Subject', '[ml:123', 'T'), ('X-ML-Name', 'ml', 'I')),
+            _rule('INBOX.Again', ('Subject', 'receipt', 'I'), ('X-ML-Name', 'ML', 'I')),
+        ]
+        self.assertEqual(_kinds(analyzer.analyze(rules)), [
+            ('shadowed-condition', 2, 1, (1,)),
+            ('shadowed-condition', 4, 1, (3,)),
+            ('shadowed-rule', 5, None, (2, 4)),
+        ])
+
+    def test_case_and_stop(self):
+        rules = [
+            # 大文字小文字を区別するキーは、無視するキーを包含しない
+            _rule('INBOX.A', ('Subject', 'Sale', '')),
+            _rule('INBOX.B', ('Subject', 'big sale', 'I')),
+            # stop のないルールは後ろのルールを隠さない
+            _rule('INBOX.C', ('From', 'example.com', 'I'), stop=False),
+            _rule('INBOX.D', ('From', 'news@example.com', 'I')),
+            # 複数ヘッダーの条件は、すべてのヘッダーが隠される場合だけ報告する
+            _rule('INBOX.E', ('X-Tag', 'urgent', 'I')),
+            _rule('INBOX.F', ('X-Tag, X-Other', 'urgent', 'I')),
+            _rule('INBOX.G', ('[body]', 'a\\(b', 'R')),
+            _rule('INBOX.H', ('[body]', 'a\\(b', 'IR')),
+        ]
+        self.assertEqual(analyzer.analyze(rules), [])
+
+    def test_duplicates_and_subsumed(self):
+        rules = [
+            _rule('INBOX.A', ('Subject', 'hello', 'I'), ('subject', 'HELLO', 'I'),
+                  ('Subject', 'say hello', ''), ('From', 'x', 'I')),
+            _rule('INBOX.A', ('From', 'x', 'I'), ('Subject', 'hello', 'I'), stop=False),
+            _rule('INBOX.B', ('Subject', 'abc', 'I')),
+            _rule('INBOX.A', ('From', 'x', 'I'), ('Subject', 'hello', 'I'), stop=False),
+            _rule('INBOX.Empty'),
+        ]
+        rules[4]['conditions'] = []
+        findings = analyzer.analyze(rules)
+        self.assertEqual(_kinds(findings), [
+            ('duplicate-condition', 1, 2, ()),
+            ('subsumed-condition', 1, 3, ()),
+            ('shadowed-rule', 2, None, (1,)),
+            ('duplicate-rule', 4, None, (2,)),
+            ('empty-rule', 5, None, ()),
+        ])
+        self.assertEqual(analyzer.format_finding(findings[1]),
+                         "rule 1 condition 3 ('say hello'): subsumed by another condition in the same rule")
+
+    def test_large_rule_set(self):
+        # 2 万ルールでも総当たりにならないこと
+        words = ['invoice', 'newsletter', 'report', 'meeting', 'notice']
+        rules = []
+        for i in range(20000):
+            word = words[i % len(words)]
+            conds = [('From', f'{word}{i}@{word}{i % 97}.example.com', 'I')]
+            if i % 4 == 0:
+                conds.append(('Subject', f'[{word}:{i * 7919 % 20011}]', 'I'))
+            rules.append(_rule(f'INBOX.{i % 300}', *conds))
+        rules.append(_rule('INBOX.Last', ('From', 'invoice5@invoice5.example.com', 'I')))
+        start = time.perf_counter()
+        findings = analyzer.analyze(rules)
+        # 遅い CI 環境でも通るよう余裕を持たせている (通常は 1 秒を大きく下回る)
+        self.assertLess(time.perf_counter() - start, 2.5)
+        self.assertEqual(_kinds(findings), [('shadowed-rule', 20001, None, (6,))])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import atomic_write
+from besieve import sync_state
+
+class TestAtomicWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'IFilter.def')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_write_skip_and_replace(self):
+        data = [b'Version=1\r\n', b':Begin ""\r\n', b':End ""\r\n']
+        self.assertEqual(atomic_write.write_atomic(self.path, iter(data)),
+                         (True, sync_state.digest(b''.join(data))))
+        self.assertEqual(self._read(), b''.join(data))
+
+        # 同じ内容なら置き換えない (チャンクの区切りが違っても同じ)
+        inode = os.stat(self.path).st_ino
+        written, _ = atomic_write.write_atomic(self.path, [b''.join(data)[:5], b''.join(data)[5:]])
+        self.assertFalse(written)
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+
+        # 途中から違う場合・短くなった場合・長くなった場合
+        for new in ([b'Version=1\r\n', b':Begin "x"\r\n'], [b'Version=1\r\n'],
+                    data + [b'tail\r\n']):
+            written, _ = atomic_write.write_atomic(self.path, new)
+            self.assertTrue(written)
+            self.assertEqual(self._read(), b''.join(new))
+        self.assertEqual(os.listdir(self.tmp), ['IFilter.def'])
+
+    def test_failure_keeps_old_file(self):
+        atomic_write.write_atomic(self.path, [b'old\r\n'])
+
+        def chunks():
+            yield b'new\r\n'
+            raise RuntimeError('conversion failed')
+        with self.assertRaises(RuntimeError):
+            atomic_write.write_atomic(self.path, chunks())
+        self.assertEqual(self._read(), b'old\r\n')
+        self.assertEqual(os.listdir(self.tmp), ['IFilter.def'])
+
+    def test_iter_encoded(self):
+        texts = ['あい', 'う☃', '']
+        self.assertEqual(b''.join(atomic_write.iter_encoded(texts)), 'あいう?'.encode('cp932'))
+
+if __name__ == '__main__':
+    unittest.main()
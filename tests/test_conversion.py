@@ -1,4 +1,5 @@
 import unittest
+import io
 import os
 import sys
 
@@ -7,6 +8,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
 
 from besieve import becky2sieve
 from besieve import sieve2becky
+from besieve import folder_codec
 
 class TestConversion(unittest.TestCase):
 
@@ -16,6 +18,14 @@ class TestConversion(unittest.TestCase):
         # "メイズ" -> &MOEwpDC6-
         self.assertEqual(becky2sieve.modified_utf7_decode('&MOEwpDC6-'), 'メイズ')
         
+    def test_utf7_encode(self):
+        self.assertEqual(folder_codec.modified_utf7_encode('印刷'), '&U3BSNw-')
+        self.assertEqual(folder_codec.modified_utf7_encode('a&b'), 'a&-b')
+        for name in ['メイズ', 'Work', '日本語 フォルダ', 'Ünïcödé', '&&', '😀x']:
+            encoded = folder_codec.modified_utf7_encode(name)
+            self.assertTrue(all(0x20 <= ord(ch) < 0x7f for ch in encoded))
+            self.assertEqual(folder_codec.modified_utf7_decode(encoded), name)
+
     def test_decode_folder_path_becky2sieve(self):
         # Test complex nested path from Becky filename
         raw = r'45bee44e.mb\#account#INBOX[1f].&U3BSNw-[3a].ini'
@@ -39,6 +49,30 @@ class TestConversion(unittest.TestCase):
         self.assertEqual(conds[0]['header'], 'From')
         self.assertEqual(conds[0]['value'], 'example.com')
 
+    def test_iter_becky_rules_streaming(self):
+        """
+        iter_becky_rules がバイナリストリームから cp932 をデコードし、:End ごとにルールを返すかテスト
+        """
+        becky = ('Version=1\r\n'
+                 ':Begin ""\r\n!M:45bee44e.mb\\#account#INBOX[1f].&U3BSNw-[3a].ini\r\n'
+                 '@0:Subject:請求書\tO\tI\r\n$O:Sort=1\r\n:End ""\r\n').encode('cp932')
+        with open(os.path.join(os.path.dirname(__file__), 'data', 'dummy_IFilter_complex.def'), 'rb') as f:
+            complex_data = f.read()
+
+        # ストリーム全体の結果は parse_becky_content と一致する
+        rules = list(becky2sieve.iter_becky_rules(io.BytesIO(becky + complex_data)))
+        expected = becky2sieve.parse_becky_content((becky + complex_data).decode('cp932'))
+        self.assertEqual(rules, expected)
+        self.assertEqual(rules[0]['folder'], 'INBOX.印刷')
+        self.assertEqual(rules[0]['conditions'][0]['value'], '請求書')
+
+        # 最初のルールはファイルを最後まで読む前に得られる
+        def lines():
+            yield from io.BytesIO(becky)
+            raise AssertionError("read past the first rule")
+        it = becky2sieve.iter_becky_rules(lines())
+        self.assertEqual(next(it)['folder'], 'INBOX.印刷')
+
     def test_round_trip_becky_dummy(self):
         dummy_becky = os.path.join(os.path.dirname(__file__), 'data', 'dummy_IFilter.def')
         if not os.path.exists(dummy_becky):
@@ -223,5 +257,25 @@ if address :contains "From" ["user1@example.com", "user2@example.com", "user3@ex
         self.assertIn('user2@example.com', sieve_code_2)
         self.assertIn('user3@example.com', sieve_code_2)
 
+    def test_write_becky_matches_string(self):
+        # バッチの境界をまたいでも generate_becky_string と同じ内容になる
+        rules = []
+        for i in range(7):
+            rules.append({'folder': f'INBOX.F{i % 3}', 'actions': ['keep'] if i == 4 else [],
+                          'conditions': [{'header': 'reply-to, subject', 'value': f'v{i}', 'flags': ['I']},
+                                         {'header': 'From', 'value': f'["a{i}", "b{i}"]', 'flags': []}]})
+        rules.append({'folder': 'INBOX.Missing', 'actions': [], 'conditions': rules[0]['conditions']})
+        folder_map = {f'INBOX.F{i}': f'45bee44e.mb\\F{i}.ini' for i in range(3)}
+        expected = sieve2becky.generate_becky_string(rules, folder_map)
+        self.assertIn('@0:Reply-To, Subject:v0\tO\tI\n', expected)
+        self.assertIn('@0:From:a1\tO\t\n@0:From:b1\tO\t\n', expected)
+        self.assertTrue(expected.endswith(':End ""'))
+        for batch in (1, 2, 3, 100):
+            chunks = list(sieve2becky.iter_becky_chunks(iter(rules), folder_map, batch=batch))
+            self.assertEqual(''.join(chunks), expected)
+        out = io.StringIO()
+        sieve2becky.write_becky(rules, folder_map, out)
+        self.assertEqual(out.getvalue(), expected)
+
 if __name__ == '__main__':
     unittest.main()
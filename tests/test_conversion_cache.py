@@ -0,0 +1,95 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import conversion_cache
+from besieve.folder_map import FolderMap, LazyFolderMap
+
+class TestConversionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_key(self):
+        key = conversion_cache.cache_key('to-sieve', 'abc', 'f1', {'optimize': True})
+        self.assertEqual(key, conversion_cache.cache_key('to-sieve', 'abc', 'f1', {'optimize': True}))
+        for other in [('to-becky', 'abc', 'f1', {'optimize': True}),
+                      ('to-sieve', 'abd', 'f1', {'optimize': True}),
+                      ('to-sieve', 'abc', 'f2', {'optimize': True}),
+                      ('to-sieve', 'abc', 'f1', None)]:
+            self.assertNotEqual(key, conversion_cache.cache_key(*other))
+
+        # 変換結果のバージョンが変わると、同じ入力でも別のキーになる (パッケージのバージョンは関係しない)
+        original = conversion_cache.CONVERTER_VERSION
+        conversion_cache.CONVERTER_VERSION = original + 1
+        try:
+            self.assertNotEqual(key, conversion_cache.cache_key('to-sieve', 'abc', 'f1', {'optimize': True}))
+        finally:
+            conversion_cache.CONVERTER_VERSION = original
+
+    def test_folder_fingerprint(self):
+        entries = ['#account#INBOX.ini', '!!!!Inbox\\']
+        work_dir = os.path.join(self.tmp, '45bee44e.mb')
+        self.assertEqual(FolderMap(work_dir, entries).fingerprint(),
+                         LazyFolderMap(work_dir, entries).fingerprint())
+        self.assertNotEqual(FolderMap(work_dir, entries).fingerprint(),
+                            FolderMap(work_dir, entries[:1]).fingerprint())
+        self.assertNotEqual(FolderMap(work_dir, entries).fingerprint(),
+                            FolderMap(os.path.join(self.tmp, 'other.mb'), entries).fingerprint())
+
+    def test_store_and_lookup(self):
+        key = conversion_cache.cache_key('to-sieve', 'abc')
+        self.assertIsNone(conversion_cache.lookup(self.tmp, key))
+        self.assertTrue(conversion_cache.store(self.tmp, key, 'require ["fileinto"];\n', True, ['warn']))
+        entry = conversion_cache.lookup(self.tmp, key)
+        self.assertEqual(entry['output'], 'require ["fileinto"];\n')
+        self.assertEqual(entry['warnings'], ['warn'])
+
+        # 検証せずに保存した結果は、検証する実行では使わない
+        key2 = conversion_cache.cache_key('to-sieve', 'abd')
+        conversion_cache.store(self.tmp, key2, 'x', False)
+        self.assertIsNone(conversion_cache.lookup(self.tmp, key2))
+        self.assertIsNotNone(conversion_cache.lookup(self.tmp, key2, verified=False))
+
+    def test_dependencies(self):
+        part = os.path.join(self.tmp, 'user.part1.sieve')
+        with open(part, 'w', encoding='utf-8') as f:
+            f.write('if true { stop; }\n')
+        key = conversion_cache.cache_key('to-becky', 'abc')
+        conversion_cache.store(self.tmp, key, 'out', True, dependencies=[part], base_dir=self.tmp)
+        entry = conversion_cache.lookup(self.tmp, key, base_dir=self.tmp)
+        self.assertEqual([rel for rel, _ in entry['dependencies']], ['user.part1.sieve'])
+
+        # include したスクリプトが変わったら使わない
+        with open(part, 'w', encoding='utf-8') as f:
+            f.write('if false { stop; }\n')
+        self.assertIsNone(conversion_cache.lookup(self.tmp, key, base_dir=self.tmp))
+
+    def test_lru_eviction(self):
+        keys = [conversion_cache.cache_key('to-sieve', str(i)) for i in range(3)]
+        size = None
+        for i, key in enumerate(keys):
+            conversion_cache.store(self.tmp, key, 'x' * 1000, True)
+            path = conversion_cache.cache_path(self.tmp, key)
+            size = os.path.getsize(path)
+            os.utime(path, ns=(i * 10**9, i * 10**9))
+        # 最も古いエントリを使うと、次に古いものが削除される
+        conversion_cache.lookup(self.tmp, keys[0])
+        self.assertEqual(conversion_cache.evict(self.tmp, size * 2), 1)
+        self.assertIsNotNone(conversion_cache.lookup(self.tmp, keys[0]))
+        self.assertIsNone(conversion_cache.lookup(self.tmp, keys[1]))
+        self.assertIsNotNone(conversion_cache.lookup(self.tmp, keys[2]))
+
+        # 上限より大きい結果は保存しない
+        self.assertFalse(conversion_cache.store(self.tmp, keys[1], 'x' * 1000, True, max_bytes=100))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import folder_map
+
+class TestFolderMap(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.mb = os.path.join(self.tmp, '45bee44e.mb')
+        self.cache = os.path.join(self.tmp, 'cache')
+        os.makedirs(self.mb)
+        for name in ['#account#INBOX[1f].ini', '#account#INBOX[1f].&U3BSNw-[3a].ini',
+                     '#account#INBOX[1f].Work[3b].ini', 'IFilter.def']:
+            open(os.path.join(self.mb, name), 'w').close()
+        self.scans = 0
+        self._orig_scan = folder_map._scan
+
+        def counting_scan(work_dir):
+            self.scans += 1
+            return self._orig_scan(work_dir)
+        folder_map._scan = counting_scan
+
+    def tearDown(self):
+        folder_map._scan = self._orig_scan
+        shutil.rmtree(self.tmp)
+
+    def _age_directory(self, seconds=10):
+        # mtime を過去にずらし、キャッシュ作成時刻との差が分解能より大きい状態にする
+        st = os.stat(self.mb)
+        os.utime(self.mb, ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 10**9))
+
+    def test_build_folder_map(self):
+        fmap = folder_map.build_folder_map(self.mb)
+        self.assertEqual(fmap, {
+            'INBOX': '45bee44e.mb\\#account#INBOX[1f].ini',
+            'INBOX.印刷': '45bee44e.mb\\#account#INBOX[1f].&U3BSNw-[3a].ini',
+            'INBOX.Work': '45bee44e.mb\\#account#INBOX[1f].Work[3b].ini',
+        })
+        # 末尾の区切り文字があっても .mb 名を使う
+        self.assertEqual(folder_map.build_folder_map(self.mb + os.sep), fmap)
+        self.assertEqual(folder_map.build_folder_map(os.path.join(self.tmp, 'none.mb')), {})
+
+    def test_listing_cache(self):
+        self._age_directory()
+        expected = folder_map.build_folder_map(self.mb)
+        self.scans = 0
+
+        self.assertEqual(folder_map.build_folder_map(self.mb, cache_dir=self.cache), expected)
+        self.assertEqual(folder_map.build_folder_map(self.mb, cache_dir=self.cache), expected)
+        self.assertEqual(self.scans, 1)
+
+        # フォルダーが追加されるとディレクトリの mtime が変わり、一覧を取り直す
+        open(os.path.join(self.mb, '#account#INBOX[1f].New[3c].ini'), 'w').close()
+        fmap = folder_map.build_folder_map(self.mb, cache_dir=self.cache)
+        self.assertIn('INBOX.New', fmap)
+        self.assertEqual(self.scans, 2)
+
+        # 変更直後 (mtime の分解能内) のキャッシュは信用しない
+        folder_map.build_folder_map(self.mb, cache_dir=self.cache)
+        self.assertEqual(self.scans, 3)
+        self._age_directory()
+        folder_map.build_folder_map(self.mb, cache_dir=self.cache)
+        folder_map.build_folder_map(self.mb, cache_dir=self.cache)
+        self.assertEqual(self.scans, 4)
+
+    def _make_local_folders(self):
+        # ローカルフォルダー (入れ子を含む) と IMAP フォルダーの保存先ディレクトリ
+        for d in ['!!!!Inbox', os.path.join('!!!!Inbox', 'Work'), os.path.join('!!!!Inbox', 'Work', '&MMYwuTDI-'),
+                  '!Trash', '#account#INBOX[1f]']:
+            os.makedirs(os.path.join(self.mb, d))
+        open(os.path.join(self.mb, '!!!!Inbox', 'Folder.ini'), 'w').close()
+
+    def test_nested_folders(self):
+        self._make_local_folders()
+        fmap = folder_map.build_folder_map(self.mb)
+        self.assertEqual(fmap['INBOX.Work.テスト'], '45bee44e.mb\\!!!!Inbox\\Work\\&MMYwuTDI-\\')
+        self.assertEqual(fmap['Trash'], '45bee44e.mb\\!Trash\\')
+        # IMAP の INBOX はディレクトリより .ini を優先し、設定ファイルはフォルダーにしない
+        self.assertEqual(fmap['INBOX'], '45bee44e.mb\\#account#INBOX[1f].ini')
+        self.assertEqual(len(fmap), 5)
+
+        # 逆引きは表記ゆれを吸収する
+        for m in (fmap, folder_map.build_folder_map(self.mb, lazy=True)):
+            self.assertEqual(m.to_logical('45bee44e.mb/!!!!inbox/work/'), 'INBOX.Work')
+            self.assertEqual(m.to_logical('45bee44e.mb\\#account#INBOX[1f].&U3BSNw-[3a].ini'), 'INBOX.印刷')
+            self.assertEqual(m.to_logical('other.mb\\!Trash\\'), 'Trash')
+
+    def test_lazy_reverse_lookup_decodes_once(self):
+        self._make_local_folders()
+        lazy = folder_map.build_folder_map(self.mb, lazy=True)
+        decoded = []
+        original = folder_map.decode_folder_path
+        folder_map.decode_folder_path = lambda p: decoded.append(p) or original(p)
+        try:
+            for _ in range(3):
+                self.assertEqual(lazy.to_logical('45bee44e.mb\\!!!!Inbox\\Work\\'), 'INBOX.Work')
+                self.assertEqual(lazy.to_logical('45bee44e.mb/!!!!inbox/work/'), 'INBOX.Work')
+        finally:
+            folder_map.decode_folder_path = original
+        self.assertEqual(len(decoded), 1)
+
+    def test_trash_uses_mailbox_name(self):
+        from besieve import sieve2becky
+        rules = [{'folder': 'Trash', 'actions': [],
+                  'conditions': [{'header': 'Subject', 'value': 'spam', 'flags': ['I']}]}]
+        other = os.path.join(self.tmp, '12345678.mb')
+        os.makedirs(other)
+        out = sieve2becky.generate_becky_string(rules, folder_map.build_folder_map(other))
+        self.assertIn('!M:12345678.mb\\!Trash\\', out)
+
+    def test_listing_cache_nested(self):
+        self._make_local_folders()
+        for root, dirs, _ in os.walk(self.mb):
+            for d in [root] + [os.path.join(root, d) for d in dirs]:
+                st = os.stat(d)
+                os.utime(d, ns=(st.st_atime_ns, st.st_mtime_ns - 10 * 10**9))
+        folder_map.build_folder_map(self.mb, cache_dir=self.cache)
+        folder_map.build_folder_map(self.mb, cache_dir=self.cache)
+        self.assertEqual(self.scans, 1)
+
+        # 入れ子のフォルダーの追加でも一覧を取り直す
+        os.makedirs(os.path.join(self.mb, '!!!!Inbox', 'Work', 'New'))
+        fmap = folder_map.build_folder_map(self.mb, cache_dir=self.cache)
+        self.assertIn('INBOX.Work.New', fmap)
+        self.assertEqual(self.scans, 2)
+
+    def test_lazy_map(self):
+        lazy = folder_map.build_folder_map(self.mb, lazy=True)
+        self.assertEqual(lazy.get('INBOX.Work'), '45bee44e.mb\\#account#INBOX[1f].Work[3b].ini')
+        # 参照されたフォルダーより後ろは未デコードのまま
+        self.assertTrue(lazy._pending)
+        self.assertIsNone(lazy.get('INBOX.Missing'))
+        self.assertFalse(lazy._pending)
+        self.assertEqual(dict(lazy), folder_map.build_folder_map(self.mb))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+import io
+import os
+import shutil
+import sys
+import tempfile
+import contextlib
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from besieve import managesieve
+from besieve import sync_rules
+from managesieve_server import FakeManageSieveServer
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+class TestManageSieve(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.old_cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.mappings = []
+        for i, src in enumerate(['dummy_IFilter.def', 'dummy_IFilter_complex.def']):
+            mb = os.path.join(self.tmp, f'user{i}.mb')
+            os.makedirs(mb)
+            shutil.copy(os.path.join(DATA_DIR, src), os.path.join(mb, 'IFilter.def'))
+            self.mappings.append({'account': f'user{i}@example.com', 'path': mb})
+        self.server = FakeManageSieveServer({'admin': 'secret'}, admins=['admin']).start()
+
+    def tearDown(self):
+        self.server.stop()
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.tmp)
+
+    def _upload(self, **options):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            failed = sync_rules.upload_to_server(self.mappings, self.server.address, admin='admin',
+                                                 password='secret', starttls=False, **options)
+        return failed, out.getvalue()
+
+    def _convert(self, **options):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(sync_rules.convert_to_sieve(self.mappings, **options), [])
+
+    def _puts(self):
+        return [c for c in self.server.commands if c[1] == 'PUTSCRIPT']
+
+    def test_upload_reuses_connection_and_skips_unchanged(self):
+        self._convert(max_script_size=400)
+        failed, out = self._upload()
+        self.assertEqual(failed, [])
+        self.assertIn('[OK] Uploaded 1 script(s) for user0@example.com', out)
+        # アカウントが変わっても 1 本の接続を UNAUTHENTICATE で使い回す
+        self.assertEqual(self.server.connections, 1)
+        scripts = self.server.scripts['user1@example.com']
+        self.assertGreater(len(scripts), 1)
+        self.assertEqual(self.server.active['user1@example.com'], 'user1@example.com')
+        with open(sync_rules.get_sieve_path('user1@example.com'), 'rb') as f:
+            self.assertEqual(scripts['user1@example.com'], f.read())
+
+        # サーバー上のスクリプトが同じなら送らない
+        puts = len(self._puts())
+        failed, out = self._upload()
+        self.assertEqual(failed, [])
+        self.assertIn('[SKIP] user0@example.com already up to date', out)
+        self.assertEqual(len(self._puts()), puts)
+
+    def test_state_skips_getscript(self):
+        # アップロードした内容のハッシュをステートに記録し、次回はサーバーからスクリプトを取得しない
+        self._convert(max_script_size=400)
+        state = {}
+        failed, out = self._upload(state=state)
+        self.assertEqual(failed, [])
+        record = state['upload:user1@example.com']
+        self.assertEqual(record['user'], 'user1@example.com')
+        names = [name for name, _ in sync_rules.account_scripts('user1@example.com')]
+        self.assertEqual(sorted(record['scripts']), sorted(names))
+
+        getscripts = len([c for c in self.server.commands if c[1] == 'GETSCRIPT'])
+        puts = len(self._puts())
+        failed, out = self._upload(state=state)
+        self.assertIn('[SKIP] user1@example.com already up to date', out)
+        self.assertEqual(len([c for c in self.server.commands if c[1] == 'GETSCRIPT']), getscripts)
+        self.assertEqual(len(self._puts()), puts)
+
+        # 変更したスクリプトと、サーバーから消えたスクリプトは送る
+        with open(sync_rules.get_sieve_path('user0@example.com'), 'a', encoding='utf-8') as f:
+            f.write('# changed\n')
+        del self.server.scripts['user1@example.com']['user1@example.com-1']
+        failed, out = self._upload(state=state)
+        self.assertEqual(failed, [])
+        self.assertIn('[OK] Uploaded 1 script(s) for user0@example.com', out)
+        self.assertIn('[OK] Uploaded 1 script(s) for user1@example.com', out)
+        self.assertIn(b'# changed', self.server.scripts['user0@example.com']['user0@example.com'])
+
+    def test_reconnects_without_unauthenticate(self):
+        self.server.unauthenticate = False
+        self._convert()
+        failed, out = self._upload()
+        self.assertEqual(failed, [])
+        self.assertEqual(self.server.connections, 2)
+
+    def test_checkscript_failure_uploads_nothing(self):
+        self._convert()
+        with open(sync_rules.get_sieve_path('user0@example.com'), 'a', encoding='utf-8') as f:
+            f.write('if header :contains "Subject" {\n')
+        failed, out = self._upload()
+        self.assertEqual(failed, ['user0@example.com'])
+        self.assertIn('[ERROR] Upload failed for user0@example.com: CHECKSCRIPT', out)
+        self.assertNotIn('user0@example.com', self.server.scripts.get('user0@example.com', {}))
+        # NO の応答の後も接続は使える
+        self.assertIn('[OK] Uploaded 1 script(s) for user1@example.com', out)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_authentication_failure(self):
+        self._convert()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            failed = sync_rules.upload_to_server(self.mappings, self.server.address, password='wrong',
+                                                 starttls=False)
+        self.assertEqual(failed, ['user0@example.com', 'user1@example.com'])
+        self.assertIn('AUTHENTICATE failed', out.getvalue())
+
+    def test_literals_and_quoting(self):
+        rfile = io.BytesIO(b'"a \\"b\\"" {4}\r\nx\r\ny ACTIVE\r\nOK (WARNINGS) "fine"\r\n')
+        self.assertEqual(managesieve.read_tokens(rfile), [b'a "b"', b'x\r\ny', 'ACTIVE'])
+        response = managesieve._response(rfile)
+        self.assertEqual((response.status, response.code, response.text), ('OK', 'WARNINGS', 'fine'))
+        self.assertEqual(managesieve.command('PUTSCRIPT', 'a"b', b'x\r\n'),
+                         b'PUTSCRIPT "a\\"b" {3+}\r\nx\r\n\r\n')
+        self.assertEqual(managesieve.parse_server('sieve.example.com'), ('sieve.example.com', 4190))
+
+if __name__ == '__main__':
+    unittest.main()
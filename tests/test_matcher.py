@@ -0,0 +1,67 @@
+import unittest
+import os
+import random
+import sys
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import evaluator
+from besieve import matcher
+
+WORDS = ['alpha', 'beta', 'Gamma', 'デルタ', 'eps', 'ZETA', '[ML:', 'foo*bar', 'a?c', '']
+HEADERS = ['Subject', 'From', 'To', 'X-ML-Name', '[body]', 'Subject, X-ML-Name']
+
+class TestMatcher(unittest.TestCase):
+
+    def test_aho_corasick(self):
+        ac = matcher.AhoCorasick(['he', 'she', 'his', 'hers', '請求', '求書'])
+        self.assertEqual(ac.search('ushers'), {0, 1, 3})
+        self.assertEqual(ac.search('請求書'), {4, 5})
+        self.assertEqual(ac.search('xyz'), set())
+
+    def test_same_result_as_evaluator(self):
+        # ランダムなルールとメッセージで、逐次評価と結果 (順序・stop を含む) が一致すること
+        rng = random.Random(1)
+
+        def make_rule(i):
+            conds = []
+            for _ in range(rng.randint(1, 3)):
+                flags = rng.choice(['I', '', 'IT', 'T', 'IR', 'R'])
+                value = rng.choice(WORDS) + rng.choice(['', 'x', str(rng.randint(0, 9))])
+                if 'R' in flags:
+                    value = rng.choice(['^a', 'b.t', '[0-9]+$', '(?i)GAM'])
+                elif rng.random() < 0.1:
+                    value = '["%s", "%s"]' % (rng.choice(WORDS) or 'q', rng.choice(WORDS) or 'r')
+                conds.append({'header': rng.choice(HEADERS), 'value': value, 'flags': list(flags)})
+            rule = {'folder': f'INBOX.{i}', 'conditions': conds,
+                    'actions': rng.choice([[], ['keep'], ['discard']])}
+            if rng.random() < 0.3:
+                rule['stop'] = False
+            return rule
+
+        def make_message():
+            words = ' '.join(rng.choice(WORDS) + str(rng.randint(0, 9)) for _ in range(4))
+            return (f"From: {rng.choice(WORDS)} <{rng.choice(WORDS)}@Example.com>\n"
+                    f"Subject: {words}\nX-ML-Name: {rng.choice(WORDS)}\n\n{words}\n").encode('utf-8')
+
+        for _ in range(10):
+            rules = [make_rule(i) for i in range(40)]
+            naive = evaluator.Evaluator(rules)
+            compiled = matcher.compile_rules(rules)
+            for _ in range(50):
+                msg = make_message()
+                self.assertEqual(compiled.evaluate(msg), naive.evaluate(msg), msg)
+
+    def test_targets_are_matched_lazily(self):
+        rules = [
+            {'folder': 'A', 'conditions': [{'header': 'Subject', 'value': 'hello', 'flags': ['I']}], 'actions': []},
+            {'folder': 'B', 'conditions': [{'header': '[body]', 'value': 'x', 'flags': ['I']}], 'actions': []},
+        ]
+        view = evaluator.MessageView(b"Subject: Hello\n\nx\n")
+        self.assertEqual(matcher.compile_rules(rules).evaluate(view), [('fileinto', 'A')])
+        # stop で終わったため本文は解析していない
+        self.assertIsNone(view._body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import copy
+import os
+import sys
+import tracemalloc
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import becky2sieve
+from besieve import model
+from besieve import optimizer
+from besieve import sieve2becky
+from besieve import verify
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+class TestModel(unittest.TestCase):
+
+    def test_dict_compatibility(self):
+        cond = model.Condition('Subject', 'alpha', ['I', 'X', 'R'], 'O')
+        self.assertEqual(cond.mask, model.FLAG_BITS['I'] | model.FLAG_BITS['R'])
+        self.assertEqual(cond['flags'], ['I', 'R', 'X'])
+        self.assertTrue(cond.has_flag('R') and cond.has_flag('X') and not cond.has_flag('T'))
+        self.assertEqual(dict(cond), {'header': 'Subject', 'value': 'alpha', 'flags': ['I', 'R', 'X'],
+                                      'operator': 'O'})
+        cond['flags'] = ['T']
+        self.assertEqual(cond.get('flags', ['I']), ['T'])
+        with self.assertRaises(KeyError):
+            cond['folder']
+
+        rule = model.Rule(None, [{'header': 'subject', 'value': 'x'}], ['keep'])
+        self.assertIs(rule['conditions'][0].header, sys.intern('subject'))
+        self.assertEqual(rule['conditions'][0]['flags'], ['I'])
+        self.assertIsNone(rule['folder'])
+        self.assertNotIn('stop', rule)
+        self.assertTrue(rule.get('stop', True))
+        rule['stop'] = False
+        self.assertEqual(dict(rule), {'folder': None, 'conditions': rule.conditions,
+                                      'actions': ['keep'], 'stop': False})
+        self.assertEqual(copy.deepcopy(rule), rule)
+
+    def test_parsers_return_equivalent_rules(self):
+        with open(os.path.join(DATA_DIR, 'dummy_IFilter_complex.def'), encoding='cp932') as f:
+            content = f.read()
+        rules = becky2sieve.parse_becky_content(content)
+        compact = becky2sieve.parse_becky_content(content, compact=True)
+        self.assertIsInstance(compact[0], model.Rule)
+        self.assertEqual(compact, rules)
+        sieve = becky2sieve.rules_to_sieve_string(rules)
+        self.assertEqual(becky2sieve.rules_to_sieve_string(compact), sieve)
+        self.assertEqual(becky2sieve.rules_to_sieve_string(optimizer.optimize_rules(compact)),
+                         becky2sieve.rules_to_sieve_string(optimizer.optimize_rules(rules)))
+
+        reverted = sieve2becky.parse_sieve_content(sieve, compact=True)
+        self.assertEqual(reverted, sieve2becky.parse_sieve_content(sieve))
+        self.assertEqual(verify.compare_rules(compact, reverted), [])
+        self.assertEqual(sieve2becky.generate_becky_string(reverted, {}),
+                         sieve2becky.generate_becky_string(sieve2becky.parse_sieve_content(sieve), {}))
+
+    def test_compact_rules_use_less_memory(self):
+        content = ''.join(f':Begin ""\n!M:INBOX.f{i}\n@0:Subject:key{i}\tO\tI\n@0:From:a{i}@example.com\tO\tIT\n'
+                          ':End ""\n' for i in range(2000))
+        sizes = []
+        for compact in (False, True):
+            tracemalloc.start()
+            try:
+                rules = becky2sieve.parse_becky_content(content, compact=compact)
+                sizes.append(tracemalloc.get_traced_memory()[0])
+            finally:
+                tracemalloc.stop()
+            del rules
+        self.assertLess(sizes[1], sizes[0] * 0.7)
+
+if __name__ == '__main__':
+    unittest.main()
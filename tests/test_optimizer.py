@@ -0,0 +1,92 @@
+import unittest
+import copy
+import os
+import random
+import sys
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import becky2sieve
+from besieve import evaluator
+from besieve import optimizer
+from besieve import sieve2becky
+from besieve import verify
+
+WORDS = ['alpha', 'beta', 'Gamma', 'デルタ', 'a"b', 'x,y', ' pad', '[ML]']
+HEADERS = ['Subject', 'subject', 'From', 'X-ML-Name', '[body]']
+
+def _cond(header, value, flags='I'):
+    return {'header': header, 'value': value, 'flags': list(flags)}
+
+class TestOptimizer(unittest.TestCase):
+
+    def test_merge_keys_and_dedupe(self):
+        rules = [{'folder': 'INBOX.A', 'actions': [], 'conditions': [
+            _cond('Subject', 'alpha'), _cond('subject', 'beta'), _cond('Subject', 'alpha'),
+            _cond('Subject', 'gamma', 'IT'), _cond('Subject', 'a,b'), _cond('From', 'alpha'),
+        ]}]
+        original = copy.deepcopy(rules)
+        result = optimizer.optimize_rules(rules)
+        self.assertEqual(rules, original)
+        self.assertEqual([(c['header'], c['value'], c['flags']) for c in result[0]['conditions']], [
+            ('Subject', '["alpha", "beta"]', ['I']),
+            ('Subject', 'gamma', ['I', 'T']),
+            ('Subject', 'a,b', ['I']),
+            ('From', 'alpha', ['I']),
+        ])
+
+    def test_merge_adjacent_rules_only(self):
+        rules = [
+            {'folder': 'INBOX.A', 'conditions': [_cond('Subject', 'one')], 'actions': []},
+            {'folder': 'INBOX.A', 'conditions': [_cond('Subject', 'two')], 'actions': []},
+            {'folder': 'INBOX.B', 'conditions': [_cond('Subject', 'three')], 'actions': []},
+            {'folder': 'INBOX.A', 'conditions': [_cond('Subject', 'four')], 'actions': []},
+            {'folder': 'INBOX.A', 'conditions': [_cond('Subject', 'five')], 'actions': [], 'stop': False},
+        ]
+        result = optimizer.optimize_rules(rules)
+        self.assertEqual([(r['folder'], r['conditions'][0]['value']) for r in result], [
+            ('INBOX.A', '["one", "two"]'), ('INBOX.B', 'three'), ('INBOX.A', 'four'), ('INBOX.A', 'five')])
+
+    def test_same_routing(self):
+        # ランダムなルールとメッセージで、最適化の前後で結果 (順序・stop を含む) が一致すること
+        rng = random.Random(2)
+
+        def make_rule():
+            conds = [_cond(rng.choice(HEADERS), rng.choice(WORDS), rng.choice(['I', '', 'IT']))
+                     for _ in range(rng.randint(0, 3))]
+            rule = {'folder': rng.choice(['INBOX.A', 'INBOX.B', None]), 'conditions': conds,
+                    'actions': rng.choice([[], ['discard']])}
+            if rng.random() < 0.3:
+                rule['stop'] = False
+            return rule
+
+        def make_message():
+            words = ' '.join(rng.choice(WORDS) for _ in range(3))
+            return (f"From: {rng.choice(WORDS)}@example.com\nSubject: {words}\n"
+                    f"X-ML-Name: {rng.choice(WORDS)}\n\n{words}\n").encode('utf-8')
+
+        reduced = 0
+        for _ in range(20):
+            rules = [make_rule() for _ in range(30)]
+            optimized = optimizer.optimize_rules(rules)
+            reduced += len(rules) - len(optimized)
+            before, after = evaluator.Evaluator(rules), evaluator.Evaluator(optimized)
+            for _ in range(30):
+                msg = make_message()
+                self.assertEqual(after.evaluate(msg), before.evaluate(msg), msg)
+        self.assertGreater(reduced, 0)
+
+    def test_round_trip(self):
+        # まとめたキーリスト (前方一致を含む) が Sieve を経由しても同じ条件に戻ること
+        rules = optimizer.optimize_rules([
+            {'folder': 'INBOX.A', 'actions': [], 'conditions': [
+                _cond('Subject', 'pre'), _cond('Subject', 'fix'),
+                _cond('Subject', 'abc', 'IT'), _cond('Subject', 'C:\\dir', 'IT'), _cond('Subject', 'x', 'T')]},
+        ])
+        sieve = becky2sieve.rules_to_sieve_string(rules)
+        self.assertIn(':matches "Subject" ["abc*", "C:\\\\dir*"]', sieve)
+        self.assertEqual(verify.compare_rules(rules, sieve2becky.parse_sieve_content(sieve)), [])
+
+if __name__ == '__main__':
+    unittest.main()
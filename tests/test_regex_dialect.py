@@ -0,0 +1,136 @@
+import unittest
+import os
+import sys
+import contextlib
+import io
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import analyzer
+from besieve import becky2sieve
+from besieve import evaluator
+from besieve import sieve2becky
+from besieve.regex_dialect import (RegexError, compile_regex, estimate_complexity, from_posix,
+                                   python_pattern, to_posix)
+
+class TestTranslation(unittest.TestCase):
+
+    def test_to_posix(self):
+        cases = {
+            r'^\[list\d+\] .*$': r'^\[list[0-9]+] .*$',
+            r'[\w.-]+@example\.com': r'[._0-9A-Za-z-]+@example\.com',
+            r'(?:foo|bar)+?x': r'(foo|bar)+x',
+            r'a\tb\x41': 'a\tbA',
+            r'\s\S': '[[:space:]][^[:space:]]',
+            r'[\]a\-]': '[]a-]',
+            r'[[:alpha:]]{2,3}': '[A-Za-z]{2,3}',
+            r'foo\/bar{': r'foo/bar\{',
+            r'\bsale\b': '(^|[^_0-9A-Za-z])sale([^_0-9A-Za-z]|$)',
+            r'^\b\d+': '^[0-9]+',
+        }
+        for becky, ere in cases.items():
+            with self.subTest(becky=becky):
+                self.assertEqual(to_posix(becky), ere)
+                # ERE から戻したパターンを再び変換すると同じ ERE になる
+                self.assertEqual(to_posix(from_posix(ere)), ere)
+
+    def test_unsupported(self):
+        for pattern in [r'a\bb', r'\b+', r'(?=x)y', r'(?i)abc', r'(a)\1', r'a++', r'*a', r'[\D]', 'a\\']:
+            with self.subTest(pattern=pattern):
+                with self.assertRaises(RegexError):
+                    to_posix(pattern)
+
+    def test_from_posix(self):
+        self.assertEqual(from_posix('[[:digit:]]+[[:space:]]'), r'[0-9]+[\s]')
+        self.assertEqual(from_posix(r'[]\]'), r'[\]\\]')
+        self.assertEqual(from_posix('a\tb'), r'a\tb')
+        # Python の re で同じ意味になる
+        self.assertEqual(python_pattern('[[:upper:]]x'), '[A-Z]x')
+        self.assertIsNotNone(compile_regex('[[:upper:]]x', False).search('Ax'))
+
+    def test_shared_cache(self):
+        # ローカル照合は同じキャッシュのコンパイル済みパターンを使う
+        self.assertIs(evaluator.compile_regex, compile_regex)
+        self.assertIs(compile_regex(r'\d+', True), compile_regex(r'\d+', True))
+        self.assertIsNone(compile_regex('a(b', False))
+
+    def test_round_trip(self):
+        rules = [
+            {'folder': 'INBOX.List', 'actions': [],
+             'conditions': [{'header': 'Subject', 'value': r'^\[ml:\d+\]\s', 'flags': ['I', 'R']},
+                            {'header': 'From', 'value': r'["a\w+@x", "b\d"]', 'flags': ['R']}]},
+        ]
+        sieve = becky2sieve.rules_to_sieve_string(rules)
+        self.assertIn(r'"^\\[ml:[0-9]+][[:space:]]"', sieve)
+        self.assertIn(r'["a[_0-9A-Za-z]+@x", "b[0-9]"]', sieve)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(becky2sieve.verify_conversion(rules, sieve, None))
+
+        reverted = sieve2becky.parse_sieve_content(sieve)
+        self.assertEqual(reverted[0]['conditions'][0]['value'], r'^\[ml:[0-9]+][\s]')
+
+    def test_untranslatable_condition_is_skipped(self):
+        # ERE にできないパターンの条件は :regex に書き出さずコメントで残し、他のルールの変換は続ける
+        rules = [{'folder': 'INBOX.A', 'actions': [],
+                  'conditions': [{'header': 'Subject', 'value': 'x', 'flags': ['I']}]},
+                 {'folder': 'INBOX.B', 'actions': [],
+                  'conditions': [{'header': 'Subject', 'value': r'(a)\1', 'flags': ['I', 'R']}]},
+                 {'folder': 'INBOX.C', 'actions': [],
+                  'conditions': [{'header': 'Subject', 'value': r'a\bb', 'flags': ['I', 'R']},
+                                 {'header': 'To', 'value': 'y', 'flags': ['I']}]}]
+        script = becky2sieve.rules_to_sieve_string(rules)
+        self.assertIn('# skipped condition: regex on Subject is not valid POSIX ERE: backreference', script)
+        self.assertNotIn('"INBOX.B"', script)
+        self.assertNotIn(':regex', script)
+        self.assertNotIn('"regex"', script)
+        self.assertIn('if address :contains "To" "y" {\n    fileinto "INBOX.C";', script)
+        # 書き出さなかった条件は検証の対象にしない
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(becky2sieve.verify_conversion(rules, script, None))
+
+    def test_fold_is_ascii_only(self):
+        # i;ascii-casemap と同じく、ASCII 以外の文字の大文字と小文字は区別する
+        self.assertIsNotNone(compile_regex('abc', True).search('ABC'))
+        self.assertIsNone(compile_regex('ä', True).search('Ä'))
+        self.assertIsNone(compile_regex('k', True).search('\u212a'))
+
+class TestComplexity(unittest.TestCase):
+
+    def test_estimate(self):
+        cases = {
+            r'^\[list\] .*$': ('linear', False),
+            r'\d+-\d+': ('polynomial', False),
+            r'(a+)+$': ('exponential', True),
+            r'^(\w+\s?)*$': ('exponential', True),
+            r'(a|aa)+b': ('exponential', True),
+            r'(ab+)+': ('polynomial', False),
+            r'.*a.*b.*c': ('polynomial', True),
+        }
+        for pattern, (kind, slow) in cases.items():
+            with self.subTest(pattern=pattern):
+                complexity = estimate_complexity(pattern)
+                self.assertEqual((complexity.kind, complexity.slow), (kind, slow))
+        self.assertEqual(estimate_complexity(r'.*a.*b.*c').order, 'O(n^4)')
+        # Sieve に書き出す ERE と同じ字句から調べる (\b は書き換えた形、ERE にできないものは解析しない)
+        self.assertEqual(estimate_complexity(r'(\bsale\b)+').kind, 'exponential')
+        self.assertEqual(estimate_complexity(r'^\bsale\b$').kind, 'linear')
+        for pattern in [r'(a)\1+', r'(a+', r'a+)']:
+            with self.subTest(pattern=pattern):
+                self.assertIsNone(estimate_complexity(pattern))
+
+    def test_analyzer_findings(self):
+        rules = [
+            {'folder': 'INBOX.A', 'actions': [],
+             'conditions': [{'header': 'Subject', 'value': r'^(\w+\s?)*$', 'flags': ['I', 'R']},
+                            {'header': 'Subject', 'value': r'(sale)\1', 'flags': ['I', 'R']},
+                            {'header': 'Subject', 'value': r'\bsale\b', 'flags': ['I', 'R']}]},
+        ]
+        findings = analyzer.analyze(rules)
+        self.assertEqual([(f.kind, f.condition) for f in findings],
+                         [('slow-regex', 1), ('invalid-regex', 2)])
+        self.assertIn('O(2^n)', analyzer.format_finding(findings[0]))
+        self.assertEqual(analyzer.regex_findings(rules), findings)
+
+if __name__ == '__main__':
+    unittest.main()
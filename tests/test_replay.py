@@ -0,0 +1,125 @@
+import unittest
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import cli
+from besieve import corpus
+from besieve import profiler
+from besieve import replay
+
+RULES = '''require ["fileinto"];
+if header :contains "subject" "invoice" { fileinto "INBOX.Invoice"; stop; }
+if header :contains "x-spam" "YES" { discard; stop; }
+'''
+
+def _mbox_message(subject, body="hello\n>From the body\n"):
+    return (f"From sender@example.com Mon Jan  1 00:00:00 2024\n"
+            f"Subject: {subject}\nX-Spam: NO\n\n{body}\n")
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.mbox = os.path.join(self.tmp, 'mail.mbox')
+        with open(self.mbox, 'w', encoding='utf-8') as f:
+            for i in range(30):
+                f.write(_mbox_message('invoice' if i % 3 == 0 else f'hello {i}'))
+        self.maildir = os.path.join(self.tmp, 'Maildir')
+        for sub in ('cur', 'new', 'tmp'):
+            os.makedirs(os.path.join(self.maildir, sub))
+        for i in range(5):
+            with open(os.path.join(self.maildir, 'new', f'{i}.eml'), 'wb') as f:
+                f.write(b"Subject: spam\r\nX-Spam: YES\r\n\r\nbody\r\n")
+        self.rules = os.path.join(self.tmp, 'rules.sieve')
+        with open(self.rules, 'w', encoding='utf-8') as f:
+            f.write(RULES)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_corpus(self):
+        messages = list(corpus.iter_mbox(self.mbox))
+        self.assertEqual(len(messages), 30)
+        self.assertTrue(messages[0].startswith(b"Subject: invoice\n"))
+        self.assertIn(b"\nFrom the body\n", messages[0])
+        # ヘッダーだけを読む場合は本文を捨てる
+        self.assertEqual(next(corpus.iter_mbox(self.mbox, headers_only=True)),
+                         b"Subject: invoice\nX-Spam: NO\n\n")
+
+        items = list(corpus.iter_corpus([self.maildir]))
+        self.assertEqual([label for label, _ in items], [os.path.join('new', f'{i}.eml') for i in range(5)])
+        self.assertEqual(corpus.read_message(items[0][1], headers_only=True),
+                         b"Subject: spam\r\nX-Spam: YES\r\n\r\n")
+
+    def test_replay_serial_and_parallel(self):
+        rules = replay.load_rules(self.rules)
+        expected = {'INBOX.Invoice': 10, 'INBOX': 20, '(discard)': 5}
+        for jobs in (1, 2):
+            histogram, total = replay.replay(rules, [self.mbox, self.maildir], jobs=jobs, batch_size=4)
+            self.assertEqual(total, 35)
+            self.assertEqual(dict(histogram), expected)
+
+    def test_diff(self):
+        # invoice の振り分け先を変更し、spam の discard をやめる
+        new_path = os.path.join(self.tmp, 'new.sieve')
+        with open(new_path, 'w', encoding='utf-8') as f:
+            f.write(RULES.replace('"INBOX.Invoice"', '"INBOX.Billing"').replace('discard;', 'keep;'))
+        old_rules, new_rules = replay.load_rules(self.rules), replay.load_rules(new_path)
+        for jobs in (1, 2):
+            changes, total = replay.diff(old_rules, new_rules, [self.mbox, self.maildir],
+                                         jobs=jobs, batch_size=4, examples=2)
+            self.assertEqual(total, 35)
+            self.assertEqual(changes, {
+                ('INBOX.Invoice', 'INBOX.Billing'): [10, ['mail.mbox#1', 'mail.mbox#4']],
+                ('(discard)', 'INBOX'): [5, [os.path.join('new', '0.eml'), os.path.join('new', '1.eml')]],
+            })
+        self.assertEqual(replay.format_diff(changes, examples=False)[0].split(),
+                         ['10', 'INBOX.Invoice', '->', 'INBOX.Billing'])
+
+    def test_profile(self):
+        # 3 番目のルールは 1 番目の stop に隠されて一度も実行されない
+        rules = replay.load_rules(self.rules) + [
+            {'folder': 'INBOX.Dup', 'conditions': [{'header': 'Subject', 'value': 'INVOICE', 'flags': ['I']}],
+             'actions': []}]
+        for jobs in (1, 2):
+            stats = profiler.profile(rules, [self.mbox, self.maildir], jobs=jobs, batch_size=4)
+            self.assertEqual(stats['messages'], 35)
+            self.assertEqual(stats['tested'], [35, 25, 20])
+            self.assertEqual(stats['matched'], [10, 5, 0])
+            self.assertEqual(stats['shadowed'], [0, 0, 10])
+        self.assertIn('header:contains', stats['time'])
+
+        result = profiler.report(rules, stats)
+        self.assertEqual([e['dead'] for e in result['rules']], [False, False, True])
+        sieve = profiler.annotate_sieve(rules, stats)
+        self.assertIn("# 1. INBOX.Invoice\n# hits: 10/35 tested\n", sieve)
+        self.assertIn("# 3. INBOX.Dup\n# hits: 0/20 tested, 10 shadowed by an earlier stop (dead)\n", sieve)
+
+    def test_cli(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+            cli.main(['replay', self.rules, self.mbox, '-j', '1'])
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[1].split(), ['20', '66.7%', 'INBOX'])
+        self.assertEqual(lines[2].split(), ['10', '33.3%', 'INBOX.Invoice'])
+
+    def test_cli_reports_invalid_regex(self):
+        # 不正な正規表現の条件は一致しないため、黙って集計せずに警告する
+        with open(self.rules, 'w', encoding='utf-8') as f:
+            f.write('require ["fileinto", "regex"];\n'
+                    'if header :regex "subject" "inv(oice" { fileinto "INBOX.Invoice"; stop; }\n')
+        err = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(err):
+            cli.main(['replay', self.rules, self.mbox, '-j', '1'])
+        self.assertIn(f"[WARN] {self.rules}: rule 1 condition 1 ('inv(oice'): invalid regular expression, never matches",
+                      err.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+import os
+import sys
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import becky2sieve
+from besieve import sieve2becky
+from besieve import sieve_parser
+from besieve.sieve_parser import Command, String, StringList, Tag, SieveSyntaxError
+
+class TestSieveParser(unittest.TestCase):
+
+    def test_ast(self):
+        script = sieve_parser.parse(
+            'require ["fileinto", "regex"];\n'
+            'if header :regex :comparator "i;octet" "Subject" "^\\\\d+$" {\n'
+            '    fileinto :copy "INBOX.Num";\n'
+            '}\n')
+        require, rule = script.commands
+        self.assertEqual(require, Command('require', [StringList(['fileinto', 'regex'], 1, 9)], line=1, col=1))
+        self.assertEqual(rule.name, 'if')
+        test = rule.tests[0]
+        self.assertIsInstance(test, sieve_parser.Test)
+        self.assertEqual(test.name, 'header')
+        self.assertEqual(test.arguments[0], Tag('regex', 2, 11))
+        self.assertEqual(test.tagged()['comparator'].value, 'i;octet')
+        self.assertEqual([a.value for a in test.positional()], ['Subject', '^\\d+$'])
+        self.assertEqual(rule.block[0].positional()[0].value, 'INBOX.Num')
+
+    def test_multiline_string_and_comments(self):
+        script = sieve_parser.parse(
+            '/* bracket\n comment */ # hash comment\n'
+            'vacation :days 7 text:\n'
+            'Hello\n'
+            '..dot-stuffed\n'
+            '.\n'
+            ';\n')
+        cmd = script.commands[0]
+        self.assertEqual(cmd.line, 3)
+        self.assertEqual(cmd.tagged()['days'].value, 7)
+        text = cmd.positional()[0]
+        self.assertIsInstance(text, String)
+        self.assertTrue(text.multiline)
+        self.assertEqual(text.value, 'Hello\n.dot-stuffed\n')
+
+    def test_syntax_errors_have_positions(self):
+        cases = [
+            ('if header :contains "Subject" "x" {\n    keep;\n', 3, 1),
+            ('keep;\nif header :contains "Subject" "x {\n', 2, 31),
+            ('if anyof (header :contains "a" "b",) { keep; }', 1, 36),
+            ('keep\n', 2, 1),
+            ('fileinto @;', 1, 10),
+        ]
+        for text, line, col in cases:
+            with self.assertRaises(SieveSyntaxError) as cm:
+                sieve_parser.parse(text)
+            self.assertEqual((cm.exception.line, cm.exception.col), (line, col), text)
+
+    def test_elsif_chain_is_one_unit(self):
+        # 前の分岐がすべて stop するなら、elsif は同じ意味のルールになる。else は表せない
+        warnings = []
+        rules = sieve2becky.parse_sieve_content('''require ["fileinto"];
+if header :contains "Subject" "A" {
+    fileinto "INBOX.A";
+    stop;
+} elsif header :matches "Subject" "B*" {
+    fileinto "INBOX.B";
+    stop;
+} else {
+    keep;
+}
+''', warnings=warnings)
+        self.assertEqual([r['folder'] for r in rules], ['INBOX.A', 'INBOX.B'])
+        self.assertNotIn('stop', rules[0])
+        self.assertEqual(rules[1]['conditions'][0], {'header': 'Subject', 'value': 'B', 'flags': ['I', 'T']})
+        self.assertEqual(warnings, ['line 8: else skipped: else has no test'])
+
+    def test_elsif_after_branch_without_stop_is_skipped(self):
+        # stop しない分岐の後の elsif は、前の分岐と同時に一致させてはいけない
+        warnings = []
+        rules = sieve2becky.parse_sieve_content('''require ["fileinto"];
+if header :contains "Subject" "A" {
+    fileinto "INBOX.A";
+} elsif header :contains "Subject" "B" {
+    fileinto "INBOX.B";
+    stop;
+}
+if header :contains "Subject" "C" {
+    fileinto "INBOX.C";
+    stop;
+}
+''', warnings=warnings)
+        self.assertEqual([r['folder'] for r in rules], ['INBOX.A', 'INBOX.C'])
+        self.assertIs(rules[0]['stop'], False)
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('line 4: elsif skipped', warnings[0])
+
+    def test_inexpressible_tests_are_skipped(self):
+        # allof / not / exists / :is / 入れ子の if は、より広いルールにせず警告して飛ばす
+        tests = [
+            'allof (header :contains "Subject" "A", address :contains "From" "a@example.com")',
+            'not header :contains "Subject" "A"',
+            'exists "X-Spam"',
+            'header :is "Subject" "A"',
+            'header "Subject" "A"',
+            'address :domain :contains "From" "example.com"',
+            'header :matches "Subject" "A"',
+            'header :matches "Subject" "A\\\\*"',
+            'header :contains :comparator "i;unicode-casemap" "Subject" "A"',
+            'anyof (header :contains "Subject" "A", size :over 100K)',
+        ]
+        for test in tests:
+            warnings = []
+            rules = sieve2becky.parse_sieve_content(
+                f'if {test} {{\n    fileinto "INBOX.A";\n    stop;\n}}\n'
+                'elsif header :contains "Subject" "B" {\n    fileinto "INBOX.B";\n    stop;\n}\n'
+                'if header :contains "Subject" "C" {\n    fileinto "INBOX.C";\n    stop;\n}\n',
+                warnings=warnings)
+            self.assertEqual([r['folder'] for r in rules], ['INBOX.C'], test)
+            self.assertEqual(len(warnings), 2, test)
+            self.assertIn('line 1: if skipped', warnings[0])
+            self.assertIn('line 5: elsif skipped: an earlier branch (line 1) was skipped', warnings[1])
+
+        warnings = []
+        rules = sieve2becky.parse_sieve_content('''if header :contains "Subject" "A" {
+    fileinto "INBOX.A";
+    if header :contains "X-Spam" "yes" {
+        discard;
+    }
+    stop;
+}
+''', warnings=warnings)
+        self.assertEqual(rules, [])
+        self.assertIn("nested 'if' (line 3)", warnings[0])
+
+    def test_expressible_tests(self):
+        rules = sieve2becky.parse_sieve_content('''if allof (anyof (header :matches "Subject" ["*A*", "B*"],
+                      address :all :contains :comparator "i;octet" "From" "x")) {
+    fileinto "INBOX.A";
+    stop;
+}
+''', warnings=[])
+        self.assertEqual(rules[0]['conditions'], [
+            {'header': 'Subject', 'value': '["*A", "B"]', 'flags': ['I', 'T']},
+            {'header': 'From', 'value': 'x', 'flags': []},
+        ])
+
+    def test_backslash_round_trip(self):
+        # 正規表現のエスケープした \ は ERE でも \\ のまま、Sieve の文字列では \\\\ になる
+        becky_rule = ':Begin ""\n!M:TestFolder\n@0:Subject:C:\\\\path\\\\to\tO\tIR\n$O:Sort=1\n:End ""'
+        rules = becky2sieve.parse_becky_content(becky_rule)
+        sieve_code = becky2sieve.rules_to_sieve_string(rules)
+        self.assertIn('"C:\\\\\\\\path\\\\\\\\to"', sieve_code)
+        reverted = sieve2becky.parse_sieve_content(sieve_code)
+        self.assertEqual(reverted[0]['conditions'][0]['value'], 'C:\\\\path\\\\to')
+
+    def test_large_script_is_linear(self):
+        block = 'if header :contains "Subject" "x%d" {\n    fileinto "INBOX.F%d";\n    stop;\n}\n'
+        text = 'require ["fileinto"];\n' + ''.join(block % (i, i) for i in range(10000))
+        rules = sieve2becky.parse_sieve_content(text)
+        self.assertEqual(len(rules), 10000)
+        self.assertEqual(rules[-1]['folder'], 'INBOX.F9999')
+
+if __name__ == '__main__':
+    unittest.main()
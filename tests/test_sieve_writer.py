@@ -0,0 +1,127 @@
+import unittest
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import becky2sieve
+from besieve import sieve2becky
+from besieve import sieve_writer
+from besieve import verify
+
+def _rules(n):
+    rules = []
+    for i in range(n):
+        flags = ['I', 'R'] if i % 7 == 3 else ['I']
+        header = '[body]' if i % 11 == 5 else 'Subject'
+        rules.append({'folder': f'INBOX.フォルダ{i}', 'actions': [],
+                      'conditions': [{'header': header, 'value': f'key {i}', 'flags': flags}]})
+    return rules
+
+class TestSieveWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_stream_matches_string(self):
+        rules = _rules(600)
+        expected = becky2sieve.rules_to_sieve_string(rules)
+        out = io.StringIO()
+        becky2sieve.write_sieve(rules, out)
+        self.assertEqual(out.getvalue(), expected)
+
+        # イテレータも、一時ファイルを経由して同じ内容を書く (seek できない出力先でもよい)
+        class Unseekable(io.StringIO):
+            def seekable(self):
+                return False
+        out = Unseekable()
+        becky2sieve.write_sieve(iter(rules), out)
+        self.assertEqual(out.getvalue(), expected)
+
+    def test_split_respects_limit_and_round_trips(self):
+        rules = _rules(60)
+        path = os.path.join(self.tmp, 'user@example.com.sieve')
+        parts = sieve_writer.write_sieve_files(rules, path, max_bytes=1000)
+        self.assertGreater(len(parts), 1)
+        for part in parts:
+            self.assertLessEqual(os.path.getsize(part), 1000)
+            with open(part, encoding='utf-8') as f:
+                content = f.read()
+            # require はスクリプトごとに、そのスクリプトで使う拡張だけを宣言する
+            self.assertEqual(content.splitlines()[0],
+                             becky2sieve.require_line(becky2sieve.sieve_requires(
+                                 sieve2becky.parse_sieve_content(content))).rstrip('\n'))
+        with open(path, encoding='utf-8') as f:
+            master = f.read()
+        self.assertIn('include :personal "user@example.com-1";', master)
+        self.assertEqual(verify.compare_rules(rules, sieve2becky.parse_sieve(path)), [])
+
+        # 上限に収まるようになったら 1 つのスクリプトに戻し、不要になった分割ファイルを消す
+        self.assertEqual(sieve_writer.write_sieve_files(rules, path, max_bytes=10 ** 6), [])
+        self.assertEqual(os.listdir(self.tmp), ['user@example.com.sieve'])
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), becky2sieve.rules_to_sieve_string(rules))
+
+    def test_oversized_rule(self):
+        rules = [{'folder': 'INBOX.A', 'actions': [],
+                  'conditions': [{'header': 'Subject', 'value': 'x' * 500, 'flags': ['I']}]}]
+        with self.assertRaises(ValueError):
+            sieve_writer.write_sieve_files(rules, os.path.join(self.tmp, 'a.sieve'), max_bytes=200)
+
+    def test_oversized_rule_keeps_previous_scripts(self):
+        # 途中のルールが上限を超えた場合は、前回のスクリプトを 1 つも書き換えない
+        path = os.path.join(self.tmp, 'a.sieve')
+        sieve_writer.write_sieve_files(_rules(60), path, max_bytes=1000)
+        before = {}
+        for name in os.listdir(self.tmp):
+            with open(os.path.join(self.tmp, name), encoding='utf-8') as f:
+                before[name] = f.read()
+        self.assertGreater(len(before), 2)
+
+        rules = _rules(80)
+        rules[70]['conditions'][0]['value'] = 'x' * 1000
+        with self.assertRaises(ValueError):
+            sieve_writer.write_sieve_files(rules, path, max_bytes=1000)
+        after = {}
+        for name in os.listdir(self.tmp):
+            with open(os.path.join(self.tmp, name), encoding='utf-8') as f:
+                after[name] = f.read()
+        self.assertEqual(after, before)
+
+    def test_check_runs_before_replacing(self):
+        # check には一時ファイルに書いた内容を渡し、偽なら前回のスクリプトを残す
+        path = os.path.join(self.tmp, 'a.sieve')
+        sieve_writer.write_sieve_files(_rules(10), path)
+        with open(path, encoding='utf-8') as f:
+            before = f.read()
+        rules = _rules(60)
+        seen = []
+
+        def check(script, include):
+            seen.append(sieve2becky.parse_sieve_content(script, include=include))
+            return False
+        self.assertIsNone(sieve_writer.write_sieve_files(rules, path, max_bytes=1000, check=check))
+        self.assertEqual(verify.compare_rules(rules, seen[0]), [])
+        self.assertEqual(os.listdir(self.tmp), ['a.sieve'])
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), before)
+
+        parts = sieve_writer.write_sieve_files(rules, path, max_bytes=1000, check=lambda script, include: True)
+        self.assertEqual(parts, sieve_writer.part_paths(path))
+        self.assertEqual(verify.compare_rules(rules, sieve2becky.parse_sieve(path)), [])
+
+    def test_include_loop(self):
+        scripts = {'a': 'require ["include"];\ninclude :personal "b";\n',
+                   'b': 'require ["include"];\ninclude :personal "a";\n'}
+        with self.assertRaises(ValueError):
+            sieve2becky.parse_sieve_content(scripts['a'], include=scripts.__getitem__)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,314 @@
+import unittest
+import os
+import sys
+import io
+import shutil
+import tempfile
+import contextlib
+import threading
+import time
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import sync_rules
+from besieve import sync_state
+from besieve import watcher
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+class TestSyncRules(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.old_cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.mappings = []
+        for i, src in enumerate(['dummy_IFilter.def', 'dummy_IFilter_complex.def']):
+            mb = os.path.join(self.tmp, f'user{i}.mb')
+            os.makedirs(mb)
+            shutil.copy(os.path.join(DATA_DIR, src), os.path.join(mb, 'IFilter.def'))
+            self.mappings.append({'account': f'user{i}@example.com', 'path': mb})
+        # IFilter.def が存在しないアカウント
+        self.mappings.append({'account': 'missing@example.com', 'path': os.path.join(self.tmp, 'missing.mb')})
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.tmp)
+
+    def _run(self, jobs, state=None, **options):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+            failed = sync_rules.convert_to_sieve(self.mappings, jobs=jobs, state=state, **options)
+        return failed, out.getvalue()
+
+    def test_parallel_output_matches_serial(self):
+        failed_serial, out_serial = self._run(jobs=1)
+        failed_parallel, out_parallel = self._run(jobs=2)
+        self.assertEqual(failed_serial, [])
+        self.assertEqual(failed_parallel, [])
+        self.assertEqual(out_serial, out_parallel)
+
+        # becky.json の順序で出力される
+        lines = [l for l in out_parallel.splitlines() if l.startswith('[')]
+        self.assertTrue(lines[0].startswith('[PROCESS] user0@example.com'))
+        self.assertTrue(lines[1].startswith('[OK]'))
+        self.assertTrue(lines[2].startswith('[PROCESS] user1@example.com'))
+        self.assertTrue(lines[4].startswith('[SKIP] Becky file not found for missing@example.com'))
+        self.assertTrue(os.path.exists(sync_rules.get_sieve_path('user1@example.com')))
+
+    def test_failures_are_reported(self):
+        # 変換に失敗するアカウント (IFilter.def がディレクトリ)
+        bad = os.path.join(self.tmp, 'bad.mb')
+        os.makedirs(os.path.join(bad, 'IFilter.def'))
+        self.mappings.insert(1, {'account': 'bad@example.com', 'path': bad})
+
+        failed, out = self._run(jobs=2)
+        self.assertEqual(failed, ['bad@example.com'])
+        self.assertIn('[ERROR] Failed to convert bad@example.com', out)
+
+    def test_incremental_state_skips_unchanged(self):
+        state = {}
+        self._run(jobs=1, state=state)
+        self.assertIn('to-sieve:user0@example.com', state)
+        self.assertNotIn('to-sieve:missing@example.com', state)
+
+        # ステートファイル経由で再読み込み
+        state_path = os.path.join(self.tmp, 'state.json')
+        sync_state.save_state(state_path, state)
+        state = sync_state.load_state(state_path)
+
+        sieve_path = sync_rules.get_sieve_path('user0@example.com')
+        written = sync_state.snapshot(sieve_path)
+        failed, out = self._run(jobs=1, state=state)
+        self.assertEqual(failed, [])
+        self.assertIn('[SKIP] user0@example.com unchanged since last run', out)
+        self.assertIn('[SKIP] user1@example.com unchanged since last run', out)
+        self.assertNotIn('[PROCESS]', out)
+        self.assertEqual(sync_state.snapshot(sieve_path), written)
+
+        # mtime だけ変わった場合はハッシュで判定してスキップ
+        source = sync_rules.get_becky_filter_path(self.mappings[0]['path'])
+        st = os.stat(source)
+        os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        failed, out = self._run(jobs=1, state=state)
+        self.assertIn('[SKIP] user0@example.com unchanged since last run', out)
+        self.assertEqual(state['to-sieve:user0@example.com']['source_stat'], sync_state.snapshot(source))
+
+        # 内容が変わったアカウントだけ再変換
+        with open(source, 'ab') as f:
+            f.write(b':Begin ""\n!M:45bee44e.mb\\Extra.ini\n@0:Subject:Extra\tO\tI\n:End ""\n')
+        failed, out = self._run(jobs=2, state=state)
+        self.assertIn('[PROCESS] user0@example.com', out)
+        self.assertIn('[SKIP] user1@example.com unchanged since last run', out)
+        with open(sieve_path, encoding='utf-8') as f:
+            self.assertIn('"Extra"', f.read())
+
+        # 出力が削除された場合も再変換
+        os.remove(sync_rules.get_sieve_path('user1@example.com'))
+        failed, out = self._run(jobs=1, state=state)
+        self.assertIn('[PROCESS] user1@example.com', out)
+
+    def test_converter_version_invalidates_state(self):
+        state = {}
+        self._run(jobs=1, state=state)
+        # パッケージのバージョン文字列で書かれた古いステートは、出力が変わっている可能性があるため再変換する
+        state['to-sieve:user0@example.com']['converter'] = '1.0.0'
+        failed, out = self._run(jobs=1, state=state)
+        self.assertIn('[PROCESS] user0@example.com', out)
+        self.assertNotIn('[PROCESS] user1@example.com', out)
+        self.assertEqual(state['to-sieve:user0@example.com']['converter'], sync_state.CONVERTER_VERSION)
+
+    def test_optimize_setting_invalidates_state(self):
+        state = {}
+        self._run(jobs=1, state=state)
+        # 変換オプションが変わった場合は変換元が同じでも再変換する (ラウンドトリップテストも通る)
+        failed, out = self._run(jobs=1, state=state, optimize=True)
+        self.assertEqual(failed, [])
+        self.assertIn('[PROCESS] user0@example.com', out)
+        self.assertIn('[PROCESS] user1@example.com', out)
+        failed, out = self._run(jobs=1, state=state, optimize=True)
+        self.assertNotIn('[PROCESS]', out)
+
+    def test_split_scripts(self):
+        state = {}
+        failed, out = self._run(jobs=1, state=state, max_script_size=400)
+        self.assertEqual(failed, [])
+        self.assertIn('split into', out)
+        sieve_path = sync_rules.get_sieve_path('user1@example.com')
+        part = os.path.join(os.path.dirname(sieve_path), 'user1@example.com-1.sieve')
+        self.assertTrue(os.path.exists(part))
+        # 記録するハッシュは書き込んだ親スクリプトのもの
+        with open(sieve_path, 'rb') as f:
+            written = sync_state.digest(f.read())
+        self.assertIn(written, [record['output_hash'] for record in state.values()])
+        failed, out = self._run(jobs=1, state=state, max_script_size=400)
+        self.assertNotIn('[PROCESS]', out)
+        # 分割したスクリプトが変更された場合は再変換する
+        with open(part, 'a', encoding='utf-8') as f:
+            f.write('# edited\n')
+        failed, out = self._run(jobs=1, state=state, max_script_size=400)
+        self.assertIn('[PROCESS] user1@example.com', out)
+
+    def test_conversion_cache_reuses_identical_accounts(self):
+        # 同じ IFilter.def とフォルダー構成を持つアカウントは 1 回だけ変換する
+        cache_dir = os.path.join(self.tmp, 'cache')
+        self.mappings = []
+        for dept in ['sales', 'support']:
+            mb = os.path.join(self.tmp, dept, 'template.mb')
+            os.makedirs(mb)
+            shutil.copy(os.path.join(DATA_DIR, 'dummy_IFilter_complex.def'), os.path.join(mb, 'IFilter.def'))
+            self.mappings.append({'account': f'{dept}@example.com', 'path': mb})
+        for jobs in (1, 2):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            failed, out = self._run(jobs=jobs, cache_dir=cache_dir)
+            self.assertEqual(failed, [])
+            self.assertIn('[PROCESS] sales@example.com (Becky -> Sieve)\n', out)
+            self.assertIn('[PROCESS] support@example.com (Becky -> Sieve, cached)\n', out)
+        outputs = []
+        for entry in self.mappings:
+            with open(sync_rules.get_sieve_path(entry['account']), encoding='utf-8') as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+
+        # 次回の実行でも使う。変換オプションが違えば別の結果になる
+        failed, out = self._run(jobs=1, cache_dir=cache_dir)
+        self.assertEqual(out.count('cached)'), 2)
+        failed, out = self._run(jobs=1, cache_dir=cache_dir, optimize=True)
+        self.assertEqual(out.count('cached)'), 1)
+        failed, out = self._run(jobs=1, cache_dir=cache_dir, conversion_cache_size=0)
+        self.assertNotIn('cached)', out)
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(sync_rules.convert_to_becky(self.mappings, skip_verify=True, cache_dir=cache_dir), [])
+        self.assertIn('[PROCESS] support@example.com (Sieve -> Becky, cached)', out.getvalue())
+        targets = [sync_rules.get_becky_filter_path(e['path']) for e in self.mappings]
+        with open(targets[0], 'rb') as a, open(targets[1], 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def _touch_rules(self, path, subject):
+        with open(path, 'ab') as f:
+            f.write(f':Begin ""\n!M:45bee44e.mb\\{subject}.ini\n@0:Subject:{subject}\tO\tI\n:End ""\n'.encode('cp932'))
+
+    def test_to_becky_does_not_rewrite_identical_output(self):
+        self._run(jobs=1)
+        target = sync_rules.get_becky_filter_path(self.mappings[1]['path'])
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(sync_rules.convert_to_becky(self.mappings[:2], skip_verify=True), [])
+        self.assertIn(f'[OK] Wrote {target}', out.getvalue())
+        inode = os.stat(target).st_ino
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(sync_rules.convert_to_becky(self.mappings[:2], skip_verify=True), [])
+        # 同じ内容なら置き換えない (一時ファイルも残らない)
+        self.assertIn(f'[OK] {target} is already up to date', out.getvalue())
+        self.assertEqual(os.stat(target).st_ino, inode)
+        self.assertEqual(os.listdir(self.mappings[1]['path']), ['IFilter.def'])
+
+    def test_to_becky_warns_about_skipped_branches(self):
+        self._run(jobs=1)
+        sieve_path = sync_rules.get_sieve_path('user0@example.com')
+        with open(sieve_path, 'a', encoding='utf-8') as f:
+            f.write('if not header :contains "Subject" "x" {\n    discard;\n    stop;\n}\n')
+        cache_dir = os.path.join(self.tmp, 'cache')
+        for _ in range(2):
+            # 2 回目は変換キャッシュから警告を出す
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+                failed = sync_rules.convert_to_becky(self.mappings[:1], skip_verify=True, cache_dir=cache_dir)
+            self.assertEqual(failed, [])
+            self.assertIn("[WARN] user0@example.com: line ", out.getvalue())
+            self.assertIn("if skipped: test 'not' cannot be expressed in Becky!", out.getvalue())
+
+    def test_watchers_detect_changes(self):
+        source = sync_rules.get_becky_filter_path(self.mappings[0]['path'])
+        factories = [lambda: watcher.PollingWatcher([source], interval=0.01)]
+        try:
+            watcher.InotifyWatcher([source]).close()
+            factories.append(lambda: watcher.InotifyWatcher([source]))
+        except OSError:
+            pass
+        for i, factory in enumerate(factories):
+            w = factory()
+            try:
+                self.assertEqual(w.wait(0.05), set())
+                self._touch_rules(source, f'Changed{i}')
+                self.assertEqual(w.wait(1.0), {os.path.abspath(source)})
+            finally:
+                w.close()
+
+    def test_watcher_missing_directory(self):
+        # 存在しないディレクトリがあっても inotify のまま、ほかのファイルを監視する
+        try:
+            watcher.InotifyWatcher([]).close()
+        except OSError:
+            self.skipTest('inotify is not available')
+        source = sync_rules.get_becky_filter_path(self.mappings[0]['path'])
+        later = os.path.join(self.tmp, 'later.mb', 'IFilter.def')
+        w = watcher.create_watcher([source, later], backend='auto', interval=0.01)
+        try:
+            self.assertEqual(w.name, 'inotify')
+            self.assertEqual(list(w.missing), [os.path.dirname(later)])
+            self._touch_rules(source, 'Changed')
+            self.assertEqual(w.wait(1.0), {os.path.abspath(source)})
+            # ディレクトリが作られたら監視を始め、その前に作られたファイルも変更として返す
+            os.makedirs(os.path.dirname(later))
+            shutil.copy(source, later)
+            self.assertEqual(w.wait(1.0), {later})
+            self.assertEqual(w.missing, {})
+            self._touch_rules(later, 'Again')
+            self.assertEqual(w.wait(1.0), {later})
+        finally:
+            w.close()
+
+    def test_watched_files_include_split_scripts(self):
+        state = {}
+        self._run(jobs=1, state=state, max_script_size=400)
+        entry = self.mappings[1]
+        sieve_path = os.path.abspath(sync_rules.get_sieve_path(entry['account']))
+        files = sync_rules.watched_files('to-becky', entry, state)
+        self.assertEqual(files[0], sieve_path)
+        self.assertIn(os.path.join(os.path.dirname(sieve_path), 'user1@example.com-1.sieve'), files)
+        self.assertEqual(sync_rules.watched_files('to-sieve', entry, state),
+                         [os.path.abspath(sync_rules.get_becky_filter_path(entry['path']))])
+
+    def test_watch_reconverts_only_changed_account(self):
+        state = {}
+        stop = threading.Event()
+        out = io.StringIO()
+
+        def run():
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+                sync_rules.watch_accounts('to-sieve', self.mappings, state=state, backend='poll',
+                                          interval=0.01, debounce=0.05, stop_event=stop)
+
+        t = threading.Thread(target=run)
+        t.start()
+        try:
+            deadline = time.monotonic() + 5
+            while 'Watching' not in out.getvalue() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertIn('Watching 3 file(s)', out.getvalue())
+            start = len(out.getvalue())
+
+            source = sync_rules.get_becky_filter_path(self.mappings[1]['path'])
+            # 連続した書き込みは1回の変換にまとめられる
+            for i in range(3):
+                self._touch_rules(source, f'Burst{i}')
+                time.sleep(0.01)
+            while '[OK]' not in out.getvalue()[start:] and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            stop.set()
+            t.join()
+
+        log = out.getvalue()[start:]
+        self.assertEqual(log.count('[PROCESS] user1@example.com'), 1)
+        self.assertNotIn('user0@example.com', log)
+        with open(sync_rules.get_sieve_path('user1@example.com'), encoding='utf-8') as f:
+            self.assertIn('"Burst2"', f.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import os
+import sys
+
+# Add src directory to path for package import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from besieve import verify
+from besieve import becky2sieve
+
+def _rule(folder, *conds, actions=()):
+    return {'folder': folder, 'actions': list(actions),
+            'conditions': [{'header': h, 'value': v, 'flags': list(f)} for h, v, f in conds]}
+
+class TestVerify(unittest.TestCase):
+
+    def test_canonical_form(self):
+        # 条件の順序・ヘッダーの大文字小文字・リスト形式の値・無関係なフラグは区別しない
+        a = _rule('INBOX.A', ('Subject', '["x", "y"]', 'I'), ('To, Cc', 'z', 'RI'))
+        b = _rule('INBOX.A', ('to,cc', 'z', 'IR'), ('subject', 'y', 'I'), ('SUBJECT', 'x', 'IX'))
+        self.assertEqual(verify.canonical_rule(a), verify.canonical_rule(b))
+        self.assertEqual(verify.compare_rules([a], [b]), [])
+
+    def test_reports_every_mismatch(self):
+        original = [
+            _rule('INBOX.A', ('Subject', 'a', 'I')),
+            _rule('INBOX.B', ('Subject', 'b', 'I')),
+            _rule('INBOX.C', ('Subject', 'c', 'T'), actions=['keep']),
+        ]
+        reverted = [
+            _rule('INBOX.A', ('Subject', 'a', '')),
+            _rule('INBOX.X', ('Subject', 'b', 'I')),
+            _rule('INBOX.C', ('Subject', 'c', 'T')),
+        ]
+        mismatches = verify.compare_rules(original, reverted)
+        self.assertEqual([(m.rule, m.field) for m in mismatches],
+                         [(1, 'conditions'), (2, 'folder'), (3, 'actions')])
+        self.assertEqual(mismatches[0].expected, [('subject', 'a', 'I')])
+        self.assertEqual(mismatches[0].actual, [('subject', 'a', '')])
+
+    def test_action_order_and_duplicates(self):
+        # アクションの順序が変わったり、重複したアクションが失われた場合は不一致にする
+        a = _rule('INBOX.A', ('Subject', 'a', 'I'), actions=['keep', 'discard'])
+        for actions in (['discard', 'keep'], ['keep'], ['keep', 'discard', 'discard']):
+            b = _rule('INBOX.A', ('Subject', 'a', 'I'), actions=actions)
+            self.assertEqual([m.field for m in verify.compare_rules([a], [b])], ['actions'])
+
+    def test_missing_rule_does_not_shift(self):
+        rules = [_rule(f'INBOX.{i}', ('Subject', str(i), 'I')) for i in range(5)]
+        mismatches = verify.compare_rules(rules, rules[:2] + rules[3:])
+        self.assertEqual([(m.rule, m.field) for m in mismatches], [(0, 'count'), (3, 'rule')])
+
+    def test_verify_conversion_detects_lost_flag(self):
+        rules = [_rule('INBOX.A', ('Subject', 'a', 'I'))]
+        sieve = becky2sieve.rules_to_sieve_string(rules)
+        self.assertTrue(becky2sieve.verify_conversion(rules, sieve, None))
+        broken = sieve.replace('header :contains', 'header :contains :comparator "i;octet"')
+        self.assertFalse(becky2sieve.verify_conversion(rules, broken, None))
+
+if __name__ == '__main__':
+    unittest.main()